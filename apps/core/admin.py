@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User
+from .models import Task, User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 # Register your models here.
 
@@ -26,3 +26,9 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_at', 'last_error')
+    list_filter = ('status', 'name')
+    # kwargs can hold emails with password reset links
+    exclude = ('kwargs',)
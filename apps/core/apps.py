@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.core'
+
+    def ready(self):
+        from django.core import checks
+        from apps.core.signals import connect_file_refs
+        from reservio.media import check_media_backend
+        from reservio.metrics import check_metrics_token
+        connect_file_refs()
+        checks.register(check_media_backend, checks.Tags.files, deploy=True)
+        checks.register(check_metrics_token, checks.Tags.security, deploy=True)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.restaurant.models import MenuCategory, Restaurant
+from reservio.benchmark import free_port, gunicorn_args, run_load, run_server, summarize, uvicorn_args
+
+
+class Command(BaseCommand):
+    help = ('Compare the read endpoints served by gunicorn (sync views, WSGI) with the async views '
+            'served by uvicorn (ASGI), with the same number of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--warmup', type=int, default=100)
+
+    def handle(self, *args, **options):
+        category = MenuCategory.objects.select_related('restaurant').first()
+        restaurant = category.restaurant if category else Restaurant.objects.first()
+        if restaurant is None:
+            raise CommandError('No restaurants in the database, run seed data first.')
+        paths = [
+            '/restaurants/',
+            f'/restaurants/{restaurant.id}/',
+            f'/restaurants/{restaurant.id}/reviews/',
+            f'/restaurants/{restaurant.id}/menu-categories/',
+        ]
+        if category:
+            paths.append(f'/categories/{category.id}/menu-items/')
+        async_paths = ['/async' + path for path in paths]
+
+        runs = [
+            ('gunicorn, sync views', gunicorn_args, paths),
+            ('uvicorn, sync views', uvicorn_args, paths),
+            ('uvicorn, async views', uvicorn_args, async_paths),
+        ]
+        self.stdout.write(f"{options['requests']} requests, {options['concurrency']} concurrent, "
+                          f"{options['workers']} workers")
+        for name, server_args, run_paths in runs:
+            port = free_port()
+            with run_server(server_args(port, options['workers']), port):
+                run_load(port, run_paths, options['warmup'], options['concurrency'])
+                result = summarize(*run_load(port, run_paths, options['requests'], options['concurrency']))
+            self.report(name, result)
+
+    def report(self, name, result):
+        if result['p50'] is None:
+            self.stdout.write(f"  {name}: every request failed ({result['errors']} errors)")
+            return
+        self.stdout.write(
+            f"  {name}: {result['rps']:.1f} req/s, p50 {result['p50']:.1f}ms, p99 {result['p99']:.1f}ms"
+            + (f", {result['errors']} errors" if result['errors'] else ''))
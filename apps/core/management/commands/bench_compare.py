@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Compare two bench_http result files and flag endpoints that got slower, or run more queries, '
+            'by more than --threshold percent. Exits with an error when there are regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('baseline')
+        parser.add_argument('current')
+        parser.add_argument('--threshold', type=float, default=10, help='Allowed change in percent.')
+
+    def handle(self, *args, **options):
+        baseline, current = self.load(options['baseline']), self.load(options['current'])
+        threshold = options['threshold']
+        regressions = []
+
+        for server, endpoints in current['results'].items():
+            self.stdout.write(server)
+            for name, result in endpoints.items():
+                base = baseline['results'].get(server, {}).get(name)
+                if base is None:
+                    self.stdout.write(f'  {name}: new')
+                    continue
+                changes = [
+                    # (label, old, new, whether higher is worse)
+                    ('req/s', base['rps'], result['rps'], False),
+                    ('p95', base['p95'], result['p95'], True),
+                    ('p99', base['p99'], result['p99'], True),
+                    ('queries', base.get('queries'), result.get('queries'), True),
+                ]
+                parts, flagged = [], []
+                for label, old, new, higher_is_worse in changes:
+                    if old is None or new is None:
+                        continue
+                    change = (new - old) / old * 100 if old else (100.0 if new else 0.0)
+                    parts.append(f'{label} {old:.1f} -> {new:.1f} ({change:+.1f}%)')
+                    worse = change > threshold if higher_is_worse else change < -threshold
+                    # Query counts hardly vary, half a query more on average is already a regression.
+                    if label == 'queries':
+                        worse = new - old >= 0.5
+                    if worse:
+                        flagged.append(label)
+                if result.get('errors') and not base.get('errors'):
+                    flagged.append('errors')
+                marker = f"  REGRESSION ({', '.join(flagged)})" if flagged else ''
+                self.stdout.write(f"  {name}: {', '.join(parts)}{marker}")
+                if flagged:
+                    regressions.append(f"{server} {name}")
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} regressions beyond {threshold}%: {', '.join(regressions)}")
+        self.stdout.write(f'No regressions beyond {threshold}%')
+
+    def load(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read {path}: {e}')
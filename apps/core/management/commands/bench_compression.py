@@ -0,0 +1,67 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from prometheus_client import REGISTRY
+
+from apps.restaurant.models import MenuCategory
+
+CASES = [
+    ('identity', '', False),
+    ('br live', 'br', False),
+    ('gzip live', 'gzip', False),
+    ('br cached', 'br', True),
+    ('gzip cached', 'gzip', True),
+]
+
+
+def cpu_seconds():
+    return sum(sample.value for metric in REGISTRY.collect() if metric.name == 'reservio_compression_cpu_seconds'
+               for sample in metric.samples if sample.name.endswith('_total'))
+
+
+class Command(BaseCommand):
+    help = ('Compare response size and CPU per request of the anonymous restaurant list and the biggest menu, '
+            'uncompressed, compressed live, and served from the response cache with its precompressed copies.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        category = MenuCategory.objects.annotate(item_count=Count('items')).order_by('-item_count').first()
+        if category is None:
+            raise CommandError('No menus, run seed_scale first.')
+        client = Client(HTTP_HOST='127.0.0.1')
+        for path in [f'/restaurants/?page_size={options["page_size"]}', f'/categories/{category.id}/menu-items/']:
+            self.stdout.write(path)
+            self.identity_size = None
+            for label, encoding, cached in CASES:
+                self.measure(client, path, label, encoding, cached, options['requests'])
+
+    def measure(self, client, path, label, encoding, cached, count):
+        headers = {'Accept-Encoding': encoding} if encoding else {}
+        with override_settings(RESPONSE_CACHE_TIMEOUT=300 if cached else 0):
+            cache.clear()
+            # Fills the cache, compressing once
+            cpu = cpu_seconds()
+            response = client.get(path, headers=headers)
+            fill = cpu_seconds() - cpu
+            if response.status_code != 200:
+                raise CommandError(f'GET {path}: {response.status_code}')
+            cpu = cpu_seconds()
+            started = time.process_time()
+            for _ in range(count):
+                client.get(path, headers=headers)
+            total = (time.process_time() - started) / count
+            compression = (cpu_seconds() - cpu) / count
+        size = len(response.content)
+        self.identity_size = self.identity_size or size
+        line = (f'  {label:>11}: {size / 1024:7.1f}KB ({1 - size / self.identity_size:4.0%} saved), '
+                f'{total * 1000:6.2f}ms CPU/request, of which compressing {compression * 1000:5.2f}ms')
+        if cached:
+            # Both encodings are compressed when the entry is stored
+            line += f', cache fill {fill * 1000:.2f}ms'
+        self.stdout.write(line)
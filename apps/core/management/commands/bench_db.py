@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.core.models import User
+from reservio.authentication import ClaimsAccessToken
+from reservio.benchmark import free_port, get_json, gunicorn_args, run_load, run_server, summarize
+
+MODES = ['off', 'persistent', 'native']
+
+
+class Command(BaseCommand):
+    help = ('Load a DB-backed endpoint under gunicorn once per DATABASE_POOL mode and report throughput, '
+            'latency, connects per request and time spent connecting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=MODES, action='append',
+                            help='Modes to compare (default: all that work with this database).')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--path', default='/cuisines/')
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or [
+            mode for mode in MODES if mode != 'native' or 'postgresql' in settings.DATABASES['default']['ENGINE']]
+        admin, _ = User.objects.get_or_create(
+            username='bench-db-admin',
+            defaults={'email': 'bench-db-admin@example.com', 'is_staff': True, 'role': User.ROLE.ADMIN})
+        headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(admin)}'}
+
+        self.stdout.write(f"GET {options['path']} x {options['requests']}, {options['concurrency']} concurrent, "
+                          f"{options['workers']} workers x {options['threads']} threads")
+        try:
+            for mode in modes:
+                port = free_port()
+                env = {'DATABASE_POOL': mode, 'DATABASE_POOL_MAX_SIZE': str(options['threads'])}
+                with run_server(gunicorn_args(port, options['workers'], threads=options['threads']), port, env=env):
+                    result = summarize(*run_load(port, [options['path']], options['requests'],
+                                                 options['concurrency']))
+                    workers = self.worker_stats(port, headers, options['workers'])
+                self.report(mode, result, workers)
+        finally:
+            admin.delete()
+
+    def worker_stats(self, port, headers, workers):
+        # Each worker process keeps its own counters; ask until every one answered.
+        stats = {}
+        for _ in range(workers * 20):
+            data = get_json(port, '/api/metrics/db/', headers)
+            stats[data['pid']] = data
+            if len(stats) == workers:
+                break
+        return list(stats.values())
+
+    def report(self, mode, result, workers):
+        requests = sum(worker['requests'] for worker in workers) or 1
+        connects = sum(worker['connects'] for worker in workers)
+        connect_ms = sum(worker['connect_ms_total'] for worker in workers)
+        self.stdout.write(
+            f"  {mode}: {result['rps']:.1f} req/s, p50 {result['p50']:.1f}ms, p99 {result['p99']:.1f}ms, "
+            f"{connects / requests:.2f} connects/request, {connect_ms / requests:.2f}ms connecting/request"
+            + (f", {result['errors']} errors" if result['errors'] else ''))
+        for worker in workers:
+            if 'pool' in worker:
+                pool = worker['pool']
+                self.stdout.write(
+                    f"    pid {worker['pid']} pool: {pool.get('pool_size')} connections, "
+                    f"{pool.get('requests_num', 0)} checkouts, {pool.get('requests_wait_ms', 0)}ms waiting, "
+                    f"{pool.get('connections_lost', 0)} lost")
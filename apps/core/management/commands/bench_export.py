@@ -0,0 +1,112 @@
+import io
+import random
+import time
+import tracemalloc
+from datetime import date, time as dt_time, timedelta
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from apps.core.models import User
+from apps.restaurant.models import Customer, Reservation, Restaurant, Table
+from reservio.authentication import ClaimsAccessToken
+
+NAME = 'bench-export'
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Measure the streaming reservation export (CSV and XLSX): time to first byte, rows per second and '
+            'peak Python memory part way and at the end. Adds reservations to a "bench-export" restaurant '
+            'until it has --rows of them; they are kept for the next run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--formats', nargs='+', default=['csv', 'xlsx'], choices=['csv', 'xlsx'])
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        restaurant = self.restaurant(options['rows'], options['batch_size'])
+        admin = User.objects.filter(role=User.ROLE.ADMIN, is_active=True).first()
+        if admin is None:
+            raise CommandError('Needs an active admin user to export as.')
+        self.handler = WSGIHandler()
+        self.authorization = f'Bearer {ClaimsAccessToken.for_user(admin)}'
+        self.stdout.write(f'Exporting {options["rows"]:,} reservations')
+        for file_type in options['formats']:
+            path = f'/restaurants/{restaurant.id}/reservations/export.{file_type}'
+            first_byte, elapsed, size = self.export(path)
+            self.stdout.write(
+                f'{file_type:>5}: first byte {first_byte * 1000:.0f}ms, {elapsed:.1f}s, '
+                f'{options["rows"] / elapsed:,.0f} rows/s, {size / MB:.0f}MB')
+            peaks = self.export(path, memory=True)
+            self.stdout.write('       peak memory ' + ', '.join(
+                f'{peak / MB:.1f}MB after {mb}MB' for mb, peak in peaks))
+
+    def restaurant(self, rows, batch_size):
+        owner, _ = User.objects.get_or_create(
+            username=NAME, defaults={'email': f'{NAME}@example.com', 'role': User.ROLE.RESTAURANT})
+        restaurant, _ = Restaurant.objects.get_or_create(
+            user=owner, defaults={'name': 'Bench Export', 'location': 'Tashkent', 'contact_number': '+998710000000'})
+        table, _ = Table.objects.get_or_create(restaurant=restaurant, number=1, defaults={'capacity': 4})
+        customer_ids = list(Customer.objects.values_list('id', flat=True)[:1000])
+        if not customer_ids:
+            raise CommandError('No customers, run seed_scale first.')
+
+        missing = rows - Reservation.objects.filter(restaurant=restaurant).count()
+        if missing > 0:
+            self.stdout.write(f'Adding {missing:,} reservations to {restaurant.name}')
+        first_day = date(2020, 1, 1)
+        while missing > 0:
+            count = min(batch_size, missing)
+            # bulk_create skips Reservation.save(), which books the table's time slots
+            with transaction.atomic():
+                Reservation.objects.bulk_create(
+                    Reservation(
+                        restaurant=restaurant, table=table, customer_id=random.choice(customer_ids),
+                        date=first_day + timedelta(days=random.randrange(2500)),
+                        start_time=dt_time(random.randrange(9, 22)), end_time=dt_time(22),
+                        num_guests=random.randint(1, 8), status=random.choice(Reservation.STATUS_CHOICES)[0])
+                    for _ in range(count))
+            missing -= count
+        return restaurant
+
+    def export(self, path, memory=False):
+        """Returns (seconds to first byte, seconds, bytes), or (MB so far, peak bytes) pairs with memory."""
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'SERVER_NAME': '127.0.0.1',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': '127.0.0.1',
+            'HTTP_AUTHORIZATION': self.authorization,
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(),
+        }
+        if memory:
+            tracemalloc.start()
+        status = []
+        started = time.perf_counter()
+        response = self.handler(environ, lambda s, h, exc_info=None: status.append(s))
+        first_byte = None
+        size = 0
+        peaks = []
+        try:
+            for chunk in response:
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started
+                size += len(chunk)
+                # Peak so far after 1MB, 10MB, 100MB... of output
+                if memory and size >= MB * 10 ** len(peaks):
+                    peaks.append((10 ** len(peaks), tracemalloc.get_traced_memory()[1]))
+        finally:
+            response.close()
+        elapsed = time.perf_counter() - started
+        if not status[0].startswith('2'):
+            raise CommandError(f'GET {path}: {status[0]}')
+        if memory:
+            peaks.append((size // MB, tracemalloc.get_traced_memory()[1]))
+            tracemalloc.stop()
+            return peaks
+        return first_byte, elapsed, size
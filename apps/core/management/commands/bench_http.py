@@ -0,0 +1,163 @@
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+
+from apps.core.management.commands.seed_scale import PASSWORD, PREFIX
+from apps.restaurant.models import Reservation, Restaurant, Review
+from reservio.authentication import ClaimsAccessToken
+from reservio.benchmark import free_port, gunicorn_args, run_load, run_server, summarize, uvicorn_args
+from reservio.querycount import record_queries
+
+SERVERS = ['client', 'wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every public endpoint against a database filled by seed_scale, in process with the test '
+            'client and/or behind gunicorn (wsgi) and uvicorn (asgi). Reports req/s, p50/p95/p99 and queries '
+            'per request, and can save the results as JSON for bench_compare.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=SERVERS, action='append',
+                            help='Where to run the endpoints (default: client). Can be repeated.')
+        parser.add_argument('--endpoint', action='append', help='Only run these endpoints.')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--max-seconds', type=float, default=10, help='Time limit per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent requests to wsgi/asgi servers.')
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes of the wsgi/asgi servers.')
+        parser.add_argument('--output', help='Save the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        endpoints = self.endpoints()
+        if options['endpoint']:
+            unknown = set(options['endpoint']) - {endpoint['name'] for endpoint in endpoints}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [endpoint for endpoint in endpoints if endpoint['name'] in options['endpoint']]
+
+        results = {}
+        for server in options['server'] or ['client']:
+            self.stdout.write(server)
+            if server == 'client':
+                results[server] = {endpoint['name']: self.run_client(endpoint, options) for endpoint in endpoints}
+                continue
+            port = free_port()
+            args = (gunicorn_args if server == 'wsgi' else uvicorn_args)(port, options['workers'])
+            with run_server(args, port, env={'QUERY_COUNT_HEADERS': 'True'}):
+                results[server] = {endpoint['name']: self.run_server(port, endpoint, options)
+                                   for endpoint in endpoints}
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({'meta': self.meta(options), 'results': results}, file, indent=2)
+            self.stdout.write(f"Saved to {options['output']}")
+
+    def endpoints(self):
+        restaurant = Restaurant.objects.filter(user__username__startswith=PREFIX) \
+            .annotate(reviews_count=Count('reviews')).order_by('-reviews_count').first()
+        if restaurant is None:
+            raise CommandError('No seeded data, run seed_scale first.')
+        review = Review.objects.filter(restaurant=restaurant, review_replies__isnull=False).first() \
+            or Review.objects.filter(restaurant=restaurant).first()
+        category = restaurant.menu.first()
+        reservation = Reservation.objects.filter(restaurant=restaurant).select_related('customer__user').first()
+        customer = reservation.customer.user
+        owner = restaurant.user
+        word = restaurant.name.split()[0]
+
+        def auth(user):
+            return {'HTTP_AUTHORIZATION': f'Bearer {ClaimsAccessToken.for_user(user)}'}
+
+        return [
+            {'name': 'restaurants-list', 'path': '/restaurants/'},
+            {'name': 'restaurants-search', 'path': f'/restaurants/?search={word}'},
+            {'name': 'restaurants-detail', 'path': f'/restaurants/{restaurant.id}/'},
+            {'name': 'cuisines', 'path': '/cuisines/'},
+            {'name': 'reservations', 'path': '/reservations/', 'headers': auth(customer)},
+            {'name': 'reservation-detail', 'path': f'/my-reservations/{reservation.id}/', 'headers': auth(customer)},
+            {'name': 'my-reservations', 'path': '/my-reservations/', 'headers': auth(customer)},
+            {'name': 'restaurant-reservations', 'path': f'/restaurants/{restaurant.id}/reservations/',
+             'headers': auth(owner)},
+            {'name': 'reviews', 'path': f'/restaurants/{restaurant.id}/reviews/'},
+            {'name': 'review-replies', 'path': f'/restaurants/{restaurant.id}/reviews/{review.id}/review_reply/'},
+            {'name': 'menu-categories', 'path': f'/restaurants/{restaurant.id}/menu-categories/'},
+            {'name': 'menu-items', 'path': f'/categories/{category.id}/menu-items/'},
+            {'name': 'tables', 'path': f'/restaurants/{restaurant.id}/tables/'},
+            {'name': 'login', 'method': 'POST', 'path': '/api/auth/login/',
+             'body': json.dumps({'username': customer.username, 'password': PASSWORD})},
+        ]
+
+    def run_client(self, endpoint, options):
+        client = Client(HTTP_HOST='127.0.0.1')
+        method = getattr(client, endpoint.get('method', 'GET').lower())
+        kwargs = {**endpoint.get('headers', {})}
+        if 'body' in endpoint:
+            kwargs.update(data=endpoint['body'], content_type='application/json')
+
+        times, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            request_started = time.perf_counter()
+            with record_queries() as recorder:
+                response = method(endpoint['path'], **kwargs)
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                times.append(time.perf_counter() - request_started)
+                queries.append(recorder.count)
+            if time.perf_counter() - started > options['max_seconds']:
+                break
+        return self.report(endpoint, summarize(times, errors, time.perf_counter() - started), queries)
+
+    def run_server(self, port, endpoint, options):
+        headers = {
+            key[5:].replace('_', '-').title(): value
+            for key, value in endpoint.get('headers', {}).items()
+        }
+        queries = []
+
+        def collect(response):
+            if response.getheader('X-DB-Queries'):
+                queries.append(int(response.getheader('X-DB-Queries')))
+
+        load = dict(headers=headers, method=endpoint.get('method', 'GET'), body=endpoint.get('body'),
+                    max_seconds=options['max_seconds'])
+        run_load(port, [endpoint['path']], options['concurrency'], options['concurrency'], **load)
+        result = summarize(*run_load(port, [endpoint['path']], options['requests'], options['concurrency'],
+                                     collect=collect, **load))
+        return self.report(endpoint, result, queries)
+
+    def report(self, endpoint, result, queries):
+        result['requests'] = len(queries)
+        result['queries'] = sum(queries) / len(queries) if queries else None
+        if result['p50'] is None:
+            self.stdout.write(f"  {endpoint['name']}: every request failed ({result['errors']} errors)")
+            return result
+        self.stdout.write(
+            f"  {endpoint['name']}: {result['rps']:.1f} req/s, p50 {result['p50']:.1f}ms, "
+            f"p95 {result['p95']:.1f}ms, p99 {result['p99']:.1f}ms, "
+            + (f"{result['queries']:.1f} queries" if result['queries'] is not None else 'queries unknown')
+            + (f", {result['errors']} errors" if result['errors'] else ''))
+        return result
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR).stdout.strip()
+        except OSError:
+            commit = ''
+        return {
+            'date': datetime.now(timezone.utc).isoformat(),
+            'commit': commit,
+            'python': platform.python_version(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'restaurants': Restaurant.objects.count(),
+            'reservations': Reservation.objects.count(),
+            **{key: options[key] for key in ['requests', 'max_seconds', 'concurrency', 'workers']},
+        }
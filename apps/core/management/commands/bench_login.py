@@ -0,0 +1,92 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from apps.core.models import User
+from reservio.benchmark import percentile
+
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = ('Run many concurrent logins and report login throughput and latency, and the latency of '
+            'another endpoint (cuisines/) requested at the same time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--session', action='store_true',
+                            help='Also create a session per login (LOGIN_CREATE_SESSION=True).')
+
+    def handle(self, *args, **options):
+        usernames = [f'bench-login-{i}' for i in range(options['users'])]
+        User.objects.filter(username__in=usernames).delete()
+        template = User(username='template')
+        template.set_password(PASSWORD)
+        User.objects.bulk_create([
+            User(username=username, email=f'{username}@example.com', password=template.password,
+                 role=User.ROLE.ADMIN)
+            for username in usernames
+        ])
+        sessions_before = Session.objects.count()
+        try:
+            with override_settings(LOGIN_CREATE_SESSION=options['session']):
+                login_times, probe_times, elapsed = self.run(usernames, options['logins'], options['concurrency'])
+            sessions = Session.objects.count() - sessions_before
+        finally:
+            User.objects.filter(username__in=usernames).delete()
+
+        self.stdout.write(f"{options['logins']} logins, {options['concurrency']} concurrent, "
+                          f"{'with' if options['session'] else 'without'} sessions")
+        self.stdout.write(f'  throughput: {len(login_times) / elapsed:.1f} logins/s')
+        self.report('login', login_times)
+        self.report('cuisines/ during logins', probe_times)
+        self.stdout.write(f'  sessions created: {sessions}')
+
+    def report(self, name, times):
+        if not times:
+            return
+        self.stdout.write(
+            f'  {name}: p50 {statistics.median(times) * 1000:.1f}ms, '
+            f'p99 {percentile(times, 99) * 1000:.1f}ms, max {max(times) * 1000:.1f}ms')
+
+    def run(self, usernames, logins, concurrency):
+        local = threading.local()
+        done = threading.Event()
+        probe_times = []
+
+        def login(i):
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_HOST='127.0.0.1')
+            started = time.perf_counter()
+            response = local.client.post('/api/auth/login/', {'username': usernames[i % len(usernames)],
+                                                              'password': PASSWORD},
+                                         content_type='application/json')
+            if response.status_code != 200:
+                raise RuntimeError(f'login failed: {response.status_code} {response.content[:200]}')
+            return time.perf_counter() - started
+
+        def probe():
+            client = Client(HTTP_HOST='127.0.0.1')
+            while not done.is_set():
+                started = time.perf_counter()
+                client.get('/cuisines/')
+                probe_times.append(time.perf_counter() - started)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(concurrency) as executor:
+                login_times = list(executor.map(login, range(logins)))
+        finally:
+            elapsed = time.perf_counter() - started
+            done.set()
+            prober.join()
+        return login_times, probe_times, elapsed
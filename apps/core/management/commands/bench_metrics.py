@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import resolve
+
+from reservio.metrics import MetricsMiddleware, in_progress
+from reservio.querycount import QueryRecorder
+
+
+class FakeRequest:
+    method = 'GET'
+
+    def __init__(self, path):
+        self.resolver_match = resolve(path)
+        self.query_recorder = QueryRecorder()
+        self.query_recorder.queries = [('default', 'SELECT 1', 0.001)] * 4
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class Command(BaseCommand):
+    help = ('Measure what recording the /metrics samples adds to each request and fail when it is over '
+            '--budget-us. Run with PROMETHEUS_MULTIPROC_DIR set to measure the multiprocess mode used '
+            'under gunicorn.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000)
+        parser.add_argument('--path', default='/cuisines/')
+        parser.add_argument('--budget-us', type=float, default=50)
+
+    def handle(self, *args, **options):
+        mode = 'multiprocess' if 'PROMETHEUS_MULTIPROC_DIR' in os.environ else 'single process'
+        self.stdout.write(f'prometheus_client in {mode} mode')
+
+        # The recording alone: timing whole requests with and without the
+        # middleware drowns these microseconds in noise.
+        middleware = MetricsMiddleware(lambda request: FakeResponse())
+        request, response = FakeRequest(options['path']), FakeResponse()
+        started = time.perf_counter()
+        for _ in range(options['iterations']):
+            in_progress.inc()
+            in_progress.dec()
+            middleware.record(request, response, 0.01)
+        recording = (time.perf_counter() - started) / options['iterations'] * 1e6
+        self.stdout.write(f'  recording: {recording:.1f}us per request')
+
+        if recording > options['budget_us']:
+            raise CommandError(f"Recording takes {recording:.1f}us per request, budget is {options['budget_us']}us")
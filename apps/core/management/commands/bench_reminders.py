@@ -0,0 +1,68 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from apps.restaurant.models import Reservation, ReservationReminder
+from apps.restaurant.reminders import REMINDERS, send_due_reminders
+from reservio.smtpstub import SMTPStub
+
+TARGET_PER_HOUR = 100_000
+
+
+class Command(BaseCommand):
+    help = ('Measure how many reservation reminders send_reminders gets through per hour, sending to a '
+            'local SMTP stub. Uses upcoming reservations without reminders (see seed_scale) and deletes '
+            'the reminders it made afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reminders', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+        parser.add_argument('--smtp-latency-ms', type=float, default=5,
+                            help='Time the stub takes to accept each message.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        reservations = Reservation.objects.filter(date__gt=now.date() + timedelta(days=1), reminders__isnull=True) \
+            .exclude(status=Reservation.REJECTED).values_list('id', flat=True)[:options['reminders'] // len(REMINDERS)]
+        reminders = ReservationReminder.objects.bulk_create(
+            ReservationReminder(reservation_id=reservation_id, kind=kind, due_at=now - timedelta(minutes=1))
+            for reservation_id in reservations for kind, _ in REMINDERS)
+        if not reminders:
+            raise CommandError('No upcoming reservations without reminders, run seed_scale first.')
+        ids = [reminder.id for reminder in reminders]
+        self.stdout.write(f'{len(ids)} due reminders, batches of {options["batch_size"]}, '
+                          f'{options["smtp_latency_ms"]:g}ms per message at the SMTP server')
+        try:
+            for concurrency in options['concurrency']:
+                ReservationReminder.objects.filter(id__in=ids).update(
+                    status=ReservationReminder.PENDING, attempts=0, locked_by='', locked_until=None, sent_at=None)
+                self.run(ids, options['batch_size'], concurrency, options['smtp_latency_ms'] / 1000)
+        finally:
+            ReservationReminder.objects.filter(id__in=ids).delete()
+
+    def run(self, ids, batch_size, concurrency, latency):
+        counts = [0, 0, 0]
+        with SMTPStub(delay=latency) as stub, override_settings(
+                EMAIL_DELIVERY_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+                EMAIL_HOST='127.0.0.1', EMAIL_PORT=stub.port, EMAIL_USE_TLS=False,
+                EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD=''):
+            started = time.perf_counter()
+            while True:
+                result = send_due_reminders('bench', batch_size, concurrency)
+                if not any(result):
+                    break
+                counts = [total + n for total, n in zip(counts, result)]
+            elapsed = time.perf_counter() - started
+            message_ids = {message['Message-ID'] for _, _, message in stub.messages}
+
+        sent, skipped, failed = counts
+        per_hour = sent / elapsed * 3600
+        recorded = ReservationReminder.objects.filter(id__in=ids, status=ReservationReminder.SENT).count()
+        self.stdout.write(
+            f'  {concurrency} threads: {sent} sent, {skipped} skipped, {failed} failed in {elapsed:.1f}s = '
+            f'{per_hour:,.0f}/hour ({per_hour / TARGET_PER_HOUR:.1f}x the {TARGET_PER_HOUR:,}/hour target); '
+            f'{len(stub.messages)} messages received, {len(message_ids)} distinct, {recorded} recorded as sent')
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Value
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from apps.restaurant.fastserializers import MenuItemRowSerializer, ReservationRowSerializer, \
+    RestaurantRowSerializer, ReviewRowSerializer
+from apps.restaurant.models import MenuItem, Payment, Reservation, Restaurant, Review
+from reservio.renderers import MessagePackRenderer, ORJSONRenderer
+
+RENDERERS = [('DRF json', JSONRenderer()), ('orjson', ORJSONRenderer()), ('msgpack', MessagePackRenderer())]
+
+
+class Command(BaseCommand):
+    help = ('Compare render time and payload size of DRF\'s JSONRenderer, ORJSONRenderer and MessagePackRenderer '
+            'on lists of --rows rows from the database (see seed_scale): the list endpoints\' data, and raw '
+            'values() rows with dates, times and decimals left for the renderer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--runs', type=int, default=5, help='Best of this many runs.')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/', HTTP_HOST='127.0.0.1')
+        rows = options['rows']
+        restaurants = Restaurant.objects.annotate(rating=Coalesce(Avg('reviews__rating'), Value(0.0))) \
+            .order_by('-rating', 'id')[:rows]
+        cases = [
+            ('restaurants', self.fast(RestaurantRowSerializer(request), restaurants)),
+            ('reservations', self.fast(ReservationRowSerializer(), Reservation.objects.order_by('id')[:rows])),
+            ('menu items', self.fast(MenuItemRowSerializer(), MenuItem.objects.order_by('id')[:rows])),
+            ('reviews', self.fast(ReviewRowSerializer(request), Review.objects.order_by('-id')[:rows])),
+            ('raw payments', list(Payment.objects.order_by('id').values()[:rows])),
+        ]
+        for name, data in cases:
+            self.stdout.write(f'{name} ({len(data)} rows):')
+            baseline = None
+            for label, renderer in RENDERERS:
+                seconds, content = self.measure(lambda: renderer.render(data), options['runs'])
+                baseline = baseline or seconds
+                self.stdout.write(
+                    f'  {label:>9}: {seconds * 1000:7.1f}ms, {len(content) / 1024:8.1f}KB, '
+                    f'{baseline / seconds:4.1f}x')
+
+    def fast(self, serializer, queryset):
+        return serializer.serialize(serializer.values(queryset))
+
+    def measure(self, func, runs):
+        best = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            content = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, content
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Prefetch, Value
+from django.db.models.functions import Coalesce
+from django.test import RequestFactory
+
+from apps.restaurant.fastserializers import MenuItemRowSerializer, ReservationRowSerializer, \
+    RestaurantRowSerializer, ReviewRowSerializer
+from apps.restaurant.models import MenuItem, Reservation, Restaurant, Review, ReviewReply
+from apps.restaurant.serializers import MenuItemsSerializer, ReservationSerializer, RestaurantSerializer, \
+    ReviewSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compare rows per second of the DRF serializers and the row serializers (FAST_SERIALIZERS) of the '
+            'hot list endpoints, queries included, on the first --rows rows of the database (see seed_scale).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--runs', type=int, default=3, help='Best of this many runs.')
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/', HTTP_HOST='127.0.0.1')
+        rows = options['rows']
+        restaurants = Restaurant.objects.annotate(rating=Coalesce(Avg('reviews__rating'), Value(0.0))) \
+            .order_by('-rating', 'id')[:rows]
+        reservations = Reservation.objects.order_by('id')[:rows]
+        items = MenuItem.objects.order_by('id')[:rows]
+        reviews = Review.objects.order_by('-id')[:rows]
+        cases = [
+            ('restaurants',
+             lambda: RestaurantSerializer(restaurants.prefetch_related('reviews', 'cuisines'), many=True,
+                                          context={'request': request}).data,
+             lambda: self.fast(RestaurantRowSerializer(request), restaurants)),
+            ('reservations',
+             lambda: ReservationSerializer(reservations.select_related('restaurant'), many=True).data,
+             lambda: self.fast(ReservationRowSerializer(), reservations)),
+            ('menu items',
+             lambda: MenuItemsSerializer(items, many=True).data,
+             lambda: self.fast(MenuItemRowSerializer(), items)),
+            ('reviews',
+             lambda: ReviewSerializer(reviews.select_related('customer__user').prefetch_related(
+                 Prefetch('review_replies', queryset=ReviewReply.objects.order_by('id'))), many=True).data,
+             lambda: self.fast(ReviewRowSerializer(request), reviews)),
+        ]
+        for name, drf, fast in cases:
+            drf_seconds, drf_data = self.measure(drf, options['runs'])
+            fast_seconds, fast_data = self.measure(fast, options['runs'])
+            count = len(fast_data)
+            same = 'same output' if [dict(row) for row in drf_data] == fast_data else 'OUTPUT DIFFERS'
+            self.stdout.write(
+                f'{name:>12}: {count} rows, DRF {count / drf_seconds:>9,.0f} rows/s, '
+                f'fast {count / fast_seconds:>9,.0f} rows/s, {drf_seconds / fast_seconds:4.1f}x, {same}')
+
+    def fast(self, serializer, queryset):
+        return serializer.serialize(serializer.values(queryset))
+
+    def measure(self, func, runs):
+        best = None
+        for _ in range(runs):
+            started = time.perf_counter()
+            data = func()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, data
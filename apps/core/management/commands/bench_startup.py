@@ -0,0 +1,95 @@
+import http.client
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from reservio.benchmark import free_port, gunicorn_args, run_load, run_server
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+\d+ \|\s*(\S+)')
+
+CONFIGS = [
+    ('no preload, no warmup', {'GUNICORN_PRELOAD': '0', 'WARMUP': 'False'}),
+    ('no preload, warmup', {'GUNICORN_PRELOAD': '0', 'WARMUP': 'True'}),
+    ('preload, warmup', {'GUNICORN_PRELOAD': '1', 'WARMUP': 'True'}),
+]
+
+
+def first_response(port, path, timeout=60):
+    """Polls ``path`` until it answers 200; returns how long that request took."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers={'Host': f'127.0.0.1:{port}'})
+            response = connection.getresponse()
+            response.read()
+            if response.status == 200:
+                return time.perf_counter() - started
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.05)
+    raise RuntimeError(f'GET {path} did not answer 200 within {timeout}s')
+
+
+class Command(BaseCommand):
+    help = ('Measure how long gunicorn takes from start to its first response, with and without '
+            'preload_app and warm-up (see gunicorn.conf.py and reservio.warmup).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--path', default='/restaurants/')
+        parser.add_argument('--imports', type=int, default=10,
+                            help='Show the packages that take longest to import, 0 to skip.')
+
+    def handle(self, *args, **options):
+        if options['imports']:
+            self.report_imports(options['imports'])
+
+        self.stdout.write(f"Start to first response of GET {options['path']}, {options['workers']} workers, "
+                          f"median of {options['runs']} runs")
+        for name, env in CONFIGS:
+            boots, firsts, bursts = [], [], []
+            for _ in range(options['runs']):
+                boot, first, burst = self.measure(env, options)
+                boots.append(boot)
+                firsts.append(first)
+                bursts.append(burst)
+            self.stdout.write(
+                f'  {name}: first response after {statistics.median(boots) * 1000:.0f}ms '
+                f'(that request {statistics.median(firsts) * 1000:.0f}ms), '
+                f'slowest of the next {options["workers"] * 4} requests {statistics.median(bursts) * 1000:.0f}ms')
+
+    def measure(self, env, options):
+        port = free_port()
+        started = time.perf_counter()
+        with run_server(gunicorn_args(port, options['workers']), port, env=env):
+            first = first_response(port, options['path'])
+            boot = time.perf_counter() - started
+            # One request per worker and then some: workers that have not
+            # served yet show up as the slowest of these.
+            times, _, _ = run_load(port, [options['path']], options['workers'] * 4, options['workers'])
+        return boot, first, max(times, default=0)
+
+    def report_imports(self, top):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import reservio.wsgi'],
+            env={**os.environ, 'WARMUP': 'False'}, capture_output=True, text=True)
+        by_package = Counter()
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_RE.match(line)
+            if match:
+                by_package[match[2].split('.')[0]] += int(match[1])
+        total = sum(by_package.values())
+        self.stdout.write(f'Importing the application takes {total / 1000:.0f}ms, by package:')
+        for package, micros in by_package.most_common(top):
+            self.stdout.write(f'  {package}: {micros / 1000:.0f}ms')
@@ -0,0 +1,127 @@
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from apps.core.models import ChunkedUpload, User
+from reservio.authentication import ClaimsAccessToken
+
+BOUNDARY = 'ReservioBenchBoundary'
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = ('Measure peak Python memory of concurrent photo uploads, buffered in memory '
+            '(the old 10MB setting) vs. spooled to disk vs. resumable chunked uploads.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--size-mb', type=int, default=8)
+        parser.add_argument('--chunk-mb', type=int, default=1)
+
+    def handle(self, *args, **options):
+        admin = User.objects.filter(role=User.ROLE.ADMIN, is_active=True).first()
+        if admin is None:
+            raise CommandError('Needs an active admin user to upload as.')
+        self.handler = WSGIHandler()
+        self.authorization = f'Bearer {ClaimsAccessToken.for_user(admin)}'
+        size = options['size_mb'] * MB
+        # Every upload of the three runs stays open until the end
+        pending = override_settings(CHUNKED_UPLOAD_MAX_PENDING=3 * options['concurrency'])
+        with tempfile.TemporaryDirectory() as tmp_dir, pending:
+            raw_path = os.path.join(tmp_dir, 'photo.bin')
+            multipart_path = os.path.join(tmp_dir, 'multipart.bin')
+            self.write_files(raw_path, multipart_path, size)
+
+            results = {}
+            with override_settings(
+                FILE_UPLOAD_HANDLERS=[
+                    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+                    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+                ],
+                FILE_UPLOAD_MAX_MEMORY_SIZE=10485760,
+            ):
+                results['buffered'] = self.measure(options['concurrency'], self.multipart_upload, multipart_path)
+            results['streaming'] = self.measure(options['concurrency'], self.multipart_upload, multipart_path)
+            results['chunked'] = self.measure(
+                options['concurrency'], self.chunked_upload, raw_path, size, options['chunk_mb'] * MB)
+
+        ChunkedUpload.objects.filter(filename='photo.bin').delete()
+        self.stdout.write(f"{options['concurrency']} concurrent uploads of {options['size_mb']}MB")
+        for mode, (peak, elapsed) in results.items():
+            self.stdout.write(
+                f'{mode:>10}: peak {peak / MB:8.2f}MB total, '
+                f'{peak / MB / options["concurrency"]:6.2f}MB per upload, {elapsed:6.2f}s')
+
+    def write_files(self, raw_path, multipart_path, size):
+        with open(raw_path, 'wb') as raw:
+            for _ in range(size // MB):
+                raw.write(os.urandom(MB))
+            raw.write(os.urandom(size % MB))
+        with open(multipart_path, 'wb') as multipart, open(raw_path, 'rb') as raw:
+            multipart.write(
+                f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="photo.bin"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+            for chunk in iter(lambda: raw.read(MB), b''):
+                multipart.write(chunk)
+            multipart.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+
+    def measure(self, concurrency, upload, *args):
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            for result in [executor.submit(upload, *args) for _ in range(concurrency)]:
+                result.result()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak, elapsed
+
+    def request(self, method, path, body, content_type, length, headers=None):
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'SERVER_NAME': '127.0.0.1',
+            'SERVER_PORT': '80',
+            'HTTP_HOST': '127.0.0.1',
+            'HTTP_AUTHORIZATION': self.authorization,
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': body,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(length),
+            **(headers or {}),
+        }
+        status = []
+        response = self.handler(environ, lambda s, h, exc_info=None: status.append(s))
+        try:
+            content = b''.join(response)
+        finally:
+            response.close()
+        if not status[0].startswith('2'):
+            raise RuntimeError(f'{method} {path}: {status[0]} {content[:200]}')
+        return json.loads(content)
+
+    def multipart_upload(self, path):
+        with open(path, 'rb') as body:
+            self.request('POST', '/api/uploads/', body,
+                         f'multipart/form-data; boundary={BOUNDARY}', os.path.getsize(path))
+
+    def chunked_upload(self, path, size, chunk_size):
+        created = json.dumps({'filename': 'photo.bin', 'size': size}).encode()
+        with tempfile.TemporaryFile() as body:
+            body.write(created)
+            body.seek(0)
+            upload = self.request('POST', '/api/uploads/', body, 'application/json', len(created))
+        with open(path, 'rb') as body:
+            for start in range(0, size, chunk_size):
+                end = min(start + chunk_size, size) - 1
+                body.seek(start)
+                self.request('PUT', f'/api/uploads/{upload["id"]}/', body, 'application/octet-stream',
+                             end - start + 1, {'HTTP_CONTENT_RANGE': f'bytes {start}-{end}/{size}'})
@@ -0,0 +1,69 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.core.models import StoredFile, ChunkedUpload
+from apps.core.signals import stored_file_fields
+
+
+class Command(BaseCommand):
+    help = 'Delete content-addressed media blobs that are no longer referenced and stale chunked uploads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=int, default=24,
+                            help='Keep unreferenced blobs seen within this many hours.')
+        parser.add_argument('--recount', action='store_true',
+                            help='Recompute reference counts from the database first.')
+        parser.add_argument('--upload-hours', type=int, default=24,
+                            help='Delete chunked uploads older than this many hours.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.recount()
+
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        orphans = StoredFile.objects.filter(ref_count__lte=0, last_seen__lt=cutoff)
+        deleted = 0
+        freed = 0
+        for stored in orphans.iterator():
+            if options['dry_run']:
+                self.stdout.write(stored.name)
+            else:
+                with transaction.atomic():
+                    # Re-check under lock: an upload may have reused the blob.
+                    stored = StoredFile.objects.select_for_update().filter(
+                        pk=stored.pk, ref_count__lte=0, last_seen__lt=cutoff).first()
+                    if stored is None:
+                        continue
+                    default_storage.purge(stored.name)
+                    stored.delete()
+            deleted += 1
+            freed += stored.size
+        self.stdout.write(f'{deleted} blobs, {freed} bytes {"would be " if options["dry_run"] else ""}freed')
+
+        uploads = ChunkedUpload.objects.filter(
+            created_at__lt=timezone.now() - timedelta(hours=options['upload_hours']))
+        count = 0
+        for upload in uploads.iterator():
+            if not options['dry_run']:
+                upload.delete()
+            count += 1
+        self.stdout.write(f'{count} stale uploads {"would be " if options["dry_run"] else ""}deleted')
+
+    def recount(self):
+        counts = Counter()
+        for model in apps.get_models():
+            for field in stored_file_fields(model):
+                names = model._base_manager.exclude(**{field.attname: ''}).values_list(field.attname, flat=True)
+                counts.update(name for name in names.iterator() if name)
+
+        with transaction.atomic():
+            for stored in StoredFile.objects.select_for_update().only('pk', 'name', 'ref_count'):
+                if stored.ref_count != counts[stored.name]:
+                    StoredFile.objects.filter(pk=stored.pk).update(ref_count=counts[stored.name])
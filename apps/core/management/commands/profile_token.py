@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reservio.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a token that makes ProfilingMiddleware profile requests sent with an X-Profile header.'
+
+    def handle(self, *args, **options):
+        if not settings.PROFILE_HEADER_ENABLED:
+            self.stderr.write('PROFILE_HEADER_ENABLED is off, the server will ignore the header.')
+        self.stdout.write(make_token())
+        self.stderr.write(f'Valid for {settings.PROFILE_TOKEN_MAX_AGE} seconds.')
@@ -0,0 +1,49 @@
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.module_loading import autodiscover_modules
+
+from reservio.tasks import claim, release_stale, run
+
+
+class Command(BaseCommand):
+    help = 'Run background tasks (see reservio.tasks) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run the tasks that are due, and those they add, then exit.')
+        parser.add_argument('--claim-size', type=int, default=settings.TASK_CLAIM_SIZE,
+                            help='Tasks taken from the queue at a time.')
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_POLL_INTERVAL,
+                            help='Seconds to wait when no task is due.')
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            close_old_connections()
+            release_stale()
+            tasks = claim(worker, options['claim_size'])
+            if tasks:
+                started = time.perf_counter()
+                done, failed = run(tasks)
+                if options['verbosity'] > 1 or failed:
+                    self.stdout.write(f'{done} done, {failed} failed in {(time.perf_counter() - started) * 1000:.0f}ms')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+
+    def stop(self, signum, frame):
+        # Finish the tasks at hand, then exit
+        self.stopping = True
@@ -0,0 +1,431 @@
+import itertools
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, time as dt_time, timedelta
+from decimal import Decimal
+from multiprocessing import get_context
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from apps.core.models import User
+from apps.restaurant import stats
+from apps.restaurant.models import (
+    Cuisine, Customer, MenuCategory, MenuItem, Payment, PaymentStatus, Reservation, Restaurant, Review, ReviewReply,
+    Table,
+)
+from apps.restaurant.reminders import backfill_reminders
+
+PREFIX = 'seed-'
+PASSWORD = 'seed-password'
+
+CUISINES = [
+    'Uzbek', 'Italian', 'Turkish', 'Japanese', 'Chinese', 'Korean', 'Georgian', 'Indian', 'French', 'Mexican',
+    'Lebanese', 'Thai', 'Russian', 'American', 'Spanish', 'Greek', 'Vietnamese', 'Persian', 'Arabic', 'Kazakh',
+    'Seafood', 'Steakhouse', 'Vegetarian', 'Fast food', 'Bakery', 'Coffee', 'Pizza', 'Sushi', 'Barbecue', 'Desserts',
+]
+NAME_WORDS = ['Silk', 'Road', 'Golden', 'Plov', 'Garden', 'Navruz', 'Oasis', 'Samarkand', 'Bukhara', 'Chinar',
+              'Lagman', 'Tandir', 'Anor', 'Bahor', 'Caravan', 'Registan', 'Olive', 'Saffron', 'Ember', 'Lotus']
+NAME_KINDS = ['Restaurant', 'Cafe', 'Kitchen', 'House', 'Grill', 'Bistro', 'Lounge', 'Chaikhana']
+DISTRICTS = ['Yunusabad', 'Mirzo Ulugbek', 'Chilanzar', 'Yakkasaray', 'Mirabad', 'Shaykhantahur', 'Almazar',
+             'Sergeli', 'Uchtepa', 'Yashnabad', 'Bektemir']
+FIRST_NAMES = ['Aziz', 'Dilnoza', 'Jasur', 'Madina', 'Timur', 'Nilufar', 'Bekzod', 'Kamola', 'Sardor', 'Malika',
+               'Otabek', 'Zarina', 'Rustam', 'Gulnora', 'Anvar', 'Shahnoza', 'Farrukh', 'Sevara', 'Akmal', 'Lola']
+LAST_NAMES = ['Karimov', 'Rashidova', 'Yusupov', 'Tursunova', 'Aliyev', 'Nazarova', 'Ismoilov', 'Saidova',
+              'Mirzaev', 'Qodirova', 'Ergashev', 'Abdullaeva', 'Xolmatov', 'Sobirova']
+MENU_CATEGORIES = ['Starters', 'Salads', 'Soups', 'Main courses', 'Grill', 'Desserts', 'Drinks', 'Bakery']
+SPECIAL_REQUESTS = ['Window seat, please', 'Birthday celebration', 'High chair for a child', 'Quiet table',
+                    'Vegetarian guest', 'Nut allergy']
+REVIEW_COMMENTS = {
+    1: ['Very disappointing.', 'Cold food and slow service.'],
+    2: ['Not great, would not come back.', 'Too noisy and overpriced.'],
+    3: ['Decent, nothing special.', 'Food was fine, service was slow.'],
+    4: ['Good food and friendly staff.', 'Nice place, will come back.'],
+    5: ['Excellent, the best plov in town!', 'Perfect evening, highly recommended.'],
+}
+REPLIES = ['Thank you for your feedback!', 'We are glad you enjoyed it.', 'Sorry to hear that, we will do better.']
+
+TABLE_CAPACITIES = [2, 2, 2, 4, 4, 4, 4, 6, 6, 8]
+PARTY_SIZES = [1, 2, 3, 4, 5, 6, 7, 8]
+PARTY_WEIGHTS = [8, 40, 14, 20, 6, 7, 2, 3]
+DURATIONS = [2, 3, 4]  # in half hours
+DURATION_WEIGHTS = [3, 4, 3]
+PAYMENT_METHODS = ['card', 'cash', 'payme', 'click']
+PAYMENT_METHOD_WEIGHTS = [45, 20, 20, 15]
+
+
+def rng_for(seed, *parts):
+    """An independent random generator per piece of work, so results don't depend on the number of workers."""
+    return random.Random(':'.join(map(str, (seed,) + parts)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def allocate(total, weights):
+    """Split ``total`` proportionally to ``weights`` into whole numbers that add up to ``total``."""
+    weight_sum = sum(weights)
+    shares = [total * weight / weight_sum for weight in weights]
+    counts = [int(share) for share in shares]
+    remainders = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in remainders[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def half_hour(units):
+    return dt_time(units // 2 % 24, units % 2 * 30)
+
+
+def start_weights(opening, closing):
+    """Start times in half hours, peaking at lunch (13:00) and dinner (19:30)."""
+    units = list(range(opening * 2, closing * 2 - 2))
+    weights = [1 + 4 * math.exp(-((unit - 26) / 2.5) ** 2) + 7 * math.exp(-((unit - 39) / 3) ** 2) for unit in units]
+    return units, weights
+
+
+# Set in each worker process by init_worker
+worker_state = {}
+
+
+def init_worker(options, customer_ids, days):
+    django.setup()
+    set_worker_state(options, customer_ids, days)
+
+
+def set_worker_state(options, customer_ids, days):
+    rng = rng_for(options['seed'], 'customers')
+    # A few regulars make most of the bookings.
+    weights = [rng.paretovariate(1.2) for _ in customer_ids]
+    day_weights = [1.6 if day.weekday() in (4, 5) else 1.3 if day.weekday() == 6 else 1 for day in days]
+    worker_state.update(
+        options=options, customer_ids=customer_ids, customer_weights=list(itertools.accumulate(weights)),
+        days=days, day_weights=list(itertools.accumulate(day_weights)))
+
+
+def seed_restaurant_reservations(task):
+    """Create the reservations, payments and payment statuses of one restaurant."""
+    index, restaurant_id, opening, closing, tables, count = task
+    state = worker_state
+    options = state['options']
+    rng = rng_for(options['seed'], 'reservations', index)
+    today = options['today']
+    units, unit_weights = start_weights(opening, closing)
+    unit_weights = list(itertools.accumulate(unit_weights))
+    tables = sorted(tables, key=lambda table: table[1])
+    booked = {}  # (day, table id) -> bitmask of booked half hours
+
+    reservations = []
+    for _ in range(count):
+        guests = rng.choices(PARTY_SIZES, PARTY_WEIGHTS)[0]
+        fitting = [table for table in tables if table[1] >= guests] or tables[-1:]
+        for _attempt in range(8):
+            day = rng.choices(state['days'], cum_weights=state['day_weights'])[0]
+            # Mostly the smallest table that fits the party.
+            table_id, capacity = fitting[min(len(fitting) - 1, int(rng.expovariate(1.5)))]
+            start = rng.choices(units, cum_weights=unit_weights)[0]
+            length = min(rng.choices(DURATIONS, DURATION_WEIGHTS)[0], closing * 2 - start)
+            mask = ((1 << length) - 1) << start
+            if booked.get((day, table_id), 0) & mask:
+                continue
+            booked[(day, table_id)] = booked.get((day, table_id), 0) | mask
+            if day < today:
+                status = rng.choices([Reservation.ACCEPTED, Reservation.REJECTED, Reservation.WAITING], [78, 12, 10])[0]
+            else:
+                status = rng.choices([Reservation.ACCEPTED, Reservation.REJECTED, Reservation.WAITING], [35, 5, 60])[0]
+            reservations.append(Reservation(
+                restaurant_id=restaurant_id, table_id=table_id, date=day,
+                customer_id=rng.choices(state['customer_ids'], cum_weights=state['customer_weights'])[0],
+                start_time=half_hour(start), end_time=half_hour(start + length),
+                num_guests=min(guests, capacity),
+                special_requests=rng.choice(SPECIAL_REQUESTS) if rng.random() < 0.1 else None,
+                status=status,
+            ))
+            break
+
+    created = payments = 0
+    for batch in batched(reservations, options['batch_size']):
+        with transaction.atomic():
+            # bulk_create skips Reservation.save(): the slots above never overlap,
+            # and Table.time_slots is left empty.
+            Reservation.objects.bulk_create(batch)
+            paid = [reservation for reservation in batch
+                    if reservation.status == Reservation.ACCEPTED and reservation.date < today
+                    and rng.random() < options['payment_rate']]
+            Payment.objects.bulk_create([
+                Payment(
+                    customer_id=reservation.customer_id, restaurant_id=restaurant_id, reservation=reservation,
+                    amount=Decimal(str(round(reservation.num_guests * rng.lognormvariate(math.log(25), 0.4), 2))),
+                    payment_method=rng.choices(PAYMENT_METHODS, PAYMENT_METHOD_WEIGHTS)[0],
+                    transaction_id=f"{PREFIX}{options['seed']}-{reservation.pk}",
+                )
+                for reservation in paid
+            ])
+            PaymentStatus.objects.bulk_create([
+                PaymentStatus(reservation=reservation,
+                              status=rng.choices([PaymentStatus.COMPLETE, PaymentStatus.FAILED], [95, 5])[0])
+                for reservation in paid
+            ])
+        created += len(batch)
+        payments += len(paid)
+    return created, payments
+
+
+def seed_in_worker(task):
+    try:
+        return seed_restaurant_reservations(task)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a large, realistic, reproducible dataset: users, restaurants, cuisines, '
+            'tables, menus, reservations over several months, reviews with replies and payments.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--customers', type=int, default=10000)
+        parser.add_argument('--restaurants', type=int, default=500)
+        parser.add_argument('--cuisines', type=int, default=20)
+        parser.add_argument('--tables', type=int, default=12, help='Average tables per restaurant.')
+        parser.add_argument('--reservations', type=int, default=100000)
+        parser.add_argument('--months', type=int, default=12, help='Months of history before --today.')
+        parser.add_argument('--today', type=date.fromisoformat, default=date.today(),
+                            help='Reservations go up to a month after this date (default: today). '
+                                 'Same seed and same date give the same data.')
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--reply-rate', type=float, default=0.3)
+        parser.add_argument('--payment-rate', type=float, default=0.6,
+                            help='Share of past accepted reservations that have a payment.')
+        parser.add_argument('--menu-items', type=int, default=30, help='Average menu items per restaurant.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--workers', type=int,
+                            help='Processes creating reservations (default: CPU count, 1 on SQLite, '
+                                 'which allows only one writer at a time).')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data first.')
+
+    def handle(self, *args, **options):
+        if options['workers'] is None:
+            sqlite = settings.DATABASES['default']['ENGINE'].endswith('sqlite3')
+            options['workers'] = 1 if sqlite else os.cpu_count()
+        self.options = options
+        self.started = time.perf_counter()
+        if options['clear']:
+            self.step('clear', self.clear)
+
+        cuisines = self.step('cuisines', self.seed_cuisines)
+        customers = self.step('customers', self.seed_customers)
+        restaurants = self.step('restaurants', self.seed_restaurants, cuisines)
+        tables = self.step('tables', self.seed_tables, restaurants)
+        self.step('menus', self.seed_menus, restaurants)
+        self.step('reviews', self.seed_reviews, restaurants, customers)
+        self.step('reservations', self.seed_reservations, restaurants, tables, customers)
+        # bulk_create skips the signals that schedule reminders and keep the stats rollups
+        self.step('reminders', backfill_reminders, options['batch_size'])
+        self.step('stats', self.rebuild_stats, restaurants)
+        self.stdout.write(f'Done in {time.perf_counter() - self.started:.1f}s')
+
+    def step(self, name, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        if isinstance(result, dict):
+            rows = sum(map(len, result.values()))
+        else:
+            rows = len(result) if isinstance(result, list) else result
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{name}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)')
+        return result
+
+    def rng(self, *parts):
+        return rng_for(self.options['seed'], *parts)
+
+    def clear(self):
+        restaurant_ids = list(Restaurant.objects.filter(user__username__startswith=PREFIX).values_list('id', flat=True))
+        deleted = 0
+        # One restaurant at a time so the cascade never loads a huge number of rows at once.
+        for restaurant_id in restaurant_ids:
+            deleted += Reservation.objects.filter(restaurant_id=restaurant_id).delete()[0]
+        deleted += User.objects.filter(username__startswith=PREFIX).delete()[0]
+        return deleted
+
+    def seed_cuisines(self):
+        names = CUISINES[:self.options['cuisines']]
+        names += [f'Cuisine {i}' for i in range(len(names), self.options['cuisines'])]
+        existing = set(Cuisine.objects.filter(name__in=names).values_list('name', flat=True))
+        Cuisine.objects.bulk_create([Cuisine(name=name, slug=slugify(name)) for name in names if name not in existing])
+        return list(Cuisine.objects.filter(name__in=names).order_by('name').values_list('id', flat=True))
+
+    def create_users(self, kind, count, role):
+        rng = self.rng('users', kind)
+        password = make_password(PASSWORD)
+        seed = self.options['seed']
+        users = (
+            User(username=f'{PREFIX}{seed}-{kind}-{i}', email=f'{PREFIX}{seed}-{kind}-{i}@example.com',
+                 first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES), password=password, role=role)
+            for i in range(count)
+        )
+        ids = []
+        for batch in batched(users, self.options['batch_size']):
+            ids += [user.pk for user in User.objects.bulk_create(batch)]
+        return ids
+
+    def seed_customers(self):
+        rng = self.rng('customers', 'profile')
+        user_ids = self.create_users('customer', self.options['customers'], User.ROLE.CUSTOMER)
+        customers = (
+            Customer(user_id=user_id, phone=f'+99890{rng.randrange(10 ** 7):07d}',
+                     birth_date=date(1960, 1, 1) + timedelta(days=rng.randrange(45 * 365)))
+            for user_id in user_ids
+        )
+        ids = []
+        for batch in batched(customers, self.options['batch_size']):
+            ids += [customer.pk for customer in Customer.objects.bulk_create(batch)]
+        return ids
+
+    def seed_restaurants(self, cuisine_ids):
+        rng = self.rng('restaurants')
+        seed = self.options['seed']
+        user_ids = self.create_users('restaurant', self.options['restaurants'], User.ROLE.RESTAURANT)
+        restaurants = []
+        for i, user_id in enumerate(user_ids):
+            name = f'{rng.choice(NAME_WORDS)} {rng.choice(NAME_KINDS)}'
+            restaurants.append(Restaurant(
+                name=name, slug=f'{PREFIX}{seed}-{slugify(name)}-{i}', user_id=user_id,
+                location=f'{rng.choice(DISTRICTS)}, Tashkent', description=f'{name} in {rng.choice(DISTRICTS)}.',
+                contact_number=f'+99871{rng.randrange(10 ** 7):07d}',
+                opening_time=dt_time(rng.choice([8, 9, 10, 11])), closing_time=dt_time(rng.choice([22, 23])),
+                is_halal=rng.random() < 0.7,
+            ))
+        restaurants = Restaurant.objects.bulk_create(restaurants, batch_size=self.options['batch_size'])
+
+        # Popular cuisines are much more common than rare ones.
+        cuisine_weights = [1 / (rank + 1) for rank in range(len(cuisine_ids))]
+        through = Restaurant.cuisines.through
+        links = []
+        for restaurant in restaurants:
+            picked = set(rng.choices(cuisine_ids, cuisine_weights, k=rng.choice([1, 1, 2, 2, 3])))
+            links += [through(restaurant_id=restaurant.pk, cuisine_id=cuisine_id) for cuisine_id in picked]
+        through.objects.bulk_create(links, batch_size=self.options['batch_size'])
+        return restaurants
+
+    def seed_tables(self, restaurants):
+        rng = self.rng('tables')
+        average = self.options['tables']
+        tables = []
+        for restaurant in restaurants:
+            count = max(2, round(rng.gauss(average, average / 3)))
+            tables += [Table(restaurant_id=restaurant.pk, number=number, capacity=rng.choice(TABLE_CAPACITIES))
+                       for number in range(1, count + 1)]
+        tables = Table.objects.bulk_create(tables, batch_size=self.options['batch_size'])
+        by_restaurant = {}
+        for table in tables:
+            by_restaurant.setdefault(table.restaurant_id, []).append((table.pk, table.capacity))
+        return by_restaurant
+
+    def seed_menus(self, restaurants):
+        rng = self.rng('menus')
+        seed = self.options['seed']
+        categories = []
+        for restaurant in restaurants:
+            for name in rng.sample(MENU_CATEGORIES, rng.randint(3, 6)):
+                categories.append(MenuCategory(restaurant_id=restaurant.pk, name=name, slug=slugify(name)))
+        categories = MenuCategory.objects.bulk_create(categories, batch_size=self.options['batch_size'])
+
+        per_category = self.options['menu_items'] / max(1, len(categories) / max(1, len(restaurants)))
+        items = []
+        for category in categories:
+            for i in range(max(1, round(rng.gauss(per_category, per_category / 3)))):
+                name = f'{category.name} {i + 1}'
+                items.append(MenuItem(
+                    menu_id=category.pk, name=name, slug=f'{PREFIX}{seed}-{category.pk}-{i}',
+                    description=f'House {name.lower()}',
+                    unit_price=Decimal(str(round(rng.lognormvariate(math.log(8), 0.5) + 1, 2)))))
+        MenuItem.objects.bulk_create(items, batch_size=self.options['batch_size'])
+        return len(categories) + len(items)
+
+    def seed_reviews(self, restaurants, customer_ids):
+        rng = self.rng('reviews')
+        # Each restaurant has a quality that its ratings scatter around, and popular places get more reviews.
+        quality = {restaurant.pk: rng.betavariate(5, 2) * 4 + 1 for restaurant in restaurants}
+        popularity = [1 / (rank + 1) ** 0.9 for rank in range(len(restaurants))]
+        rng.shuffle(popularity)
+        counts = allocate(self.options['reviews'], popularity)
+
+        created = 0
+        reviews = (
+            Review(restaurant_id=restaurant.pk, customer_id=rng.choice(customer_ids), rating=rating,
+                   comment=rng.choice(REVIEW_COMMENTS[rating]))
+            for restaurant, count in zip(restaurants, counts)
+            for rating in (min(5, max(1, round(rng.gauss(quality[restaurant.pk], 0.8)))) for _ in range(count))
+        )
+        for batch in batched(reviews, self.options['batch_size']):
+            batch = Review.objects.bulk_create(batch)
+            replies = [
+                ReviewReply(restaurant_id=review.restaurant_id, customer_id=review.customer_id, review_id=review.pk,
+                            reply_text=rng.choice(REPLIES))
+                for review in batch if rng.random() < self.options['reply_rate']
+            ]
+            ReviewReply.objects.bulk_create(replies)
+            created += len(batch) + len(replies)
+
+        # bulk_create skips Review.save(), which keeps num_reviews up to date.
+        Restaurant.objects.filter(pk__in=[restaurant.pk for restaurant in restaurants]).update(num_reviews=Coalesce(
+            Subquery(Review.objects.filter(restaurant=OuterRef('pk')).values('restaurant')
+                     .annotate(count=Count('pk')).values('count')), 0))
+        return created
+
+    def rebuild_stats(self, restaurants):
+        return sum(stats.rebuild(restaurant_ids=[restaurant.pk for restaurant in restaurants]))
+
+    def seed_reservations(self, restaurants, tables, customer_ids):
+        options = self.options
+        today = options['today']
+        first = today - timedelta(days=30 * options['months'])
+        days = [first + timedelta(days=i) for i in range((today - first).days + 30)]
+
+        rng = self.rng('reservations')
+        popularity = [1 / (rank + 1) ** 0.9 for rank in range(len(restaurants))]
+        rng.shuffle(popularity)
+        counts = allocate(options['reservations'], popularity)
+        tasks = [
+            (i, restaurant.pk, restaurant.opening_time.hour, restaurant.closing_time.hour, tables[restaurant.pk], count)
+            for i, (restaurant, count) in enumerate(zip(restaurants, counts)) if count
+        ]
+        worker_options = {key: options[key] for key in ['seed', 'today', 'batch_size', 'payment_rate']}
+
+        if options['workers'] == 1:
+            # In this process, inside any transaction the caller has open
+            set_worker_state(worker_options, customer_ids, days)
+            created, payments = self.count_reservations(map(seed_restaurant_reservations, tasks), len(tasks))
+        else:
+            # Children open their own connections; an inherited one must not be shared.
+            connections.close_all()
+            with ProcessPoolExecutor(options['workers'], mp_context=get_context('fork'), initializer=init_worker,
+                                     initargs=(worker_options, customer_ids, days)) as executor:
+                created, payments = self.count_reservations(executor.map(seed_in_worker, tasks), len(tasks))
+        if created < options['reservations']:
+            self.stdout.write(f'  {options["reservations"] - created} reservations skipped: no free table slot')
+        return created + 2 * payments
+
+    def count_reservations(self, results, total):
+        created = payments = 0
+        for done, (rows, paid) in enumerate(results, 1):
+            created += rows
+            payments += paid
+            if done % 50 == 0 or done == total:
+                elapsed = time.perf_counter() - self.started
+                self.stdout.write(f'  {done}/{total} restaurants, {created} reservations, '
+                                  f'{payments} payments ({elapsed:.0f}s)')
+        return created, payments
@@ -0,0 +1,49 @@
+import os
+import signal
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.restaurant.reminders import backfill_reminders, send_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Send reservation reminders as they come due (see apps.restaurant.reminders) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send the reminders that are due, then exit.')
+        parser.add_argument('--backfill', action='store_true',
+                            help='First schedule reminders for upcoming reservations that have none.')
+        parser.add_argument('--batch-size', type=int, default=settings.REMINDER_BATCH_SIZE)
+        parser.add_argument('--concurrency', type=int, default=settings.REMINDER_CONCURRENCY)
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Seconds to wait when no reminder is due.')
+
+    def handle(self, *args, **options):
+        if options['backfill']:
+            self.stdout.write(f'Scheduled {backfill_reminders()} reminders')
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        if not options['once']:
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            close_old_connections()
+            started = time.perf_counter()
+            sent, skipped, failed = send_due_reminders(worker, options['batch_size'], options['concurrency'])
+            if sent or skipped or failed:
+                if options['verbosity'] > 1 or failed:
+                    self.stdout.write(f'{sent} sent, {skipped} skipped, {failed} failed '
+                                      f'in {(time.perf_counter() - started) * 1000:.0f}ms')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
+
+    def stop(self, signum, frame):
+        # Finish the batch at hand, then exit
+        self.stopping = True
@@ -0,0 +1,62 @@
+import glob
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow-query log: the queries that took the most total time, with their views and plan.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SLOW_QUERY_LOG,
+                            help='Log file; its rotated copies (.1, .2, ...) are read too.')
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--hours', type=float, help='Only entries from the last HOURS hours.')
+        parser.add_argument('--plans', action='store_true', help='Show a plan for each query.')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        queries = {}
+        for entry in self.entries(options['log']):
+            if since and datetime.fromisoformat(entry['time']) < since:
+                continue
+            query = queries.setdefault(entry['fingerprint'], {
+                'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'views': Counter(), 'sites': Counter(), 'plan': None})
+            query['count'] += 1
+            query['total_ms'] += entry['duration_ms']
+            query['max_ms'] = max(query['max_ms'], entry['duration_ms'])
+            query['views'][entry.get('view') or '-'] += 1
+            query['sites'][entry.get('site') or '-'] += 1
+            query['plan'] = entry.get('plan') or query['plan']
+
+        if not queries:
+            self.stdout.write('No slow queries logged.')
+            return
+        top = sorted(queries.items(), key=lambda item: item[1]['total_ms'], reverse=True)[:options['top']]
+        for rank, (sql, query) in enumerate(top, 1):
+            self.stdout.write(
+                f"{rank}. {query['total_ms']:.0f}ms total, {query['count']}x, "
+                f"mean {query['total_ms'] / query['count']:.0f}ms, max {query['max_ms']:.0f}ms")
+            self.stdout.write(f'   {sql[:300]}')
+            self.stdout.write('   views: ' + ', '.join(f'{view} ({count})' for view, count in query['views'].most_common(3)))
+            self.stdout.write('   sites: ' + ', '.join(f'{site} ({count})' for site, count in query['sites'].most_common(3)))
+            if options['plans'] and query['plan']:
+                self.stdout.write('   plan:\n' + '\n'.join(f'     {line}' for line in query['plan'].splitlines()))
+
+    def entries(self, path):
+        # Oldest rotated file first
+        for filename in sorted(glob.glob(f'{path}.*'), key=lambda name: -int(name.rsplit('.', 1)[1])
+                               if name.rsplit('.', 1)[1].isdigit() else 0) + [path]:
+            try:
+                with open(filename) as file:
+                    for line in file:
+                        try:
+                            yield json.loads(line)
+                        except ValueError:
+                            continue
+            except FileNotFoundError:
+                continue
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from reservio.smtpstub import SMTPStub
+
+
+class Command(BaseCommand):
+    help = ('Run a local SMTP server that prints the messages it gets instead of sending them. '
+            'Point EMAIL_HOST/EMAIL_PORT at it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        with SMTPStub(port=options['port'], on_message=self.show) as stub:
+            self.stdout.write(f'SMTP stub listening on 127.0.0.1:{stub.port}')
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
+
+    def show(self, sender, recipients, message):
+        self.stdout.write(f"From {sender} to {', '.join(recipients)}: {message['Subject']}")
+        body = message.get_body(preferencelist=('plain', 'html'))
+        if body is not None:
+            self.stdout.write(body.get_content())
@@ -1,6 +1,12 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
+from django.core.files import File
 from django.db import models
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -40,4 +46,139 @@ class User(AbstractUser):
 
     @property
     def fio(self):
-        return f"{self.first_name} {self.last_name}".rstrip(" ")
\ No newline at end of file
+        return f"{self.first_name} {self.last_name}".rstrip(" ")
+
+
+class StoredFileManager(models.Manager):
+
+    def add_ref(self, name):
+        self.filter(name=name).update(ref_count=models.F('ref_count') + 1)
+
+    def release(self, name):
+        self.filter(name=name).update(ref_count=models.F('ref_count') - 1)
+
+    def touch(self, name, digest, size):
+        """
+        Gets or creates the row of a blob, locked until the transaction ends
+        (so call it in one), and bumps its ``last_seen``.
+        """
+        stored, created = self.select_for_update().get_or_create(name=name, defaults={'digest': digest, 'size': size})
+        if not created:
+            self.filter(pk=stored.pk).update(last_seen=timezone.now())
+        return stored
+
+
+class StoredFile(models.Model):
+    """A blob kept by reservio.storage.ContentAddressedStorage."""
+
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Bumped whenever an upload is deduplicated against this blob, so the
+    # garbage collector never removes a file that is about to be referenced.
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return self.name
+
+
+class ChunkedUpload(models.Model):
+    """A file uploaded in pieces through api/uploads/, resumable from ``offset``."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, self.id.hex)
+
+    @property
+    def complete(self):
+        return self.offset == self.size
+
+    def take(self):
+        """
+        Opens the file and deletes the upload, so it is attached only once.
+        The file closes itself once read through, as storages do when saving
+        it. Raises ChunkedUpload.DoesNotExist when it was taken already or its
+        file is gone.
+        """
+        try:
+            file = open(self.path, 'rb')
+        except FileNotFoundError:
+            raise ChunkedUpload.DoesNotExist
+        if not ChunkedUpload.objects.filter(pk=self.pk).delete()[0]:
+            file.close()
+            raise ChunkedUpload.DoesNotExist
+        # The open file stays readable after the name is gone
+        os.unlink(self.path)
+        return UploadedChunks(file, name=self.filename)
+
+    def delete(self, *args, **kwargs):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        return super().delete(*args, **kwargs)
+
+
+class UploadedChunks(File):
+    def chunks(self, chunk_size=None):
+        try:
+            yield from super().chunks(chunk_size)
+        finally:
+            self.close()
+
+
+class RevokedToken(models.Model):
+    """A logged out access or refresh token, kept until it would have expired."""
+
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=16)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'{self.token_type} {self.jti}'
+
+
+class Task(models.Model):
+    """A call to a function registered with reservio.tasks, run by `manage.py run_tasks`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The worker's poll: due tasks of a status, oldest first
+            models.Index(fields=['status', 'run_at'], name='core_task_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
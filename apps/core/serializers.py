@@ -1,10 +1,12 @@
+from django.conf import settings
 from django.db.models import Q
 from djoser.serializers import UserSerializer as BaseUserSerializer,  UserCreateSerializer as BaseUserCreateSerializer
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from apps.core.models import User
+from apps.core.models import User, ChunkedUpload
 from apps.restaurant.models import Customer, Restaurant
+from reservio.fields import ChunkedUploadsMixin, StreamedImageField
 
 
 class UserCreateSerializer(BaseUserCreateSerializer):
@@ -85,7 +87,7 @@ class RegistrationSerializer(serializers.ModelSerializer):
                   'birth_date', 'phone_number', 'first_name', 'last_name']
 
 
-class RegisterRestaurantSerializer(serializers.Serializer):
+class RegisterRestaurantSerializer(ChunkedUploadsMixin, serializers.Serializer):
     username = serializers.CharField(max_length=255, required=True)
     first_name = serializers.CharField(max_length=255, required=True)
     last_name = serializers.CharField(max_length=255, required=True)
@@ -103,7 +105,7 @@ class RegisterRestaurantSerializer(serializers.Serializer):
     opening_time = serializers.TimeField(required=False)
     closing_time = serializers.TimeField(required=False)
     is_halal = serializers.BooleanField(default=False)
-    photos = serializers.ImageField(allow_empty_file=True, required=False)
+    photos = StreamedImageField(allow_empty_file=True, required=False)
     cuisines = serializers.ListField(
         child=serializers.IntegerField(), required=False)
 
@@ -156,3 +158,17 @@ class RegisterRestaurantSerializer(serializers.Serializer):
     class Meta:
         fields = ['username', 'email', 'password', 'confirm', 'name', 'location', 'contact_number',
                   'website', 'instagram', 'telegram', 'opening_time', 'closing_time', 'is_halal', 'cuisines', 'first_name', 'last_name']
+
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    complete = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'filename', 'size', 'offset', 'complete']
+        read_only_fields = ['id', 'offset']
+
+    def validate_size(self, value):
+        if value > settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise ValidationError(f'Files larger than {settings.CHUNKED_UPLOAD_MAX_SIZE} bytes are not allowed.')
+        return value
@@ -0,0 +1,91 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import FileField
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from apps.core.models import StoredFile, User
+from reservio.authentication import revoke_user_tokens, user_cache_key
+from reservio.storage import ContentAddressedStorage
+
+# Changing any of these invalidates the claims in the user's tokens.
+TOKEN_USER_FIELDS = ['role', 'is_active', 'password']
+
+
+def stored_file_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def file_names(instance, fields):
+    names = {}
+    for field in fields:
+        # Read the raw value so deferred fields are not loaded.
+        if field.attname in instance.__dict__:
+            value = instance.__dict__[field.attname]
+            names[field.attname] = getattr(value, 'name', value) or None
+    return names
+
+
+def remember_file_names(sender, instance, **kwargs):
+    instance._stored_file_names = file_names(instance, sender._stored_file_fields)
+
+
+def update_file_refs(sender, instance, created, **kwargs):
+    old_names = {} if created else instance._stored_file_names
+    new_names = file_names(instance, sender._stored_file_fields)
+    for attname, name in new_names.items():
+        old_name = old_names.get(attname)
+        if name == old_name:
+            continue
+        if name:
+            StoredFile.objects.add_ref(name)
+        if old_name:
+            StoredFile.objects.release(old_name)
+    instance._stored_file_names = new_names
+
+
+def release_file_refs(sender, instance, **kwargs):
+    for name in instance._stored_file_names.values():
+        if name:
+            StoredFile.objects.release(name)
+
+
+def connect_file_refs():
+    """
+    Keep StoredFile.ref_count in sync for every model that has a file field
+    backed by ContentAddressedStorage.
+    """
+    for model in apps.get_models():
+        fields = stored_file_fields(model)
+        if not fields:
+            continue
+        model._stored_file_fields = fields
+        post_init.connect(remember_file_names, sender=model)
+        post_save.connect(update_file_refs, sender=model)
+        post_delete.connect(release_file_refs, sender=model)
+
+
+@receiver(post_init, sender=User)
+def remember_token_fields(sender, instance, **kwargs):
+    instance._token_fields = {name: instance.__dict__.get(name) for name in TOKEN_USER_FIELDS}
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, update_fields=None, **kwargs):
+    old_fields = instance._token_fields
+    instance._token_fields = {name: instance.__dict__.get(name) for name in TOKEN_USER_FIELDS}
+    if created:
+        return
+    if update_fields is None or set(update_fields) & set(TOKEN_USER_FIELDS):
+        if old_fields != instance._token_fields:
+            revoke_user_tokens(instance.pk)
+            return
+    cache.delete(user_cache_key(instance.pk))
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.mail import get_connection
+
+from reservio.mail import message_from_dict
+from reservio.tasks import task
+
+
+@task(batch_size=50)
+def send_email(calls):
+    """Sends queued messages (see reservio.mail) over one connection."""
+    errors = []
+    with get_connection(settings.EMAIL_DELIVERY_BACKEND) as connection:
+        for call in calls:
+            try:
+                connection.send_messages([message_from_dict(call['message'])])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+    return errors
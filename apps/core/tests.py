@@ -1,3 +1,868 @@
-from django.test import TestCase
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail, send_mass_mail
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import lazy
+from django.utils.log import AdminEmailHandler
+from rest_framework.exceptions import Throttled
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from apps.core.management.commands.seed_scale import allocate
+from apps.core.models import ChunkedUpload, RevokedToken, StoredFile, Task, User
+from apps.restaurant.models import Customer, MenuCategory, MenuItem, Reservation, ReservationReminder, Restaurant, \
+    RestaurantDailyStats, Review
+from apps.restaurant.serializers import MenuItemsSerializer
+from reservio import passwords, profiling, slowqueries
+from reservio.authentication import ClaimsAccessToken, user_cache_key
+from reservio.benchmark import free_port, percentile, run_load, summarize
+from reservio.db.router import PIN_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, replica_health
+from reservio.querycount import current_request
+from reservio.renderers import MessagePackRenderer, ORJSONRenderer
+from reservio.revocation import USER_TOKEN_TYPE, revoked_tokens, user_jti
+from reservio.smtpstub import SMTPStub
+from reservio.tasks import task
+from reservio.warmup import warm_up
+
+
+@task(name='tests.flaky', max_attempts=2)
+def flaky(fail):
+    if fail:
+        raise RuntimeError('boom')
+
+
+def run_tasks():
+    call_command('run_tasks', once=True, stdout=StringIO())
+
+
+class DatabasePoolSettingsTests(SimpleTestCase):
+    """DATABASE_POOL is read when the settings load, so each case loads them in a fresh interpreter."""
+
+    def load_database(self, **env):
+        script = 'import json, reservio.settings as s; print(json.dumps(s.DATABASES["default"], default=str))'
+        result = subprocess.run([sys.executable, '-c', script], env={**os.environ, **env},
+                                capture_output=True, text=True)
+        return result.returncode, json.loads(result.stdout) if result.returncode == 0 else result.stderr
+
+    def test_persistent(self):
+        code, database = self.load_database(DATABASE_POOL='persistent', DATABASE_CONN_MAX_AGE='30')
+        self.assertEqual(code, 0)
+        self.assertEqual((database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']), (30, True))
+        self.assertNotIn('pool', database.get('OPTIONS', {}))
+
+    def test_off(self):
+        code, database = self.load_database(DATABASE_POOL='off')
+        self.assertEqual((code, database['CONN_MAX_AGE']), (0, 0))
+
+    def test_native_needs_postgres_and_psycopg_pool(self):
+        code, error = self.load_database(DATABASE_POOL='native')
+        self.assertEqual(code, 1)
+        self.assertIn('ImproperlyConfigured', error)
+        code, database = self.load_database(DATABASE_POOL='native', DATABASE='postgres://app@db/reservio',
+                                            DATABASE_POOL_MAX_SIZE='8')
+        if importlib.util.find_spec('psycopg_pool') is None:
+            self.assertEqual(code, 1)
+        else:
+            self.assertEqual(database['ENGINE'], 'reservio.db.postgresql')
+            self.assertEqual(database['OPTIONS']['pool'], {'min_size': 2, 'max_size': 8, 'timeout': 10})
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_warm_up(self):
+        # SimpleTestCase fails on any query: nothing may open a connection before the fork
+        with self.assertLogs('reservio.warmup', 'INFO') as logs:
+            warm_up()
+        self.assertRegex(logs.output[0], r'Warmed up [1-9]\d* views and [1-9]\d* models')
+
+    def test_application_hooks(self):
+        """Each application module warms up on load unless WARMUP is off, in a fresh interpreter."""
+        script = ('import sys, importlib; importlib.import_module(sys.argv[1]); '
+                  'from django.urls import get_resolver; print(get_resolver()._populated)')
+        for module in ['reservio.wsgi', 'reservio.asgi']:
+            for warmup in ['True', 'False']:
+                with self.subTest(module=module, warmup=warmup):
+                    result = subprocess.run([sys.executable, '-c', script, module],
+                                            env={**os.environ, 'WARMUP': warmup}, capture_output=True, text=True)
+                    self.assertEqual(result.returncode, 0, result.stderr)
+                    self.assertEqual(result.stdout.strip(), warmup)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_REPLICA_MAX_LAG=5, DATABASE_REPLICA_CHECK_INTERVAL=60)
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Routing decisions only: 'replica' is never connected to. Not a TestCase,
+    whose transaction on 'default' would keep every read there.
+    """
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.set_replica(lag=0.0)
+        cache.clear()
+        self.addCleanup(replica_health.status.clear)
+
+    def set_replica(self, lag=0.0, healthy=True):
+        replica_health.status['replica'] = {
+            'healthy': healthy, 'lag': lag, 'error': None, 'checked': time.monotonic()}
+
+    def route(self, request, write=False):
+        """Runs ``request`` through the middleware; returns the response and where a read went."""
+        reads = []
+
+        def view(request):
+            if write:
+                self.router.db_for_write(Restaurant)
+            reads.append(self.router.db_for_read(Restaurant))
+            return HttpResponse()
+
+        token = current_request.set(request)
+        try:
+            response = ReplicaRoutingMiddleware(view)(request)
+        finally:
+            current_request.reset(token)
+        return response, reads[0]
+
+    def test_safe_request_reads_from_replica(self):
+        _, db = self.route(self.factory.get('/restaurants/'))
+        self.assertEqual(db, 'replica')
+
+    def test_unsafe_request_reads_from_primary(self):
+        _, db = self.route(self.factory.post('/restaurants/'))
+        self.assertEqual(db, 'default')
+        self.assertEqual(self.router.db_for_write(Restaurant), 'default')
+
+    def test_reads_outside_requests_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+
+    def test_write_pins_client_with_cookie(self):
+        response, _ = self.route(self.factory.post('/reservations/'), write=True)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get('/reservations/')
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        _, db = self.route(request)
+        self.assertEqual(db, 'default')
+
+    def test_write_pins_token_client(self):
+        headers = {'Authorization': 'Bearer token-a'}
+        self.route(self.factory.post('/reservations/', headers=headers), write=True)
+
+        _, db = self.route(self.factory.get('/reservations/', headers=headers))
+        self.assertEqual(db, 'default')
+        _, db = self.route(self.factory.get('/reservations/', headers={'Authorization': 'Bearer token-b'}))
+        self.assertEqual(db, 'replica')
+
+    def test_write_in_safe_request_pins_rest_of_request(self):
+        response, db = self.route(self.factory.get('/restaurants/'), write=True)
+        self.assertEqual(db, 'default')
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_lagging_replica_is_skipped(self):
+        self.set_replica(lag=30.0, healthy=False)
+        _, db = self.route(self.factory.get('/restaurants/'))
+        self.assertEqual(db, 'default')
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_health_check(self):
+        replica_health.status.clear()
+        self.assertTrue(replica_health.is_healthy('default'))
+        self.assertEqual(replica_health.snapshot()['default'], {'healthy': True, 'lag': 0.0, 'error': None})
+
+
+@override_settings(SLOW_QUERY_EXPLAIN=True, SLOW_QUERY_EXPLAIN_ANALYZE=True, SLOW_QUERY_EXPLAIN_INTERVAL=60)
+class SlowQueryExplainTests(TestCase):
+    def setUp(self):
+        slowqueries.last_explained.clear()
+        self.addCleanup(slowqueries.last_explained.clear)
+
+    def test_only_plain_selects_are_analyzed(self):
+        self.assertTrue(slowqueries.analyzable('SELECT "id" FROM "core_user" WHERE "id" = %s'))
+        self.assertFalse(slowqueries.analyzable('SELECT "id" FROM "core_task" LIMIT 5 FOR UPDATE SKIP LOCKED'))
+        self.assertFalse(slowqueries.analyzable('SELECT "id" FROM "core_task" FOR NO KEY UPDATE'))
+        self.assertFalse(slowqueries.analyzable('WITH moved AS (DELETE FROM "core_task" RETURNING *) SELECT 1'))
+
+    def test_failed_explain_leaves_the_transaction_usable(self):
+        with transaction.atomic():
+            User.objects.create(username='bob', email='bob@example.com')
+            plan = slowqueries.explain(connection, 'SELECT * FROM missing_table', [])
+            self.assertTrue(plan.startswith('EXPLAIN failed'))
+            self.assertTrue(User.objects.filter(username='bob').exists())
+
+    def test_explained_fingerprints_are_bounded(self):
+        with mock.patch.object(slowqueries, 'MAX_EXPLAINED_FINGERPRINTS', 2):
+            for key in ['a', 'b', 'c']:
+                self.assertTrue(slowqueries.should_explain('SELECT 1', key))
+            self.assertFalse(slowqueries.should_explain('SELECT 1', 'c'))
+        self.assertEqual(list(slowqueries.last_explained), ['b', 'c'])
+
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(DEBUG=False, METRICS_TOKEN='')
+    def test_needs_a_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='scrape')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'reservio_http_responses_total', response.content)
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        settings = override_settings(PROFILE_DIR=self.profile_dir, PROFILE_SAMPLE_RATE=0.0,
+                                     PROFILE_HEADER_ENABLED=True, PROFILE_MODE='sample')
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def write_profile(self, name, content=b'main (app.py:1) 1\n'):
+        with open(os.path.join(self.profile_dir, name), 'wb') as file:
+            file.write(content)
+
+    def auth(self, **fields):
+        user = User.objects.create_user(username='ops', email='ops@example.com', password='secret-pass-1', **fields)
+        return {'Authorization': f'Bearer {ClaimsAccessToken.for_user(user)}'}
+
+    def test_token(self):
+        token = profiling.make_token()
+        self.assertTrue(profiling.valid_token(token))
+        self.assertFalse(profiling.valid_token(token + 'x'))
+        self.assertFalse(profiling.valid_token('profile'))
+        with mock.patch('django.core.signing.time.time', return_value=time.time() + 3601):
+            self.assertFalse(profiling.valid_token(token))
+
+    @override_settings(PROFILE_HEADER_ENABLED=False)
+    def test_off_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_profiles_only_requests_with_a_valid_token(self):
+        response = self.client.get('/api/profiles/')
+        self.assertNotIn('X-Profile-Id', response)
+        response = self.client.get('/api/profiles/', headers={'X-Profile': 'forged'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+        response = self.client.get('/api/profiles/', headers={'X-Profile': profiling.make_token()})
+        self.assertRegex(response['X-Profile-Id'], r'-GET-profiles-\d+ms-\w+\.folded$')
+        self.assertEqual(os.listdir(self.profile_dir), [response['X-Profile-Id']])
+
+    @override_settings(PROFILE_HEADER_ENABLED=False, PROFILE_SAMPLE_RATE=1.0, PROFILE_MODE='cprofile')
+    def test_sampled_cprofile(self):
+        response = self.client.get('/api/profiles/')
+        self.assertTrue(response['X-Profile-Id'].endswith('.pstats'))
+        self.assertFalse(profiling.cprofile_lock.locked())
+
+    @override_settings(PROFILE_MODE='cprofile')
+    def test_one_cprofile_at_a_time(self):
+        with profiling.cprofile_lock:
+            response = self.client.get('/api/profiles/', headers={'X-Profile': profiling.make_token()})
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertIn('X-Profile-Skipped', response)
+
+    @override_settings(PROFILE_MAX_FILES=2)
+    def test_old_profiles_are_pruned(self):
+        for name in ['20250101-000000-a.folded', '20250102-000000-b.pstats', '20250103-000000-c.folded',
+                     'notes.txt']:
+            self.write_profile(name)
+        profiling.prune_profiles()
+        self.assertEqual(sorted(os.listdir(self.profile_dir)),
+                         ['20250102-000000-b.pstats', '20250103-000000-c.folded', 'notes.txt'])
+
+    def test_only_admins_see_profiles(self):
+        self.write_profile('20250101-000000-a.folded')
+        self.assertEqual(self.client.get('/api/profiles/').status_code, 401)
+        headers = self.auth()
+        self.assertEqual(self.client.get('/api/profiles/', headers=headers).status_code, 403)
+        self.assertEqual(self.client.get('/api/profiles/20250101-000000-a.folded', headers=headers).status_code, 403)
+
+    def test_list_and_download(self):
+        self.write_profile('20250101-000000-a.folded')
+        self.write_profile('notes.txt')
+        headers = self.auth(is_staff=True)
+        profiles = self.client.get('/api/profiles/', headers=headers).json()
+        self.assertEqual([(profile['name'], profile['size']) for profile in profiles],
+                         [('20250101-000000-a.folded', 18)])
+        self.assertTrue(profiles[0]['url'].endswith('/api/profiles/20250101-000000-a.folded'))
+
+        response = self.client.get('/api/profiles/20250101-000000-a.folded', headers=headers)
+        self.assertEqual(b''.join(response.streaming_content), b'main (app.py:1) 1\n')
+        self.assertEqual(self.client.get('/api/profiles/notes.txt', headers=headers).status_code, 404)
+        self.assertEqual(self.client.get('/api/profiles/missing.folded', headers=headers).status_code, 404)
+
+
+class SeedScaleTests(TestCase):
+    options = dict(seed=7, customers=20, restaurants=3, cuisines=4, tables=3, reservations=60, months=1, reviews=15,
+                   menu_items=4, batch_size=25, workers=1)
+
+    def seed(self, **options):
+        # Reminders are only scheduled for reservations from now on
+        options = {**self.options, 'today': timezone.localdate(), **options}
+        call_command('seed_scale', **options, stdout=StringIO())
+
+    def snapshot(self):
+        return sorted(Reservation.objects.values_list(
+            'restaurant__slug', 'table__number', 'customer__user__username', 'date', 'start_time', 'num_guests',
+            'status'))
+
+    def test_allocate(self):
+        self.assertEqual(allocate(10, [1, 1, 1]), [4, 3, 3])
+        self.assertEqual(allocate(7, [5, 0, 2]), [5, 0, 2])
+        self.assertEqual(sum(allocate(1000, [1 / (rank + 1) for rank in range(37)])), 1000)
+
+    def test_seed(self):
+        self.seed()
+        self.assertEqual(Customer.objects.filter(user__username__startswith='seed-').count(), 20)
+        self.assertEqual(Restaurant.objects.filter(user__username__startswith='seed-').count(), 3)
+        self.assertEqual(Review.objects.count(), 15)
+        self.assertEqual(Reservation.objects.count(), 60)
+        self.assertTrue(MenuItem.objects.exists())
+        self.assertTrue(ReservationReminder.objects.exists())
+        self.assertFalse(ReservationReminder.objects.filter(reservation__status=Reservation.REJECTED).exists())
+        self.assertEqual(RestaurantDailyStats.objects.aggregate(total=Sum('reservations'))['total'], 60)
+
+    def test_same_seed_same_data(self):
+        self.seed()
+        first = self.snapshot()
+        self.seed(clear=True)
+        self.assertEqual(self.snapshot(), first)
+        self.seed(clear=True, seed=8)
+        self.assertNotEqual(self.snapshot(), first)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200 if self.path == '/ok' else 500)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BenchmarkTests(SimpleTestCase):
+    result = {'rps': 100.0, 'p50': 10.0, 'p95': 20.0, 'p99': 30.0, 'errors': 0, 'queries': 3.0}
+
+    def compare(self, baseline, current, **options):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        paths = []
+        for name, results in [('baseline', baseline), ('current', current)]:
+            paths.append(os.path.join(directory, f'{name}.json'))
+            with open(paths[-1], 'w') as file:
+                json.dump({'meta': {}, 'results': {'client': results}}, file)
+        self.stdout = StringIO()
+        call_command('bench_compare', *paths, stdout=self.stdout, **options)
+        return self.stdout.getvalue()
+
+    def test_percentile(self):
+        values = list(range(100, 0, -1))
+        self.assertEqual((percentile(values, 50), percentile(values, 95), percentile(values, 99)), (51, 96, 100))
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual(summarize([], 3, 1.0), {'rps': 0, 'p50': None, 'p95': None, 'p99': None, 'errors': 3})
+
+    def test_compare_within_threshold(self):
+        current = {'list': {**self.result, 'rps': 95.0, 'p95': 21.0, 'queries': 3.4}, 'added': self.result}
+        output = self.compare({'list': self.result}, current)
+        self.assertIn('added: new', output)
+        self.assertIn('No regressions beyond 10%', output)
+
+    def test_compare_flags_regressions(self):
+        for change, flagged in [({'rps': 80.0}, 'req/s'), ({'p99': 40.0}, 'p99'), ({'queries': 3.5}, 'queries'),
+                                ({'errors': 2}, 'errors')]:
+            with self.subTest(flagged), self.assertRaisesMessage(CommandError, '1 regressions beyond 10%: client list'):
+                self.compare({'list': self.result}, {'list': {**self.result, **change}})
+            self.assertIn(f'REGRESSION ({flagged})', self.stdout.getvalue())
+        self.compare({'list': self.result}, {'list': {**self.result, 'p99': 40.0}}, threshold=50)
+
+    def test_compare_unreadable_file(self):
+        with self.assertRaisesMessage(CommandError, 'Cannot read'):
+            call_command('bench_compare', '/nonexistent/a.json', '/nonexistent/b.json', stdout=StringIO())
+
+    def test_run_load_counts_failures(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        collected = []
+        times, errors, elapsed = run_load(server.server_port, ['/ok', '/fail'], 10, 2, collect=collected.append)
+        self.assertEqual((len(times), errors, len(collected)), (5, 5, 5))
+        self.assertTrue(all(response.status == 200 for response in collected))
+
+        times, errors, elapsed = run_load(free_port(), ['/ok'], 3, 1)
+        self.assertEqual((times, errors), ([], 3))
+
+
+@override_settings(TASK_RETRY_DELAY=10, TASK_RETRY_MAX_DELAY=3600)
+class TaskQueueTests(TestCase):
+    def test_finished_task_is_deleted(self):
+        flaky.enqueue(fail=False)
+        run_tasks()
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        flaky.enqueue(fail=True)
+        with self.assertLogs('reservio.tasks', 'WARNING'):
+            run_tasks()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertGreater(task.run_at, timezone.now() + timedelta(seconds=4))
+        self.assertIn('boom', task.last_error)
+
+        Task.objects.update(run_at=timezone.now())
+        with self.assertLogs('reservio.tasks', 'ERROR'):
+            run_tasks()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_tasks_not_due_are_left(self):
+        flaky.enqueue(fail=False, delay=60)
+        run_tasks()
+        self.assertEqual(Task.objects.get().attempts, 0)
+
+
+class QueuedEmailTests(TestCase):
+    def setUp(self):
+        self.stub = SMTPStub().start()
+        self.addCleanup(self.stub.stop)
+        # The test runner swaps EMAIL_BACKEND for locmem; put the queue back
+        # and deliver to the stub.
+        settings = override_settings(
+            EMAIL_BACKEND='reservio.mail.QueuedEmailBackend',
+            EMAIL_DELIVERY_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.stub.port, EMAIL_USE_TLS=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_mail_is_queued_and_sent_in_one_batch(self):
+        send_mass_mail([(f'Subject {i}', f'Body {i}', None, [f'user{i}@example.com']) for i in range(3)])
+        self.assertEqual(Task.objects.count(), 3)
+        self.assertEqual(self.stub.messages, [])
+
+        run_tasks()
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(self.stub.sessions, 1)
+        self.assertEqual([recipients for _, recipients, _ in self.stub.messages],
+                         [[f'<user{i}@example.com>'] for i in range(3)])
+        self.assertEqual(self.stub.messages[0][2]['Subject'], 'Subject 0')
+
+    def test_lazy_subject_and_body_are_queued(self):
+        send_mail(lazy(lambda: 'Subject', str)(), lazy(lambda: 'Body', str)(), None, ['user@example.com'])
+        self.assertEqual(Task.objects.get().kwargs['message']['subject'], 'Subject')
+        run_tasks()
+        self.assertEqual(self.stub.messages[0][2]['Subject'], 'Subject')
+
+    def test_error_mails_are_not_queued(self):
+        handlers = [handler for handler in logging.getLogger('django').handlers
+                    if isinstance(handler, AdminEmailHandler)]
+        self.assertEqual([handler.email_backend for handler in handlers],
+                         ['django.core.mail.backends.smtp.EmailBackend'])
+
+    def test_unreachable_server_is_retried(self):
+        send_mail('Subject', 'Body', None, ['user@example.com'])
+        with override_settings(EMAIL_PORT=free_port()), self.assertLogs('reservio.tasks', 'WARNING'):
+            run_tasks()
+        task = Task.objects.get()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+
+
+class RendererTests(TestCase):
+    data = ReturnList([
+        ReturnDict({
+            'id': 1, 'price': Decimal('12.50'), 'ratio': 0.1, 'date': date(2024, 5, 1), 'time': dt_time(18, 30),
+            'created': datetime(2024, 5, 1, 12, 0, 0, 1500, tzinfo=dt_timezone.utc),
+            'naive': datetime(2024, 5, 1, 12, 0), 'uuid': uuid.UUID(int=1), 'name': lazy(str, str)('Plov'),
+            'text': 'Ош \u2028 "🍲"', 'tags': ('a', 'b'), 'keys': {1: 'one'}, 'empty': None, 'ok': True,
+        }, serializer=None),
+    ], serializer=None)
+
+    def test_json_is_the_same_as_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        # Too big for orjson
+        self.assertEqual(ORJSONRenderer().render({'n': 2 ** 70}), b'{"n":1180591620717411303424}')
+
+    def test_indent_is_left_to_drf(self):
+        self.assertEqual(ORJSONRenderer().render(self.data, 'application/json; indent=4'),
+                         JSONRenderer().render(self.data, 'application/json; indent=4'))
+
+    def test_msgpack_has_the_json_values(self):
+        data = [{key: value for key, value in self.data[0].items() if key != 'keys'}]
+        self.assertEqual(msgpack.unpackb(MessagePackRenderer().render(data)),
+                         json.loads(JSONRenderer().render(data)))
+
+    def test_msgpack_request_and_response(self):
+        User.objects.create_user(username='mobile', password='secret123', role=User.ROLE.ADMIN)
+        response = self.client.post(
+            '/api/auth/login/', msgpack.packb({'username': 'mobile', 'password': 'secret123'}),
+            content_type='application/msgpack', headers={'Accept': 'application/msgpack'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['user']['username'], 'mobile')
+
+        response = self.client.post('/api/auth/login/', b'\xc1', content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+
+
+class TempMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings = override_settings(MEDIA_ROOT=self.media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+@override_settings(DEBUG=True, MEDIA_SENDFILE_BACKEND=None)
+class MediaServingTests(TempMediaMixin, SimpleTestCase):
+    name = f'cas/ab/cd/{"ab" * 32}.png'
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'cas/ab/cd'))
+        with open(os.path.join(self.media_root, self.name), 'wb') as file:
+            file.write(b'0123456789')
+
+    def get(self, **headers):
+        response = self.client.get(f'/media/{self.name}', headers=headers)
+        response.body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response
+
+    def test_hashed_file_is_immutable(self):
+        response = self.get()
+        self.assertEqual(response.body, b'0123456789')
+        self.assertEqual(response['ETag'], f'"{"ab" * 32}"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_range(self):
+        response = self.get(Range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(self.get(Range='bytes=-3').body, b'789')
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.get(Range='bytes=20-').status_code, 416)
+        # A changed file is sent whole
+        self.assertEqual(self.get(Range='bytes=2-5', **{'If-Range': '"other"'}).status_code, 200)
+
+    def test_not_modified(self):
+        self.assertEqual(self.get(**{'If-None-Match': f'"{"ab" * 32}"'}).status_code, 304)
+
+    def test_production_needs_a_sendfile_backend(self):
+        with override_settings(DEBUG=False):
+            self.assertEqual(self.get().status_code, 404)
+        with override_settings(DEBUG=False, MEDIA_SENDFILE_BACKEND='x-accel-redirect'):
+            response = self.get()
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.body, b'')
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        restaurant = Restaurant.objects.create(name='Plov', location='Tashkent', contact_number='+998', user=owner)
+        self.category = MenuCategory.objects.create(restaurant=restaurant, name='Main')
+
+    def item(self, content):
+        item = MenuItem(menu=self.category, name=f'Dish {MenuItem.objects.count()}', unit_price=Decimal('10'))
+        item.photo.save('dish.JPG', ContentFile(content), save=False)
+        item.save()
+        return item
+
+    def test_same_bytes_are_stored_once(self):
+        first = self.item(b'photo')
+        second = self.item(b'photo')
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertRegex(first.photo.name, r'^cas/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(StoredFile.objects.get().ref_count, 2)
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'cas/tmp')))
+
+    def test_references_follow_the_models(self):
+        item = self.item(b'old')
+        old_name = item.photo.name
+        item.photo.save('new.jpg', ContentFile(b'new'))
+        self.assertEqual(StoredFile.objects.get(name=old_name).ref_count, 0)
+        self.assertEqual(StoredFile.objects.get(name=item.photo.name).ref_count, 1)
+        item.delete()
+        self.assertEqual(set(StoredFile.objects.values_list('ref_count', flat=True)), {0})
+
+    def test_gc_deletes_unreferenced_blobs_after_the_grace_period(self):
+        kept = self.item(b'kept').photo.name
+        item = self.item(b'gone')
+        gone = item.photo.name
+        item.delete()
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(default_storage.exists(gone))
+
+        StoredFile.objects.update(last_seen=timezone.now() - timedelta(days=2))
+        call_command('gc_media', stdout=StringIO())
+        self.assertFalse(default_storage.exists(gone))
+        self.assertFalse(StoredFile.objects.filter(name=gone).exists())
+        self.assertTrue(default_storage.exists(kept))
+
+    def test_field_delete_leaves_shared_blob(self):
+        kept = self.item(b'photo')
+        name = kept.photo.name
+        self.item(b'photo').photo.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get().ref_count, 1)
+        # The last reference leaves the file to gc_media
+        kept.photo.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get().ref_count, 0)
+
+    def test_name_must_fit_max_length(self):
+        with self.assertRaises(SuspiciousFileOperation):
+            default_storage.save('dish.jpg', ContentFile(b'photo'), max_length=50)
+        self.assertFalse(StoredFile.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'cas/tmp')))
+
+    def test_recount(self):
+        name = self.item(b'photo').photo.name
+        StoredFile.objects.update(ref_count=5)
+        call_command('gc_media', recount=True, stdout=StringIO())
+        self.assertEqual(StoredFile.objects.get(name=name).ref_count, 1)
+
+
+def png_bytes():
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        upload_dir = os.path.join(self.media_root, 'uploads')
+        settings = override_settings(CHUNKED_UPLOAD_DIR=upload_dir, CHUNKED_UPLOAD_MAX_PENDING=2)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        restaurant = Restaurant.objects.create(name='Plov', location='Tashkent', contact_number='+998', user=self.owner)
+        category = MenuCategory.objects.create(restaurant=restaurant, name='Main')
+        self.item = MenuItem.objects.create(menu=category, name='Plov', unit_price=Decimal('10'))
+        self.headers = self.auth(self.owner)
+        self.photo = png_bytes()
+
+    def auth(self, user):
+        return {'Authorization': f'Bearer {ClaimsAccessToken.for_user(user)}'}
+
+    def start(self, headers=None):
+        return self.client.post('/api/uploads/', {'filename': 'dish.png', 'size': len(self.photo)},
+                                content_type='application/json', headers=headers or self.headers)
+
+    def put(self, upload_id, start, end):
+        return self.client.put(
+            f'/api/uploads/{upload_id}/', self.photo[start:end + 1], content_type='application/octet-stream',
+            headers={**self.headers, 'Content-Range': f'bytes {start}-{end}/{len(self.photo)}'})
+
+    def attach(self, upload_id):
+        return self.client.patch(f'/categories/{self.item.menu_id}/menu-items/{self.item.id}/',
+                                 {'photo': str(upload_id)}, content_type='application/json', headers=self.headers)
+
+    def upload(self):
+        upload_id = self.start().json()['id']
+        self.put(upload_id, 0, len(self.photo) - 1)
+        return upload_id
+
+    def test_needs_authentication(self):
+        response = self.client.post('/api/uploads/', {'filename': 'dish.png', 'size': 10},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_resume_and_complete(self):
+        upload_id = self.start().json()['id']
+        middle = len(self.photo) // 2
+        self.assertEqual(self.put(upload_id, 0, middle - 1).json()['offset'], middle)
+        # A repeated piece is refused with where to resume from
+        response = self.put(upload_id, 0, middle - 1)
+        self.assertEqual((response.status_code, response.json()['offset']), (409, middle))
+        self.assertTrue(self.put(upload_id, middle, len(self.photo) - 1).json()['complete'])
+
+        response = self.client.get(f'/api/uploads/{upload_id}/', headers=self.headers)
+        self.assertEqual(response.json()['offset'], len(self.photo))
+        other = User.objects.create(username='other', email='other@example.com')
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}/', headers=self.auth(other)).status_code, 404)
+
+    def test_upload_is_attached_once(self):
+        upload_id = self.upload()
+        response = self.attach(upload_id)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.item.refresh_from_db()
+        with default_storage.open(self.item.photo.name) as file:
+            self.assertEqual(file.read(), self.photo)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'uploads')))
+        self.assertEqual(self.attach(upload_id).status_code, 400)
+
+    def test_upload_survives_failed_validation(self):
+        upload_id = self.upload()
+        response = self.client.patch(f'/categories/{self.item.menu_id}/menu-items/{self.item.id}/',
+                                     {'photo': str(upload_id), 'unit_price': 'free'},
+                                     content_type='application/json', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(ChunkedUpload.objects.filter(id=upload_id).exists())
+        self.assertEqual(self.attach(upload_id).status_code, 200)
+
+    def test_upload_is_taken_on_save(self):
+        upload_id = self.upload()
+        request = RequestFactory().patch('/')
+        request.user = self.owner
+        serializer = MenuItemsSerializer(self.item, data={'photo': str(upload_id)}, partial=True,
+                                         context={'request': request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        self.assertTrue(ChunkedUpload.objects.filter(id=upload_id).exists())
+        serializer.save()
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_others_uploads_cannot_be_attached(self):
+        other = User.objects.create(username='other', email='other@example.com')
+        upload_id = self.start(self.auth(other)).json()['id']
+        ChunkedUpload.objects.filter(id=upload_id).update(offset=len(self.photo))
+        self.assertEqual(self.attach(upload_id).status_code, 400)
+
+    def test_missing_file_is_not_found(self):
+        upload_id = self.start().json()['id']
+        os.unlink(ChunkedUpload.objects.get(id=upload_id).path)
+        self.assertEqual(self.put(upload_id, 0, 9).status_code, 404)
+
+    def test_pending_uploads_are_limited(self):
+        self.start()
+        self.start()
+        self.assertEqual(self.start().status_code, 429)
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revoked_tokens.clear()
+        self.addCleanup(revoked_tokens.clear)
+        self.user = User.objects.create_user(username='bob', email='bob@example.com', password='secret-pass-1')
+
+    def auth(self, user=None):
+        return {'Authorization': f'Bearer {ClaimsAccessToken.for_user(user or self.user)}'}
+
+    def test_me_patch_is_saved(self):
+        response = self.client.patch('/auth/users/me/', {'first_name': 'Robert'}, content_type='application/json',
+                                     headers=self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['first_name'], 'Robert')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, 'Robert')
+
+    def test_stale_cached_user_is_not_saved(self):
+        headers = self.auth()
+        self.client.get('/auth/users/me/', headers=headers)
+        User.objects.filter(pk=self.user.pk).update(last_name='Smith')
+        self.client.patch('/auth/users/me/', {'first_name': 'Robert'}, content_type='application/json',
+                          headers=headers)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.last_name), ('Robert', 'Smith'))
+
+    def test_password_hash_is_not_cached(self):
+        self.assertEqual(self.client.get('/auth/users/me/', headers=self.auth()).status_code, 200)
+        cached = cache.get(user_cache_key(self.user.pk))
+        self.assertEqual(cached['username'], 'bob')
+        self.assertNotIn('password', cached)
+
+    def test_role_change_revokes_earlier_tokens(self):
+        token = ClaimsAccessToken.for_user(self.user)
+        token['iat'] -= 5
+        headers = {'Authorization': f'Bearer {token}'}
+        self.user.role = User.ROLE.RESTAURANT
+        self.user.save()
+        self.assertEqual(self.client.get('/auth/users/me/', headers=headers).status_code, 401)
+        # A login right after the change gets a working token
+        self.assertEqual(self.client.get('/auth/users/me/', headers=self.auth()).status_code, 200)
+
+    def test_revocation_is_shared_through_the_database(self):
+        headers = self.auth()
+        RevokedToken.objects.create(jti=user_jti(self.user.pk), token_type=USER_TOKEN_TYPE,
+                                    expires_at=timezone.now() + timedelta(days=1))
+        RevokedToken.objects.filter(jti=user_jti(self.user.pk)).update(
+            created_at=timezone.now() + timedelta(seconds=2))
+        self.assertEqual(self.client.get('/auth/users/me/', headers=headers).status_code, 401)
+
+    def test_logged_out_tokens_are_rejected(self):
+        tokens = self.client.post('/api/auth/login/', {'username': 'bob', 'password': 'secret-pass-1'},
+                                  content_type='application/json').json()
+        headers = {'Authorization': f'Bearer {tokens["access"]}'}
+        response = self.client.post('/api/auth/logout/', {'refresh_token': tokens['refresh']},
+                                    content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        # Another worker, which reads the revocations from the database
+        revoked_tokens.clear()
+        self.assertEqual(self.client.get('/auth/users/me/', headers=headers).status_code, 401)
+        response = self.client.post('/auth/jwt/refresh/', {'refresh': tokens['refresh']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_inactive_user_is_rejected(self):
+        self.user.is_active = False
+        with self.assertLogs('rest_framework_simplejwt', 'WARNING'):
+            headers = self.auth()
+        self.assertEqual(self.client.get('/auth/users/me/', headers=headers).status_code, 401)
+
+
+@override_settings(PASSWORD_HASHING_WORKERS=1, PASSWORD_HASHING_QUEUE_SIZE=1, PASSWORD_HASHING_TIMEOUT=0.1)
+class PasswordHashingPoolTests(SimpleTestCase):
+    def setUp(self):
+        passwords._executor = None
+        self.addCleanup(setattr, passwords, '_executor', None)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def finish_pending(self):
+        self.release.set()
+        # One worker: once this runs, everything submitted before has finished
+        passwords._executor.submit(lambda: None).result()
+
+    def test_timed_out_hashing_keeps_its_slot(self):
+        calls = []
+        with self.assertRaises(Throttled):
+            passwords.run_hashing(self.release.wait)
+        with self.assertRaises(Throttled):
+            passwords.run_hashing(calls.append, 'queued')
+        self.finish_pending()
+        self.assertEqual(calls, [])
+        self.assertEqual(passwords.run_hashing(len, 'ab'), 2)
@@ -1,15 +1,34 @@
+import fcntl
+import os
+import re
+import shutil
+
+from django.conf import settings
 from django.contrib.auth import authenticate, login
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import generics
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import UntypedToken
 from rest_framework.views import APIView
 from rest_framework import status
 
-from apps.core.models import User
-from apps.core.serializers import LoginSerializer, RegisterRestaurantSerializer, UserSerializer, RegistrationSerializer
+from apps.core.models import User, ChunkedUpload
+from apps.core.serializers import LoginSerializer, RegisterRestaurantSerializer, UserSerializer, RegistrationSerializer, \
+    ChunkedUploadSerializer
 from apps.restaurant.models import Customer, Restaurant
+from reservio.authentication import ClaimsAccessToken, ClaimsRefreshToken, CUSTOMER_CLAIM, RESTAURANT_CLAIM
+from reservio.db import connection_stats
+from reservio.db.router import replica_health
+from reservio.querycount import endpoint_stats
+from reservio.passwords import authenticate_user, log_in
+from reservio.profiling import PROFILE_NAME_RE, list_profiles
+from reservio.revocation import revoke_token
 
 
 from rest_framework.response import Response
@@ -27,21 +46,21 @@ class LoginView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
         username = serializer.validated_data.get('username')
         password = serializer.validated_data.get('password')
-        user = authenticate(username=username, password=password)
+        user = authenticate_user(request, username, password)
         if user is None:
             raise ValidationError({'password': 'Username and/or password is incorrect'})
-        login(request, user)
+        log_in(request, user)
         serializer = UserSerializer(user)
-        refresh = AccessToken.for_user(user=user)
+        refresh = ClaimsRefreshToken.for_user(user=user)
         data = {
-            "access": str(refresh),
+            "access": str(refresh.access_token),
             "refresh": str(refresh),
             "user": serializer.data
         }
         if user.role == User.ROLE.CUSTOMER:
-            data['customer'] = user.customer.id
+            data['customer'] = refresh[CUSTOMER_CLAIM]
         elif user.role == User.ROLE.RESTAURANT:
-            data['restaurant'] = user.restaurant.id
+            data['restaurant'] = refresh[RESTAURANT_CLAIM]
         return Response(data)
 
 
@@ -54,7 +73,7 @@ class RegistrationView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         user = User.objects.get(id=serializer.data['user_id'])
-        token = AccessToken.for_user(user)
+        token = ClaimsAccessToken.for_user(user)
         data = {"token": str(token), "data": serializer.data}
 
         return Response(data, status=status.HTTP_201_CREATED)
@@ -69,7 +88,7 @@ class RestaurantRegistrationView(generics.CreateAPIView):
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
         user = User.objects.get(id=serializer.data['user_id'])
-        token = AccessToken.for_user(user)
+        token = ClaimsAccessToken.for_user(user)
         data = {"token": str(token), "data": serializer.data}
 
         return Response(data, status=status.HTTP_201_CREATED)
@@ -77,7 +96,7 @@ class RestaurantRegistrationView(generics.CreateAPIView):
 
 def perform_create(self, serializer):
     user = serializer.save()
-    refresh = AccessToken.for_user(user)
+    refresh = ClaimsAccessToken.for_user(user)
     user_data = UserSerializer(user).data
     data = {
         "access": str(refresh),
@@ -105,13 +124,145 @@ class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        refresh_token = request.data.get('refresh_token')
+        if not refresh_token:
+            return Response({"error": "Refresh token not provided."}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            refresh_token = request.data.get('refresh_token')
-            if refresh_token:
-                token = AccessToken(refresh_token)
-                token.blacklist()
-                return Response({"message": "Logout successful."}, status=status.HTTP_205_RESET_CONTENT)
+            # Untyped, because older logins handed out an access token as "refresh".
+            token = UntypedToken(refresh_token)
+        except TokenError as e:
+            return Response({"error": "Failed to logout.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if str(token.get('user_id')) != str(request.user.id):
+            return Response({"error": "Failed to logout.", "details": "Token belongs to another user."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        revoke_token(token)
+        revoke_token(request.auth)
+        return Response({"message": "Logout successful."}, status=status.HTTP_205_RESET_CONTENT)
+
+
+class ChunkedUploadView(APIView):
+    """
+    Resumable uploads for large photos.
+
+    POST {filename, size} starts an upload (or POST a multipart ``file`` to
+    upload it in one go). Each PUT sends the next piece as the raw request
+    body with ``Content-Range: bytes <start>-<end>/<size>``; GET returns the
+    current ``offset`` to resume from. A complete upload's ``id`` can be sent
+    instead of a file to any StreamedImageField, once. Uploads belong to the
+    user who started them, who may have CHUNKED_UPLOAD_MAX_PENDING at a time.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, MultiPartParser]
+    content_range_re = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+    read_size = 64 * 1024
+
+    def get_upload(self, request, pk):
+        return get_object_or_404(ChunkedUpload, pk=pk, user_id=request.user.pk)
+
+    def get(self, request, pk):
+        return Response(ChunkedUploadSerializer(self.get_upload(request, pk)).data)
+
+    def post(self, request):
+        pending = ChunkedUpload.objects.filter(user_id=request.user.pk).count()
+        if pending >= settings.CHUNKED_UPLOAD_MAX_PENDING:
+            return Response({"error": "Too many unfinished uploads."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        file = request.FILES.get('file')
+        data = {'filename': file.name, 'size': file.size} if file else request.data
+        serializer = ChunkedUploadSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.save(user_id=request.user.pk)
+        os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+        if file is None:
+            open(upload.path, 'wb').close()
+        else:
+            if hasattr(file, 'temporary_file_path'):
+                shutil.move(file.temporary_file_path(), upload.path)
             else:
-                return Response({"error": "Refresh token not provided."}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response({"error": "Failed to logout.", "details": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+                with open(upload.path, 'wb') as destination:
+                    for chunk in file.chunks():
+                        destination.write(chunk)
+            upload.offset = upload.size
+            upload.save(update_fields=['offset'])
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    def put(self, request, pk):
+        match = self.content_range_re.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({"error": "Content-Range header is required."}, status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = map(int, match.groups())
+
+        upload = self.get_upload(request, pk)
+        if total != upload.size or end < start or end >= upload.size:
+            return Response({"error": "Invalid Content-Range."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Pieces are serialized with a lock on the file rather than a row
+        # lock, so no transaction stays open while a slow client streams.
+        try:
+            destination = open(upload.path, 'r+b')
+        except FileNotFoundError:
+            # Attached or cleaned up by gc_media meanwhile
+            raise Http404
+        with destination:
+            fcntl.flock(destination, fcntl.LOCK_EX)
+            upload.refresh_from_db(fields=['offset'])
+            if start != upload.offset:
+                # Out of order or repeated piece: tell the client where to resume.
+                return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_409_CONFLICT)
+
+            remaining = end - start + 1
+            destination.seek(start)
+            while remaining > 0:
+                chunk = request.stream.read(min(self.read_size, remaining)) if request.stream else b''
+                if not chunk:
+                    break
+                destination.write(chunk)
+                remaining -= len(chunk)
+            destination.truncate()
+            if remaining:
+                return Response({"error": "Request body is shorter than Content-Range."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            upload.offset = end + 1
+            upload.save(update_fields=['offset'])
+        return Response(ChunkedUploadSerializer(upload).data)
+
+
+class DatabaseStatsView(APIView):
+    """
+    Connection counters of the worker process that handles the request:
+    connects (new connections, or checkouts from the native pool), time
+    spent connecting or waiting for the pool, and requests that reused an
+    open connection. ``endpoints`` has the query count and DB time per view,
+    ``replicas`` the last health check of each read replica.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({**connection_stats(), 'endpoints': endpoint_stats.snapshot(),
+                         'replicas': replica_health.snapshot()})
+
+
+class ProfileListView(APIView):
+    """Profiles saved by ProfilingMiddleware, newest first."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        profiles = []
+        for name in list_profiles():
+            try:
+                size = os.path.getsize(os.path.join(settings.PROFILE_DIR, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({'name': name, 'size': size,
+                             'url': request.build_absolute_uri(reverse('profile', args=[name]))})
+        return Response(profiles)
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = os.path.join(settings.PROFILE_DIR, name)
+        if not PROFILE_NAME_RE.match(name) or not os.path.exists(path):
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
@@ -0,0 +1,213 @@
+"""
+Async versions of the hot read endpoints, served under ``async/`` by an ASGI
+server (``uvicorn reservio.asgi:application``).
+
+They return the same JSON as the DRF views they mirror. Queries that don't
+depend on each other are run at the same time with ``gather_queries``.
+"""
+import asyncio
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Q, Value
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .models import Restaurant, Review, ReviewReply, Table, Reservation, MenuCategory, MenuItem
+from .pagination import DefaultPagination
+
+RESTAURANT_FIELDS = [
+    'id', 'name', 'slug', 'location', 'description', 'photos', 'contact_number', 'website',
+    'instagram', 'telegram', 'opening_time', 'closing_time', 'is_halal',
+]
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder)
+
+
+def not_found(model):
+    return json_response({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+def run_query(func):
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+async def gather_queries(*funcs):
+    """
+    Run independent queries at the same time.
+
+    Django's async ORM runs every query on one shared thread, one after the
+    other. Each function here gets its own worker thread, and with it its
+    own database connection, so the queries really overlap.
+    """
+    return await asyncio.gather(*[sync_to_async(run_query, thread_sensitive=False)(func) for func in funcs])
+
+
+def file_url(name, request=None):
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def restaurants_queryset():
+    return Restaurant.objects.annotate(
+        avg_rating=Coalesce(Avg('reviews__rating'), Value(0.0)),
+        reviews_count=Count('reviews'),
+    )
+
+
+def restaurant_cuisines(restaurant_ids):
+    cuisines = {restaurant_id: [] for restaurant_id in restaurant_ids}
+    rows = Restaurant.cuisines.through.objects.filter(restaurant_id__in=restaurant_ids) \
+        .order_by('cuisine__name').values_list('restaurant_id', 'cuisine_id')
+    for restaurant_id, cuisine_id in rows:
+        cuisines[restaurant_id].append(cuisine_id)
+    return cuisines
+
+
+def restaurant_data(row, cuisines, request):
+    data = {field: row[field] for field in RESTAURANT_FIELDS}
+    data['photos'] = file_url(row['photos'], request)
+    # RestaurantSerializer.get_rating returns an int 0 without reviews
+    data['rating'] = row['avg_rating'] if row['reviews_count'] else 0
+    data['num_reviews'] = row['reviews_count']
+    data['cuisines'] = cuisines
+    # same key order as RestaurantSerializer
+    return {key: data[key] for key in [
+        'id', 'name', 'slug', 'location', 'description', 'photos', 'contact_number', 'website',
+        'instagram', 'telegram', 'opening_time', 'closing_time', 'rating', 'num_reviews', 'is_halal', 'cuisines']}
+
+
+async def restaurant_list(request):
+    """Same as GET restaurants/ (filters: cuisines, is_halal, search; page)."""
+    queryset = Restaurant.objects.all()
+    if request.GET.get('cuisines'):
+        queryset = queryset.filter(cuisines=request.GET['cuisines'])
+    if request.GET.get('is_halal') in ('true', 'True', '1', 'false', 'False', '0'):
+        queryset = queryset.filter(is_halal=request.GET['is_halal'] in ('true', 'True', '1'))
+    for term in request.GET.get('search', '').replace(',', ' ').split():
+        queryset = queryset.filter(
+            Q(name__icontains=term) | Q(location__icontains=term) | Q(cuisines__name__icontains=term))
+    ids = queryset.values('id').distinct()
+
+    page_size = DefaultPagination.page_size
+    try:
+        page = int(request.GET.get('page', 1))
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return json_response({'detail': 'Invalid page.'}, status=404)
+    offset = (page - 1) * page_size
+
+    count, rows = await gather_queries(
+        lambda: Restaurant.objects.filter(id__in=ids).count(),
+        lambda: list(restaurants_queryset().filter(id__in=ids)
+                     .order_by('-avg_rating', 'id')
+                     .values(*RESTAURANT_FIELDS, 'avg_rating', 'reviews_count')[offset:offset + page_size]),
+    )
+    if not rows and page != 1:
+        return json_response({'detail': 'Invalid page.'}, status=404)
+
+    cuisines = await sync_to_async(restaurant_cuisines)([row['id'] for row in rows])
+    url = request.build_absolute_uri()
+    previous_link = None
+    if page > 1:
+        previous_link = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+    return json_response({
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if offset + page_size < count else None,
+        'previous': previous_link,
+        'results': [restaurant_data(row, cuisines[row['id']], request) for row in rows],
+    })
+
+
+async def restaurant_detail(request, pk):
+    """Same as GET restaurants/<pk>/."""
+    row, cuisines = await gather_queries(
+        lambda: restaurants_queryset().filter(id=pk).values(*RESTAURANT_FIELDS, 'avg_rating', 'reviews_count').first(),
+        lambda: restaurant_cuisines([pk])[pk],
+    )
+    if row is None:
+        return not_found(Restaurant)
+    return json_response(restaurant_data(row, cuisines, request))
+
+
+async def menu_categories(request, restaurant_id):
+    """Same as GET restaurants/<restaurant_id>/menu-categories/."""
+    exists, categories = await gather_queries(
+        lambda: Restaurant.objects.filter(id=restaurant_id).exists(),
+        lambda: list(MenuCategory.objects.filter(restaurant_id=restaurant_id).values('id', 'restaurant', 'name')),
+    )
+    if not exists:
+        return not_found(Restaurant)
+    return json_response({'status': 'ok', 'data': categories})
+
+
+async def menu_items(request, category_id):
+    """Same as GET categories/<category_id>/menu-items/."""
+    exists, items = await gather_queries(
+        lambda: MenuCategory.objects.filter(id=category_id).exists(),
+        lambda: list(MenuItem.objects.filter(menu_id=category_id).values(
+            'id', 'photo', 'name', 'slug', 'description', 'unit_price', 'menu')),
+    )
+    if not exists:
+        return not_found(MenuCategory)
+    for item in items:
+        item['photo'] = file_url(item['photo'])
+    return json_response({'status': 'ok', 'data': items})
+
+
+async def reviews(request, restaurant_id):
+    """Same as GET restaurants/<restaurant_id>/reviews/."""
+    review_rows, reply_rows = await gather_queries(
+        lambda: list(Review.objects.filter(restaurant_id=restaurant_id).values(
+            'id', 'restaurant', 'customer__user__first_name', 'rating', 'comment', 'timestamp')),
+        lambda: list(ReviewReply.objects.filter(review__restaurant_id=restaurant_id).order_by('id').values(
+            'id', 'restaurant', 'customer', 'review', 'reply_text', 'timestamp')),
+    )
+    replies = {}
+    for reply in reply_rows:
+        replies.setdefault(reply['review'], []).append(reply)
+    data = []
+    for review in review_rows:
+        review['customer'] = review.pop('customer__user__first_name')
+        review['review_replies'] = replies.get(review['id'], [])
+        data.append({key: review[key] for key in
+                     ['id', 'restaurant', 'customer', 'rating', 'comment', 'timestamp', 'review_replies']})
+    return json_response(data)
+
+
+async def availability(request, restaurant_id):
+    """
+    Tables of a restaurant with the time slots already reserved on ``date``
+    (YYYY-MM-DD, default today).
+    """
+    try:
+        day = date.fromisoformat(request.GET['date']) if 'date' in request.GET else date.today()
+    except ValueError:
+        return json_response({'date': ['Date has wrong format. Use YYYY-MM-DD.']}, status=400)
+
+    tables, reservations = await gather_queries(
+        lambda: list(Table.objects.filter(restaurant_id=restaurant_id).order_by('number')
+                     .values('id', 'number', 'capacity')),
+        lambda: list(Reservation.objects.filter(restaurant_id=restaurant_id, date=day)
+                     .exclude(status=Reservation.REJECTED).order_by('start_time')
+                     .values('table_id', 'start_time', 'end_time')),
+    )
+    reserved = {}
+    for reservation in reservations:
+        reserved.setdefault(reservation['table_id'], []).append(
+            {'start_time': reservation['start_time'], 'end_time': reservation['end_time']})
+    for table in tables:
+        table['reserved'] = reserved.get(table['id'], [])
+    return json_response({'date': day, 'tables': tables})
@@ -0,0 +1,87 @@
+"""
+Row serializers (see reservio.fastserializers) giving the same output as
+the DRF serializers of the hot list endpoints. Used when FAST_SERIALIZERS
+is on.
+"""
+from django.db.models import Count, Sum
+
+from reservio.fastserializers import RowSerializer, decimal, file_url, iso_datetime, iso_time
+from .models import MenuItem, Restaurant, Review, ReviewReply
+
+
+class RestaurantRowSerializer(RowSerializer):
+    """RestaurantSerializer, with the request for absolute photo URLs."""
+    fields = ['id', 'name', 'slug', 'location', 'description', 'photos', 'contact_number', 'website',
+              'instagram', 'telegram', 'opening_time', 'closing_time', 'rating', 'num_reviews', 'is_halal', 'cuisines']
+    sources = {'rating': None, 'num_reviews': None, 'cuisines': None}
+
+    def get_converters(self):
+        return {
+            'photos': file_url(Restaurant._meta.get_field('photos').storage, self.request),
+            'opening_time': iso_time,
+            'closing_time': iso_time,
+        }
+
+    def add_related(self, data, rows):
+        ids = [row['id'] for row in data]
+        reviews = {
+            restaurant_id: (total, count) for restaurant_id, total, count in
+            Review.objects.filter(restaurant_id__in=ids).order_by().values('restaurant_id')
+            .annotate(total=Sum('rating'), count=Count('id')).values_list('restaurant_id', 'total', 'count')
+        }
+        cuisines = {restaurant_id: [] for restaurant_id in ids}
+        for restaurant_id, cuisine_id in Restaurant.cuisines.through.objects.filter(restaurant_id__in=ids) \
+                .order_by('cuisine__name').values_list('restaurant_id', 'cuisine_id'):
+            cuisines[restaurant_id].append(cuisine_id)
+        for row in data:
+            total, count = reviews.get(row['id'], (0, 0))
+            # RestaurantSerializer.get_rating returns an int 0 without reviews
+            row['rating'] = total / count if count else 0
+            row['num_reviews'] = count
+            row['cuisines'] = cuisines[row['id']]
+
+
+class ReservationRowSerializer(RowSerializer):
+    """ReservationSerializer, which gives the model's values as they are plus the restaurant name."""
+    fields = ['id', 'restaurant_id', 'customer_id', 'table_id', 'date', 'start_time', 'end_time', 'num_guests',
+              'special_requests', 'status', 'restaurant']
+    sources = {'restaurant': 'restaurant__name'}
+
+
+class MenuItemRowSerializer(RowSerializer):
+    """MenuItemsSerializer."""
+    fields = ['id', 'photo', 'name', 'slug', 'description', 'unit_price', 'menu']
+    sources = {'menu': 'menu_id'}
+
+    def get_converters(self):
+        return {
+            'photo': file_url(MenuItem._meta.get_field('photo').storage, self.request),
+            'unit_price': decimal(MenuItem._meta.get_field('unit_price').decimal_places),
+        }
+
+
+class ReviewReplyRowSerializer(RowSerializer):
+    """ReviewReplySerializer."""
+    fields = ['id', 'restaurant', 'customer', 'review', 'reply_text', 'timestamp']
+    sources = {'restaurant': 'restaurant_id', 'customer': 'customer_id', 'review': 'review_id'}
+
+    def get_converters(self):
+        return {'timestamp': iso_datetime}
+
+
+class ReviewRowSerializer(RowSerializer):
+    """ReviewSerializer, with the replies of all reviews from one more query."""
+    fields = ['id', 'restaurant', 'customer', 'rating', 'comment', 'timestamp', 'review_replies']
+    sources = {'restaurant': 'restaurant_id', 'customer': 'customer__user__first_name', 'review_replies': None}
+
+    def get_converters(self):
+        return {'timestamp': iso_datetime}
+
+    def add_related(self, data, rows):
+        replies = {row['id']: [] for row in data}
+        serializer = ReviewReplyRowSerializer(self.request)
+        reply_rows = serializer.values(ReviewReply.objects.filter(review_id__in=list(replies)).order_by('id'))
+        for reply in serializer.serialize(reply_rows):
+            replies[reply['review']].append(reply)
+        for row in data:
+            row['review_replies'] = replies[row['id']]
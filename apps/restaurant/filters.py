@@ -1,5 +1,5 @@
-from django_filters.rest_framework import FilterSet
-from .models import Restaurant
+from django_filters.rest_framework import DateFilter, FilterSet, NumberFilter
+from .models import Reservation, Restaurant
 
 
 class RestaurantFilter(FilterSet):
@@ -8,4 +8,13 @@ class RestaurantFilter(FilterSet):
         fields = {
             'cuisines': ['exact'],
             'is_halal': ['exact'],
-        }
\ No newline at end of file
+        }
+
+class ReservationFilter(FilterSet):
+    start = DateFilter(field_name='date', lookup_expr='gte')
+    end = DateFilter(field_name='date', lookup_expr='lte')
+    table = NumberFilter(field_name='table_id')
+
+    class Meta:
+        model = Reservation
+        fields = ['status']
@@ -131,6 +131,14 @@ class Reservation(models.Model):
     status = models.CharField(max_length=8, blank=True,
                               null=True, choices=STATUS_CHOICES, default=WAITING)
 
+    class Meta:
+        indexes = [
+            # A restaurant's reservations in date order (exports, listings)
+            models.Index(fields=['restaurant', 'date', 'start_time', 'id'], name='reservation_date_idx'),
+            # A customer's upcoming and past reservations
+            models.Index(fields=['customer', 'date', 'start_time', 'id'], name='reservation_customer_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.customer} - {self.table} - {self.date} {self.start_time}-{self.end_time}'
 
@@ -189,6 +197,50 @@ class Reservation(models.Model):
         })
 
 
+
+class ReservationReminder(models.Model):
+    """One reminder of a reservation, sent by `manage.py send_reminders` (see apps.restaurant.reminders)."""
+    DAY_BEFORE = '24h'
+    HOURS_BEFORE = '2h'
+    KIND_CHOICES = [
+        (DAY_BEFORE, '24 hours before'),
+        (HOURS_BEFORE, '2 hours before'),
+    ]
+    PENDING = 'pending'
+    SENT = 'sent'
+    SKIPPED = 'skipped'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (SKIPPED, 'Skipped'),
+        (FAILED, 'Failed'),
+    ]
+
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='reminders')
+    kind = models.CharField(max_length=3, choices=KIND_CHOICES)
+    due_at = models.DateTimeField()
+    status = models.CharField(max_length=7, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['reservation', 'kind'], name='unique_reservation_reminder'),
+        ]
+        indexes = [
+            # Only pending reminders are looked up by due time, so sent ones
+            # don't grow the index.
+            models.Index(fields=['due_at'], condition=models.Q(status='pending'), name='reminder_pending_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} reminder of {self.reservation_id} ({self.status})'
+
+
 class MenuCategory(models.Model):
     restaurant = models.ForeignKey(
         Restaurant, on_delete=models.CASCADE, related_name='menu')
@@ -294,3 +346,46 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Payment of {self.amount} made by {self.customer.first_name} at {self.timestamp}"
+
+
+class RestaurantDailyStats(models.Model):
+    """
+    Reservations and revenue of a restaurant per day, kept up to date by
+    apps.restaurant.stats. Reservations count on the day they are for,
+    payments on the day they were made.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    reservations = models.PositiveIntegerField(default=0)
+    accepted = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    # Guests of accepted reservations
+    covers = models.PositiveIntegerField(default=0)
+    # Table time taken by accepted reservations
+    booked_minutes = models.PositiveIntegerField(default=0)
+    payments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date'], name='unique_restaurant_daily_stats'),
+        ]
+
+
+class RestaurantHourlyStats(models.Model):
+    """The same per hour; a reservation counts in the hour it starts, its table time in every hour it covers."""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='hourly_stats')
+    date = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    reservations = models.PositiveIntegerField(default=0)
+    accepted = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    covers = models.PositiveIntegerField(default=0)
+    booked_minutes = models.PositiveIntegerField(default=0)
+    payments = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['restaurant', 'date', 'hour'], name='unique_restaurant_hourly_stats'),
+        ]
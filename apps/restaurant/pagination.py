@@ -1,5 +1,95 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class DefaultPagination(PageNumberPagination):
-  page_size = 10
\ No newline at end of file
+  page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a unique ordering, e.g. ('date', 'start_time', 'id').
+
+    The cursor holds the ordering values of the last row of the page, and the
+    next page starts after them, so every page is one range scan of an index
+    on the ordering however deep it is, and rows added meanwhile neither
+    shift nor repeat rows. Works on querysets of instances and of values().
+    """
+    ordering = ('id',)
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.next_position = self.position(rows[page_size - 1]) if len(rows) > page_size else None
+        return rows[:page_size]
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def after(self, position):
+        """Rows past ``position``: (a > x) or (a = x and b > y) or ..."""
+        conditions = []
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            equal = {other.lstrip('-'): position[other.lstrip('-')] for other in self.ordering[:index]}
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': position[name]}))
+        return reduce(Q.__or__, conditions)
+
+    def position(self, row):
+        names = [field.lstrip('-') for field in self.ordering]
+        if isinstance(row, dict):
+            return {name: row[name] for name in names}
+        return {name: getattr(row, name) for name in names}
+
+    def encode_cursor(self, position):
+        values = json.dumps([position[field.lstrip('-')] for field in self.ordering], cls=DjangoJSONEncoder)
+        return urlsafe_b64encode(values.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            names = [field.lstrip('-') for field in self.ordering]
+            if not isinstance(values, list) or len(values) != len(names):
+                raise ValueError
+            return {name: model._meta.get_field(name).to_python(value) for name, value in zip(names, values)}
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -0,0 +1,181 @@
+"""
+Reservation reminders, 24 and 2 hours before the reservation starts.
+
+Saving a reservation schedules its ReservationReminder rows (see signals);
+``manage.py send_reminders`` then only looks at pending rows that are due,
+through a partial index on due_at, never at the reservations themselves.
+
+Each round claims a batch of due reminders: on Postgres with SELECT ... FOR
+UPDATE SKIP LOCKED, so several senders share the work without waiting on
+each other, elsewhere with a conditional UPDATE of locked_until that only
+one of them can win. The batch is split over REMINDER_CONCURRENCY threads,
+each sending its part over its own connection of EMAIL_DELIVERY_BACKEND.
+
+A reminder is recorded as sent once: only the sender holding its lock can
+move it out of pending. Its Message-ID is derived from the reminder, so if a
+sender dies after sending but before recording, the copy sent again once its
+lock expires carries the same Message-ID and mail clients show it once.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Reservation, ReservationReminder
+
+logger = logging.getLogger('reservio.reminders')
+
+# Kind and how long before the start it is sent
+REMINDERS = [
+    (ReservationReminder.DAY_BEFORE, timedelta(hours=24)),
+    (ReservationReminder.HOURS_BEFORE, timedelta(hours=2)),
+]
+
+
+def reservation_start(reservation):
+    return timezone.make_aware(datetime.combine(reservation.date, reservation.start_time))
+
+
+def reminders_for(reservation, now):
+    starts = reservation_start(reservation)
+    return [
+        ReservationReminder(reservation_id=reservation.id, kind=kind, due_at=starts - before)
+        for kind, before in REMINDERS
+        if starts - before > now
+    ]
+
+
+def schedule_reminders(reservation):
+    """Creates or moves the pending reminders of a reservation after it was saved."""
+    pending = ReservationReminder.objects.filter(reservation_id=reservation.id, status=ReservationReminder.PENDING)
+    if reservation.status == Reservation.REJECTED:
+        pending.delete()
+        return
+    reminders = reminders_for(reservation, timezone.now())
+    kinds = [reminder.kind for reminder in reminders]
+    # A reservation moved closer than a reminder's lead time loses that reminder
+    pending.exclude(kind__in=kinds).delete()
+    ReservationReminder.objects.bulk_create(
+        reminders, update_conflicts=True, unique_fields=['reservation', 'kind'], update_fields=['due_at'])
+
+
+def backfill_reminders(batch_size=2000):
+    """Schedules reminders for upcoming reservations saved without them (e.g. bulk inserts)."""
+    now = timezone.now()
+    upcoming = Reservation.objects.filter(date__gte=now.date() - timedelta(days=1)) \
+        .exclude(status=Reservation.REJECTED).filter(reminders__isnull=True) \
+        .only('id', 'date', 'start_time').order_by('id')
+    created = 0
+    batch = []
+    for reservation in upcoming.iterator(chunk_size=batch_size):
+        batch.extend(reminders_for(reservation, now))
+        if len(batch) >= batch_size:
+            created += len(ReservationReminder.objects.bulk_create(batch, ignore_conflicts=True))
+            batch = []
+    if batch:
+        created += len(ReservationReminder.objects.bulk_create(batch, ignore_conflicts=True))
+    return created
+
+
+def claim(worker, limit, now=None):
+    now = now or timezone.now()
+    unlocked = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    with transaction.atomic():
+        due = ReservationReminder.objects.filter(unlocked, status=ReservationReminder.PENDING, due_at__lte=now) \
+            .order_by('due_at')
+        if connections['default'].features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        ReservationReminder.objects.filter(unlocked, id__in=ids, status=ReservationReminder.PENDING).update(
+            locked_by=worker, locked_until=now + timedelta(seconds=settings.REMINDER_LOCK_TIMEOUT),
+            attempts=F('attempts') + 1)
+    return list(
+        ReservationReminder.objects.filter(id__in=ids, locked_by=worker, status=ReservationReminder.PENDING)
+        .select_related('reservation__restaurant', 'reservation__customer__user')
+    )
+
+
+def message_id_domain():
+    # The same on every host, unlike the default Message-ID's
+    return parseaddr(settings.DEFAULT_FROM_EMAIL)[1].rpartition('@')[2] or 'localhost'
+
+
+def build_message(reminder):
+    reservation = reminder.reservation
+    user = reservation.customer.user
+    when = 'tomorrow' if reminder.kind == ReservationReminder.DAY_BEFORE else 'in 2 hours'
+    return EmailMessage(
+        subject=f'Reminder: {reservation.restaurant.name} {when} at {reservation.start_time:%H:%M}',
+        body=(f'Hello {user.first_name or user.username},\n\n'
+              f'This is a reminder of your reservation at {reservation.restaurant.name} on '
+              f'{reservation.date:%d-%m-%Y} at {reservation.start_time:%H:%M} for {reservation.num_guests}.\n'),
+        to=[user.email],
+        headers={'Message-ID': f'<reminder-{reminder.id}@{message_id_domain()}>'},
+    )
+
+
+def should_skip(reminder, now):
+    reservation = reminder.reservation
+    return (reservation.status == Reservation.REJECTED or not reservation.customer.user.email
+            or reservation_start(reservation) <= now)
+
+
+def send_part(reminders):
+    """Sends reminders over one connection; returns {reminder id: error or None}."""
+    results = {}
+    with get_connection(settings.EMAIL_DELIVERY_BACKEND) as connection:
+        for reminder in reminders:
+            try:
+                connection.send_messages([build_message(reminder)])
+                results[reminder.id] = None
+            except Exception as e:
+                results[reminder.id] = e
+    return results
+
+
+def send(reminders, concurrency):
+    parts = [reminders[i::concurrency] for i in range(concurrency) if reminders[i::concurrency]]
+    results = {}
+    with ThreadPoolExecutor(max_workers=len(parts) or 1, thread_name_prefix='reminders') as executor:
+        for part, future in zip(parts, [executor.submit(send_part, part) for part in parts]):
+            try:
+                results.update(future.result())
+            except Exception as e:
+                # The connection could not be opened
+                results.update((reminder.id, e) for reminder in part)
+    return results
+
+
+def record(worker, reminders, results, skipped, now):
+    mine = ReservationReminder.objects.filter(locked_by=worker, status=ReservationReminder.PENDING)
+    sent = [reminder_id for reminder_id, error in results.items() if error is None]
+    mine.filter(id__in=sent).update(status=ReservationReminder.SENT, sent_at=now, locked_until=None)
+    mine.filter(id__in=skipped).update(status=ReservationReminder.SKIPPED, locked_until=None)
+    failed = [reminder for reminder in reminders if results.get(reminder.id) is not None]
+    for reminder in failed:
+        error = results[reminder.id]
+        given_up = reminder.attempts >= settings.REMINDER_MAX_ATTEMPTS
+        delay = settings.REMINDER_RETRY_DELAY * 2 ** (reminder.attempts - 1)
+        mine.filter(id=reminder.id).update(
+            status=ReservationReminder.FAILED if given_up else ReservationReminder.PENDING,
+            locked_by='', locked_until=None if given_up else now + timedelta(seconds=delay),
+            last_error=f'{type(error).__name__}: {error}')
+    if failed:
+        logger.warning('%d of %d reminders failed, e.g. %s', len(failed), len(reminders), results[failed[0].id])
+    return len(sent), len(skipped), len(failed)
+
+
+def send_due_reminders(worker, batch_size, concurrency):
+    """One round: claims, sends and records a batch. Returns (sent, skipped, failed)."""
+    now = timezone.now()
+    reminders = claim(worker, batch_size, now)
+    skipped = {reminder.id for reminder in reminders if should_skip(reminder, now)}
+    to_send = [reminder for reminder in reminders if reminder.id not in skipped]
+    results = send(to_send, concurrency) if to_send else {}
+    return record(worker, to_send, results, skipped, timezone.now())
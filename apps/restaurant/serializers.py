@@ -1,5 +1,6 @@
 from datetime import datetime
 from rest_framework import serializers
+from reservio.fields import ChunkedUploadsMixin, StreamedImageField
 from .models import Restaurant, Cuisine, Review, ReviewReply, Table, Reservation, Customer, Payment, PaymentStatus, MenuCategory, MenuItem
 
 
@@ -136,9 +137,9 @@ class ReservationSerializer(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
-        representation = instance.__dict__
+        # The field values, without Django's and the signals' private attributes
+        representation = {key: value for key, value in instance.__dict__.items() if not key.startswith('_')}
         representation['restaurant'] = instance.restaurant.name
-        del representation['_state']
         return representation
 
     def validate(self, data):
@@ -178,7 +179,9 @@ class MenuCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'restaurant', 'name']
 
 
-class MenuItemsSerializer(serializers.ModelSerializer):
+class MenuItemsSerializer(ChunkedUploadsMixin, serializers.ModelSerializer):
+    photo = StreamedImageField(required=False)
+
     class Meta:
         model = MenuItem
         fields = '__all__'
@@ -1,7 +1,65 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 from apps.core.models import User
-from apps.restaurant.models import Customer, Restaurant
+from apps.restaurant.models import Cuisine, Customer, MenuCategory, MenuItem, Payment, Reservation, Restaurant, Review
+from apps.restaurant.reminders import schedule_reminders
+from apps.restaurant.tasks import queue_stats_refresh
+from reservio.compression import invalidate
+
+
+@receiver(post_save, sender=Reservation)
+def update_reminders(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_reminders(instance)
+
+
+@receiver(post_init, sender=Reservation)
+def remember_stats_day(sender, instance, **kwargs):
+    # The day it counted on before, to refresh too if it moves. Read the raw
+    # values: loading a deferred field here would recurse into post_init.
+    instance._stats_day = (instance.__dict__.get('restaurant_id'), instance.__dict__.get('date'))
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def refresh_reservation_stats(sender, instance, raw=False, **kwargs):
+    if not raw:
+        queue_stats_refresh(instance._stats_day, (instance.restaurant_id, instance.date))
+        instance._stats_day = (instance.restaurant_id, instance.date)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_payment_stats(sender, instance, raw=False, **kwargs):
+    if raw or instance.timestamp is None:
+        return
+    restaurant_id = instance.restaurant_id
+    if restaurant_id is None and instance.reservation_id:
+        restaurant_id = Reservation.objects.filter(id=instance.reservation_id) \
+            .values_list('restaurant_id', flat=True).first()
+    queue_stats_refresh((restaurant_id, timezone.localdate(instance.timestamp)))
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Cuisine)
+@receiver(m2m_changed, sender=Restaurant.cuisines.through)
+def invalidate_restaurant_lists(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate('restaurants')
+
+
+@receiver(post_save, sender=MenuCategory)
+@receiver(post_delete, sender=MenuCategory)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_menus(sender, raw=False, **kwargs):
+    if not raw:
+        invalidate('menus')
 
 
 # @receiver(post_save, sender=User)
@@ -0,0 +1,154 @@
+"""
+Rollups for the owner dashboard (restaurants/<id>/stats/).
+
+RestaurantDailyStats and RestaurantHourlyStats hold, per restaurant and day
+(and hour), what would otherwise be aggregated from every reservation and
+payment on each request. A day's rows are always recomputed whole from its
+reservations and payments, so a refresh can run any number of times.
+
+Saving or deleting a reservation or payment queues ``tasks.refresh_stats``
+for the days it touches (see signals); the task worker recomputes each queued
+day once however many writes it had. ``manage.py rebuild_stats`` recomputes
+a whole range, e.g. after bulk inserts that sent no signals.
+
+A refresh locks the restaurants it covers before reading, so refreshes of a
+restaurant run one after the other and the last one saved has read every
+write committed before it started.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Payment, Reservation, Restaurant, RestaurantDailyStats, RestaurantHourlyStats
+
+STAT_FIELDS = ['reservations', 'accepted', 'rejected', 'covers', 'booked_minutes', 'payments', 'revenue']
+
+
+def empty_stats():
+    return {field: 0 for field in STAT_FIELDS} | {'revenue': Decimal(0)}
+
+
+def minutes(value):
+    return value.hour * 60 + value.minute
+
+
+class Rollup:
+    def __init__(self):
+        self.daily = defaultdict(empty_stats)
+        self.hourly = defaultdict(empty_stats)
+
+    def add_reservation(self, restaurant_id, day, start_time, end_time, guests, status):
+        rows = [self.daily[restaurant_id, day], self.hourly[restaurant_id, day, start_time.hour]]
+        for row in rows:
+            row['reservations'] += 1
+            if status == Reservation.REJECTED:
+                row['rejected'] += 1
+            elif status == Reservation.ACCEPTED:
+                row['accepted'] += 1
+                row['covers'] += guests
+        if status != Reservation.ACCEPTED:
+            return
+        start = minutes(start_time)
+        # A reservation ending at or past midnight takes the table until midnight
+        end = minutes(end_time) if end_time > start_time else 24 * 60
+        self.daily[restaurant_id, day]['booked_minutes'] += end - start
+        for hour in range(start // 60, (end - 1) // 60 + 1):
+            overlap = min(end, (hour + 1) * 60) - max(start, hour * 60)
+            self.hourly[restaurant_id, day, hour]['booked_minutes'] += overlap
+
+    def add_payment(self, restaurant_id, timestamp, amount):
+        local = timezone.localtime(timestamp)
+        for row in (self.daily[restaurant_id, local.date()], self.hourly[restaurant_id, local.date(), local.hour]):
+            row['payments'] += 1
+            row['revenue'] += amount
+
+    def add(self, reservations, payments):
+        """Adds reservations and payments (the latter from ``payments_by_restaurant``)."""
+        rows = reservations.values_list('restaurant_id', 'date', 'start_time', 'end_time', 'num_guests', 'status')
+        for row in rows.iterator(chunk_size=5000):
+            self.add_reservation(*row)
+        rows = payments.filter(restaurant_key__isnull=False).values_list('restaurant_key', 'timestamp', 'amount')
+        for row in rows.iterator(chunk_size=5000):
+            self.add_payment(*row)
+        return self
+
+    def save(self, daily_rows, hourly_rows, batch_size=2000):
+        """Replaces ``daily_rows`` and ``hourly_rows`` (querysets) with the computed rows."""
+        with transaction.atomic():
+            daily_rows.delete()
+            hourly_rows.delete()
+            RestaurantDailyStats.objects.bulk_create(
+                (RestaurantDailyStats(restaurant_id=restaurant_id, date=day, **stats)
+                 for (restaurant_id, day), stats in self.daily.items()), batch_size=batch_size)
+            RestaurantHourlyStats.objects.bulk_create(
+                (RestaurantHourlyStats(restaurant_id=restaurant_id, date=day, hour=hour, **stats)
+                 for (restaurant_id, day, hour), stats in self.hourly.items()), batch_size=batch_size)
+
+
+def payments_by_restaurant():
+    # Older payments only point at the reservation
+    return Payment.objects.annotate(restaurant_key=Coalesce('restaurant_id', 'reservation__restaurant_id'))
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time()))
+    return start, start + timedelta(days=1)
+
+
+def lock_restaurants(restaurant_ids=None):
+    """
+    Locks the restaurant rows until the transaction ends. NO KEY UPDATE where
+    there is one, which doesn't block inserting reservations that point at them.
+    """
+    restaurants = Restaurant.objects.select_for_update(no_key=connection.features.has_select_for_no_key_update)
+    if restaurant_ids is not None:
+        restaurants = restaurants.filter(id__in=restaurant_ids)
+    list(restaurants.order_by('id').values_list('id', flat=True))
+
+
+def refresh_days(days):
+    """Recomputes the rows of a few (restaurant id, date) pairs."""
+    days = set(days)
+    if not days:
+        return
+    reservations = Q()
+    payments = Q()
+    rows = Q()
+    for restaurant_id, day in days:
+        reservations |= Q(restaurant_id=restaurant_id, date=day)
+        start, end = day_bounds(day)
+        payments |= Q(restaurant_key=restaurant_id, timestamp__gte=start, timestamp__lt=end)
+        rows |= Q(restaurant_id=restaurant_id, date=day)
+    with transaction.atomic():
+        lock_restaurants({restaurant_id for restaurant_id, _ in days})
+        rollup = Rollup().add(Reservation.objects.filter(reservations), payments_by_restaurant().filter(payments))
+        rollup.save(RestaurantDailyStats.objects.filter(rows), RestaurantHourlyStats.objects.filter(rows))
+
+
+def rebuild(restaurant_ids=None, since=None, until=None):
+    """Recomputes every row, or those of some restaurants and/or dates (inclusive)."""
+    reservations = Reservation.objects.all()
+    payments = payments_by_restaurant()
+    rows = Q()
+    if restaurant_ids:
+        reservations = reservations.filter(restaurant_id__in=restaurant_ids)
+        payments = payments.filter(restaurant_key__in=restaurant_ids)
+        rows &= Q(restaurant_id__in=restaurant_ids)
+    if since:
+        reservations = reservations.filter(date__gte=since)
+        payments = payments.filter(timestamp__gte=day_bounds(since)[0])
+        rows &= Q(date__gte=since)
+    if until:
+        reservations = reservations.filter(date__lte=until)
+        payments = payments.filter(timestamp__lt=day_bounds(until)[1])
+        rows &= Q(date__lte=until)
+    with transaction.atomic():
+        lock_restaurants(restaurant_ids or None)
+        rollup = Rollup().add(reservations, payments)
+        rollup.save(RestaurantDailyStats.objects.filter(rows), RestaurantHourlyStats.objects.filter(rows))
+    return len(rollup.daily), len(rollup.hourly)
@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.mail import send_mail
+
+from reservio.tasks import task
+from .models import Reservation
+from .stats import refresh_days
+
+
+@task()
+def notify_reservation_status(reservation_id):
+    """Emails the customer that the restaurant accepted or rejected their reservation."""
+    reservation = Reservation.objects.select_related('restaurant', 'customer__user').filter(
+        id=reservation_id).first()
+    if reservation is None or not reservation.customer.user.email:
+        return
+    status = reservation.get_status_display() or reservation.status
+    send_mail(
+        subject=f'Your reservation at {reservation.restaurant.name}: {status}',
+        message=(f'Hello {reservation.customer.user.first_name or reservation.customer.user.username},\n\n'
+                 f'Your reservation at {reservation.restaurant.name} on {reservation.date:%d-%m-%Y} '
+                 f'at {reservation.start_time:%H:%M} for {reservation.num_guests} is now {status.lower()}.\n'),
+        from_email=None,
+        recipient_list=[reservation.customer.user.email],
+    )
+
+
+@task(batch_size=500)
+def refresh_stats(calls):
+    """Recomputes the dashboard rollups of the queued days, each once."""
+    refresh_days((call['restaurant_id'], date.fromisoformat(call['date'])) for call in calls)
+
+
+def queue_stats_refresh(*days):
+    """Queues refresh_stats for (restaurant id, date or ISO date) pairs; pairs with a None are left out."""
+    refresh_stats.enqueue_many(
+        {'restaurant_id': restaurant_id, 'date': str(day)}
+        for restaurant_id, day in set(days) if restaurant_id is not None and day is not None)
@@ -1,3 +1,612 @@
-from django.test import TestCase
+import gzip
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from zipfile import ZipFile
 
-# Create your tests here.
+import brotli
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.core.models import Task, User
+from reservio.authentication import ClaimsAccessToken
+from reservio.testing import QueryBudgetMixin
+from .models import Cuisine, Customer, MenuCategory, MenuItem, Payment, Reservation, ReservationReminder, Restaurant, \
+    RestaurantDailyStats, RestaurantHourlyStats, Review, ReviewReply, Table
+from .reminders import backfill_reminders, claim, send_due_reminders
+from .stats import refresh_days
+from .views import ManageReservation
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cuisines = [Cuisine.objects.create(name=name) for name in ['Uzbek', 'Italian', 'Turkish']]
+        customers = []
+        for i in range(5):
+            user = User.objects.create(username=f'customer{i}', email=f'customer{i}@example.com',
+                                       first_name=f'Customer {i}', role=User.ROLE.CUSTOMER)
+            customers.append(Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0])
+        for i in range(12):
+            owner = User.objects.create(username=f'owner{i}', email=f'owner{i}@example.com', role=User.ROLE.RESTAURANT)
+            restaurant = Restaurant.objects.create(
+                name=f'Restaurant {i}', location='Tashkent', contact_number='+998710000000', user=owner,
+                opening_time=time(9), closing_time=time(23))
+            restaurant.cuisines.set(cuisines[:i % 3 + 1])
+            for customer in customers:
+                review = Review.objects.create(restaurant=restaurant, customer=customer, rating=i % 5 + 1, comment='Good')
+                ReviewReply.objects.create(restaurant=restaurant, customer=customer, review=review, reply_text='Thanks')
+            category = MenuCategory.objects.create(restaurant=restaurant, name='Main')
+            for j in range(5):
+                MenuItem.objects.create(menu=category, name=f'Dish {i}-{j}', unit_price='10.00')
+                Table.objects.create(restaurant=restaurant, number=j + 1, capacity=4)
+        cls.restaurant = restaurant
+        cls.category = category
+
+    def test_restaurant_list(self):
+        self.assertWithinQueryBudget('/restaurants/')
+
+    def test_restaurant_detail(self):
+        self.assertWithinQueryBudget(f'/restaurants/{self.restaurant.id}/')
+
+    def test_cuisines(self):
+        self.assertWithinQueryBudget('/cuisines/')
+
+    def test_reviews(self):
+        self.assertWithinQueryBudget(f'/restaurants/{self.restaurant.id}/reviews/')
+
+    def test_menu(self):
+        self.assertWithinQueryBudget(f'/restaurants/{self.restaurant.id}/menu-categories/')
+        self.assertWithinQueryBudget(f'/categories/{self.category.id}/menu-items/')
+
+
+class ReservationNotificationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='guest', email='guest@example.com', first_name='Guest',
+                                   role=User.ROLE.CUSTOMER)
+        customer = Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0]
+        owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        restaurant = Restaurant.objects.create(
+            name='Plov Center', location='Tashkent', contact_number='+998710000000', user=owner,
+            opening_time=time(9), closing_time=time(23))
+        table = Table.objects.create(restaurant=restaurant, number=1, capacity=4)
+        self.reservation = Reservation.objects.create(
+            restaurant=restaurant, customer=customer, table=table, date=date(2026, 11, 1),
+            start_time=time(19), end_time=time(21), num_guests=2)
+
+    def test_status_change_is_emailed_in_the_background(self):
+        response = self.client.post(f'/manage-reservation/{self.reservation.id}/', {'status': Reservation.ACCEPTED})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        self.assertTrue(Task.objects.filter(name='apps.restaurant.tasks.notify_reservation_status').exists())
+
+        call_command('run_tasks', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['guest@example.com'])
+        self.assertIn('Plov Center: Accepted', mail.outbox[0].subject)
+
+    def test_same_status_is_not_emailed(self):
+        self.client.post(f'/manage-reservation/{self.reservation.id}/', {'status': Reservation.WAITING})
+        self.assertFalse(Task.objects.filter(name='apps.restaurant.tasks.notify_reservation_status').exists())
+
+
+@override_settings(EMAIL_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class ReservationReminderTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='guest', email='guest@example.com', role=User.ROLE.CUSTOMER)
+        self.customer = Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0]
+        owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(
+            name='Plov Center', location='Tashkent', contact_number='+998710000000', user=owner,
+            opening_time=time(9), closing_time=time(23))
+        self.table = Table.objects.create(restaurant=self.restaurant, number=1, capacity=4)
+
+    def reserve(self, day, hour=19):
+        return Reservation.objects.create(
+            restaurant=self.restaurant, customer=self.customer, table=self.table, date=day,
+            start_time=time(hour), end_time=time(hour + 1), num_guests=2)
+
+    def test_saving_schedules_reminders(self):
+        day = timezone.now().date() + timedelta(days=3)
+        reservation = self.reserve(day)
+        starts = timezone.make_aware(datetime.combine(day, time(19)))
+        self.assertEqual(
+            dict(reservation.reminders.values_list('kind', 'due_at')),
+            {ReservationReminder.DAY_BEFORE: starts - timedelta(hours=24),
+             ReservationReminder.HOURS_BEFORE: starts - timedelta(hours=2)})
+
+        reservation.status = Reservation.REJECTED
+        reservation.save()
+        self.assertFalse(reservation.reminders.exists())
+
+    def test_due_reminders_are_sent_once(self):
+        for hour in (12, 15, 18):
+            self.reserve(timezone.now().date() + timedelta(days=3), hour)
+        ReservationReminder.objects.filter(kind=ReservationReminder.DAY_BEFORE).update(
+            due_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(send_due_reminders('a', batch_size=10, concurrency=2), (3, 0, 0))
+        self.assertEqual(send_due_reminders('b', batch_size=10, concurrency=2), (0, 0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(ReservationReminder.objects.filter(status=ReservationReminder.SENT).count(), 3)
+        self.assertEqual(len({message.extra_headers['Message-ID'] for message in mail.outbox}), 3)
+
+    def test_backfill_schedules_bulk_created_reservations(self):
+        day = timezone.now().date() + timedelta(days=3)
+        Reservation.objects.bulk_create([
+            Reservation(restaurant=self.restaurant, customer=self.customer, table=self.table, date=day,
+                        start_time=time(hour), end_time=time(hour + 1), num_guests=2)
+            for hour in (12, 15)])
+        self.assertEqual(backfill_reminders(), 4)
+        self.assertEqual(backfill_reminders(), 0)
+
+    def test_claimed_reminders_are_not_claimed_again(self):
+        self.reserve(timezone.now().date() + timedelta(days=3))
+        ReservationReminder.objects.update(due_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(len(claim('a', 10)), 2)
+        self.assertEqual(claim('b', 10), [])
+
+
+class RestaurantStatsTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        user = User.objects.create(username='guest', email='guest@example.com', role=User.ROLE.CUSTOMER)
+        self.customer = Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0]
+        self.owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(
+            name='Plov Center', location='Tashkent', contact_number='+998710000000', user=self.owner,
+            opening_time=time(9), closing_time=time(23))
+        self.table = Table.objects.create(restaurant=self.restaurant, number=1, capacity=4)
+        Table.objects.create(restaurant=self.restaurant, number=2, capacity=4)
+        self.day = date(2026, 11, 1)
+
+    def reserve(self, start, end, guests=2, status=Reservation.ACCEPTED, day=None):
+        return Reservation.objects.create(
+            restaurant=self.restaurant, customer=self.customer, table=self.table, date=day or self.day,
+            start_time=start, end_time=end, num_guests=guests, status=status)
+
+    def run_tasks(self):
+        call_command('run_tasks', once=True, stdout=StringIO())
+
+    def stats(self, model=RestaurantDailyStats, **filters):
+        return list(model.objects.filter(restaurant=self.restaurant, **filters).order_by('date').values(
+            'date', 'reservations', 'accepted', 'rejected', 'covers', 'booked_minutes', 'payments', 'revenue'))
+
+    def test_rollups_follow_writes(self):
+        moved = self.reserve(time(19, 30), time(21), guests=4)
+        self.reserve(time(12), time(13), status=Reservation.REJECTED)
+        self.reserve(time(13), time(14), status=Reservation.WAITING)
+        Payment.objects.create(customer=self.customer, reservation=moved, amount='25.50', payment_method='card',
+                               transaction_id='t1')
+        self.run_tasks()
+
+        today = timezone.localdate()
+        expected = {self.day: (3, 1, 1, 4, 90, 0, 0), today: (0, 0, 0, 0, 0, 1, Decimal('25.50'))}
+        self.assertEqual({row.pop('date'): tuple(row.values()) for row in self.stats()}, expected)
+        hours = RestaurantHourlyStats.objects.filter(date=self.day, booked_minutes__gt=0)
+        self.assertEqual(dict(hours.values_list('hour', 'booked_minutes')), {19: 30, 20: 60})
+
+        moved.date = self.day + timedelta(days=1)
+        moved.save()
+        self.run_tasks()
+        self.assertEqual(self.stats(date=self.day)[0]['covers'], 0)
+        self.assertEqual(self.stats(date=moved.date)[0]['covers'], 4)
+
+    def test_refresh_reads_after_locking_the_restaurant(self):
+        self.reserve(time(19), time(21))
+        with CaptureQueriesContext(connection) as queries:
+            refresh_days([(self.restaurant.id, self.day)])
+        sql = [query['sql'] for query in queries.captured_queries]
+        lock = next(i for i, query in enumerate(sql) if 'FROM "restaurant_restaurant"' in query)
+        read = next(i for i, query in enumerate(sql) if 'FROM "restaurant_reservation"' in query)
+        self.assertLess(lock, read)
+        # Both in the transaction that saves the rows
+        self.assertTrue(any(query.startswith('SAVEPOINT') for query in sql[:lock]))
+        self.assertEqual(self.stats()[0]['covers'], 2)
+
+    def test_rebuild_matches_incremental(self):
+        for hour in range(9, 22):
+            self.reserve(time(hour), time(hour + 1, 30), guests=hour % 5 + 1,
+                         status=[Reservation.ACCEPTED, Reservation.REJECTED][hour % 2], day=self.day + timedelta(hour % 3))
+        self.run_tasks()
+        daily, hourly = self.stats(), self.stats(RestaurantHourlyStats)
+
+        RestaurantDailyStats.objects.all().delete()
+        RestaurantHourlyStats.objects.all().delete()
+        call_command('rebuild_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), daily)
+        self.assertEqual(self.stats(RestaurantHourlyStats), hourly)
+
+    def test_dashboard(self):
+        self.reserve(time(19), time(21), guests=4)
+        self.reserve(time(12), time(13), status=Reservation.REJECTED)
+        self.run_tasks()
+        token = ClaimsAccessToken.for_user(self.owner)
+        headers = {'Authorization': f'Bearer {token}'}
+        path = f'/restaurants/{self.restaurant.id}/stats/?start=2026-11-01&end=2026-11-02'
+
+        data = self.assertWithinQueryBudget(path, headers=headers).json()
+        self.assertEqual(data['totals']['covers'], 4)
+        self.assertEqual(data['totals']['acceptance_rate'], 0.5)
+        # 120 of 2 tables x 14 open hours x 2 days
+        self.assertEqual(data['totals']['utilization'], round(120 / (2 * 14 * 60 * 2), 4))
+        self.assertEqual([row['date'] for row in data['series']], ['2026-11-01'])
+
+        data = self.client.get(path + '&grain=hour', headers=headers).json()
+        self.assertEqual([(row['hour'], row['utilization']) for row in data['series']], [(12, 0), (19, 0.5), (20, 0.5)])
+
+        self.assertEqual(self.client.get(path + '&grain=week', headers=headers).status_code, 400)
+        other = User.objects.create(username='other', email='other@example.com', role=User.ROLE.RESTAURANT)
+        headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(other)}'}
+        self.assertEqual(self.client.get(path, headers=headers).status_code, 403)
+
+
+class ReservationExportTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='guest', email='guest@example.com', first_name='Guest',
+                                   role=User.ROLE.CUSTOMER)
+        customer = Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0]
+        owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        self.restaurant = Restaurant.objects.create(
+            name='Plov Center', location='Tashkent', contact_number='+998710000000', user=owner)
+        table = Table.objects.create(restaurant=self.restaurant, number=1, capacity=4)
+        for day in range(1, 6):
+            Reservation.objects.create(
+                restaurant=self.restaurant, customer=customer, table=table, date=date(2026, 11, day),
+                start_time=time(19), end_time=time(21), num_guests=day, special_requests='Window, "quiet"')
+        self.headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(owner)}'}
+
+    def export(self, file_type, query=''):
+        response = self.client.get(
+            f'/restaurants/{self.restaurant.id}/reservations/export.{file_type}{query}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        lines = self.export('csv', '?start=2026-11-02&end=2026-11-04').decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('Reservation,Date,Start,End,Table,First name'))
+        self.assertIn(",2026-11-02,19:00:00,21:00:00,1,Guest,,'+998900000000,guest@example.com,2,waiting,"
+                      '"Window, ""quiet""",', lines[1])
+
+    def test_csv_formulas_are_written_as_text(self):
+        Reservation.objects.update(special_requests='=HYPERLINK("http://evil.example","Click")')
+        User.objects.filter(username='guest').update(first_name='@SUM(1+1)')
+        line = self.export('csv', '?start=2026-11-02&end=2026-11-02').decode('utf-8-sig').splitlines()[1]
+        self.assertIn(",'@SUM(1+1),", line)
+        self.assertIn('"\'=HYPERLINK(""http://evil.example"",""Click"")"', line)
+
+    def test_xlsx(self):
+        with ZipFile(BytesIO(self.export('xlsx'))) as archive:
+            sheet = archive.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row '), 6)
+        # Dates as Excel serial numbers with a date format
+        self.assertIn('<c r="B2" s="1"><v>46327</v></c>', sheet)
+        self.assertIn('<t xml:space="preserve">Window, "quiet"</t>', sheet)
+
+    def test_other_owner_is_forbidden(self):
+        other = User.objects.create(username='other', email='other@example.com', role=User.ROLE.RESTAURANT)
+        response = self.client.get(f'/restaurants/{self.restaurant.id}/reservations/export.csv',
+                                   headers={'Authorization': f'Bearer {ClaimsAccessToken.for_user(other)}'})
+        self.assertEqual(response.status_code, 403)
+
+
+class RestaurantReservationListTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='owner', email='owner@example.com', role=User.ROLE.RESTAURANT)
+        cls.restaurant = Restaurant.objects.create(
+            name='Plov Center', location='Tashkent', contact_number='+998710000000', user=cls.owner)
+        tables = [Table.objects.create(restaurant=cls.restaurant, number=number, capacity=4) for number in (1, 2)]
+        customers = []
+        for i in range(3):
+            user = User.objects.create(username=f'guest{i}', email=f'guest{i}@example.com', role=User.ROLE.CUSTOMER)
+            customers.append(Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0])
+        statuses = [Reservation.ACCEPTED, Reservation.REJECTED, Reservation.WAITING]
+        Reservation.objects.bulk_create(
+            Reservation(restaurant=cls.restaurant, customer=customers[i % 3], table=tables[i % 2],
+                        date=date(2026, 11, 1 + i % 4), start_time=time(12 + i % 3), end_time=time(15),
+                        num_guests=2, status=statuses[i % 3])
+            for i in range(30))
+        cls.table = tables[0]
+
+    def setUp(self):
+        self.client = self.client_class(headers={'Authorization': f'Bearer {ClaimsAccessToken.for_user(self.owner)}'})
+
+    def pages(self, query=''):
+        path = f'/restaurants/{self.restaurant.id}/reservations/?page_size=8{query}'
+        rows = []
+        while path:
+            data = self.assertWithinQueryBudget(path).json()
+            rows += data['data']
+            path = data['next']
+        return rows
+
+    def test_pages_follow_date_start_time_and_id(self):
+        rows = self.pages()
+        keys = [(row['date'], row['start_time'], row['id']) for row in rows]
+        self.assertEqual(len(rows), 30)
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(rows[0]['restaurant'], 'Plov Center')
+
+    def test_queries_per_page_are_constant(self):
+        first = self.client.get(f'/restaurants/{self.restaurant.id}/reservations/?page_size=5').json()
+        with self.assertNumQueries(2):
+            self.client.get(first['next'])
+        with self.assertNumQueries(2):
+            self.client.get(f'/restaurants/{self.restaurant.id}/reservations/?page_size=50')
+
+    def test_filters(self):
+        rows = self.pages(f'&start=2026-11-02&end=2026-11-03&status=accepted&table={self.table.id}')
+        self.assertTrue(rows)
+        self.assertTrue(all(row['status'] == 'accepted' and row['table_id'] == self.table.id
+                            and '2026-11-02' <= row['date'] <= '2026-11-03' for row in rows))
+        self.assertEqual(self.client.get(f'/restaurants/{self.restaurant.id}/reservations/?status=x').status_code, 400)
+        self.assertEqual(self.client.get(f'/restaurants/{self.restaurant.id}/reservations/?cursor=x').status_code, 404)
+
+    def test_only_the_owner_can_list(self):
+        path = f'/restaurants/{self.restaurant.id}/reservations/'
+        other = User.objects.create(username='other', email='other@example.com', role=User.ROLE.RESTAURANT)
+        Restaurant.objects.create(name='Other', location='Tashkent', contact_number='+998710000001', user=other)
+        response = self.client.get(path, headers={'Authorization': f'Bearer {ClaimsAccessToken.for_user(other)}'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client_class().get(path).status_code, 401)
+
+
+class MyReservationsTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='guest', email='guest@example.com', role=User.ROLE.CUSTOMER)
+        customer = Customer.objects.get_or_create(user=cls.user, defaults={'phone': '+998900000000'})[0]
+        other = User.objects.create(username='other', email='other@example.com', role=User.ROLE.CUSTOMER)
+        other_customer = Customer.objects.get_or_create(user=other, defaults={'phone': '+998900000001'})[0]
+        restaurants = []
+        for i in range(3):
+            owner = User.objects.create(username=f'owner{i}', email=f'owner{i}@example.com', role=User.ROLE.RESTAURANT)
+            restaurants.append(Restaurant.objects.create(
+                name=f'Restaurant {i}', location='Tashkent', contact_number='+998710000000', user=owner,
+                photos=f'restaurant_photos/{i}.jpg' if i else ''))
+        tables = [Table.objects.create(restaurant=restaurant, number=1, capacity=4) for restaurant in restaurants]
+        today = timezone.localdate()
+        Reservation.objects.bulk_create(
+            Reservation(restaurant=restaurants[i % 3], customer=other_customer if i % 5 == 0 else customer,
+                        table=tables[i % 3], date=today + timedelta(days=i - 10), start_time=time(12 + i % 3),
+                        end_time=time(15), num_guests=2)
+            for i in range(25))
+        cls.headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(cls.user)}'}
+
+    def pages(self, when):
+        path = f'/my-reservations/?when={when}&page_size=4'
+        rows = []
+        while path:
+            data = self.assertWithinQueryBudget(path, headers=self.headers).json()
+            rows += data['data']
+            path = data['next']
+        return rows
+
+    def test_upcoming_and_past(self):
+        today = str(timezone.localdate())
+        upcoming, past = self.pages('upcoming'), self.pages('past')
+        self.assertEqual(len(upcoming) + len(past), 20)
+        self.assertTrue(all(row['date'] >= today for row in upcoming))
+        self.assertTrue(all(row['date'] < today for row in past))
+        self.assertEqual([row['date'] for row in upcoming], sorted(row['date'] for row in upcoming))
+        self.assertEqual([row['date'] for row in past], sorted((row['date'] for row in past), reverse=True))
+        self.assertEqual(len({row['id'] for row in upcoming + past}), 20)
+
+    def test_projection(self):
+        with self.assertNumQueries(1):
+            rows = self.client.get('/my-reservations/?page_size=50', headers=self.headers).json()['data']
+        photos = {row['restaurant']: row['restaurant_photo'] for row in rows}
+        self.assertIsNone(photos['Restaurant 0'])
+        self.assertEqual(photos['Restaurant 1'], 'http://testserver/media/restaurant_photos/1.jpg')
+
+    def test_not_a_customer(self):
+        self.assertEqual(self.client.get('/my-reservations/').status_code, 403)
+        self.assertEqual(self.client.get('/my-reservations/?when=soon', headers=self.headers).status_code, 400)
+
+    def test_user_without_claims(self):
+        request = APIRequestFactory().get('/my-reservations/?when=past')
+        force_authenticate(request, user=User.objects.get(pk=self.user.pk))
+        response = ManageReservation.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), 8)
+
+
+class CatalogueDataMixin:
+    """Restaurants with cuisines, reviews with replies, reservations and menus."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalogue()
+
+    @classmethod
+    def create_catalogue(cls):
+        cuisines = [Cuisine.objects.create(name=name) for name in ['Uzbek', 'Italian', 'Turkish']]
+        customers = []
+        for i in range(3):
+            user = User.objects.create(username=f'guest{i}', email=f'guest{i}@example.com', first_name=f'Guest {i}',
+                                       role=User.ROLE.CUSTOMER)
+            customers.append(Customer.objects.get_or_create(user=user, defaults={'phone': '+998900000000'})[0])
+        for i in range(4):
+            owner = User.objects.create(username=f'owner{i}', email=f'owner{i}@example.com', role=User.ROLE.RESTAURANT)
+            restaurant = Restaurant.objects.create(
+                name=f'Restaurant {i}', location='Tashkent', contact_number='+998710000000', user=owner,
+                photos=f'restaurant_photos/{i}.jpg' if i % 2 else '', website=None if i else 'https://example.com',
+                opening_time=time(9, 30) if i else None, closing_time=time(23), is_halal=bool(i % 2))
+            restaurant.cuisines.set(cuisines[i % 3:])
+            table = Table.objects.create(restaurant=restaurant, number=1, capacity=4)
+            for j, customer in enumerate(customers[:i]):
+                review = Review.objects.create(restaurant=restaurant, customer=customer, rating=j % 5 + 1,
+                                               comment=f'Review {j}')
+                for _ in range(j):
+                    ReviewReply.objects.create(restaurant=restaurant, customer=customer, review=review,
+                                               reply_text='Thanks')
+                Reservation.objects.create(
+                    restaurant=restaurant, customer=customer, table=table, date=date(2026, 11, 1 + j),
+                    start_time=time(18, 30), end_time=time(20), num_guests=2,
+                    special_requests='Window' if j else None)
+            category = MenuCategory.objects.create(restaurant=restaurant, name='Main')
+            for j in range(3):
+                MenuItem.objects.create(menu=category, name=f'Dish {i}-{j}', unit_price=Decimal('10.5') + j,
+                                        photo='menu_photos/dish.jpg' if j else '')
+        # Microseconds and a non-UTC offset in the stored timestamps
+        Review.objects.filter(id=Review.objects.first().id).update(
+            timestamp=datetime(2026, 1, 2, 3, 4, 5, 678, tzinfo=timezone.get_fixed_timezone(300)))
+        cls.restaurant = restaurant
+        cls.category = category
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class FastSerializerTests(CatalogueDataMixin, TestCase):
+    """The row serializers of FAST_SERIALIZERS give exactly what the DRF serializers give."""
+
+    def assertSameOutput(self, path, **kwargs):
+        with override_settings(FAST_SERIALIZERS=False):
+            expected = self.client.get(path, **kwargs)
+        response = self.client.get(path, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(response.data, expected.data)
+        return response
+
+    def test_restaurants(self):
+        self.assertSameOutput('/restaurants/')
+        self.assertSameOutput('/restaurants/?search=Uzbek&is_halal=true')
+
+    def test_reservations(self):
+        admin = User.objects.create(username='admin', email='admin@example.com', role=User.ROLE.ADMIN)
+        self.assertSameOutput('/reservations/', headers={'Authorization': f'Bearer {ClaimsAccessToken.for_user(admin)}'})
+        self.assertSameOutput(f'/restaurants/{self.restaurant.id}/reservations/?page_size=2',
+                              headers={'Authorization': f'Bearer {ClaimsAccessToken.for_user(self.restaurant.user)}'})
+
+    def test_menu_items(self):
+        self.assertSameOutput(f'/categories/{self.category.id}/menu-items/')
+
+    def test_reviews(self):
+        self.assertSameOutput('/reviews/')
+        self.assertSameOutput(f'/restaurants/{self.restaurant.id}/reviews/')
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0)
+class AsyncViewTests(CatalogueDataMixin, TransactionTestCase):
+    """
+    The async/ endpoints return the same JSON as the DRF views they mirror.
+    Their queries run on other connections, so the data has to be committed.
+    """
+
+    def setUp(self):
+        self.create_catalogue()
+
+    def assertSameJSON(self, path):
+        expected = self.client.get(path)
+        response = self.client.get(f'/async{path}')
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+
+    def test_restaurants(self):
+        self.assertSameJSON('/restaurants/')
+        self.assertSameJSON('/restaurants/?search=Uzbek&is_halal=true')
+        self.assertSameJSON('/restaurants/?page=2')
+
+    def test_restaurant_detail(self):
+        self.assertSameJSON(f'/restaurants/{self.restaurant.id}/')
+        self.assertSameJSON('/restaurants/0/')
+
+    def test_menu(self):
+        self.assertSameJSON(f'/restaurants/{self.restaurant.id}/menu-categories/')
+        self.assertSameJSON(f'/categories/{self.category.id}/menu-items/')
+
+    def test_reviews(self):
+        self.assertSameJSON(f'/restaurants/{self.restaurant.id}/reviews/')
+
+    def test_availability(self):
+        response = self.client.get(f'/async/restaurants/{self.restaurant.id}/availability/?date=2026-11-02')
+        self.assertEqual(response.json()['tables'][0]['reserved'], [{'start_time': '18:30:00', 'end_time': '20:00:00'}])
+        response = self.client.get(f'/async/restaurants/{self.restaurant.id}/availability/?date=02.11.2026')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(10):
+            owner = User.objects.create(username=f'owner{i}', email=f'owner{i}@example.com', role=User.ROLE.RESTAURANT)
+            cls.restaurant = Restaurant.objects.create(
+                name=f'Restaurant {i}', location='Tashkent', contact_number='+998710000000', user=owner,
+                description='Plov, shashlik and fresh bread from the tandoor. ' * 5)
+        cls.customer = Customer.objects.create(
+            user=User.objects.create(username='guest', email='guest@example.com', role=User.ROLE.CUSTOMER))
+        cls.category = MenuCategory.objects.create(restaurant=cls.restaurant, name='Main')
+        MenuItem.objects.create(menu=cls.category, name='Plov', unit_price=Decimal('10.5'))
+
+    def setUp(self):
+        cache.clear()
+
+    def sample(self, name, encoding, source):
+        return REGISTRY.get_sample_value(name, {'encoding': encoding, 'source': source}) or 0
+
+    def test_brotli_is_preferred(self):
+        plain = self.client.get('/restaurants/')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+        response = self.client.get('/restaurants/', headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertEqual(int(response['Content-Length']), len(response.content))
+        self.assertLess(len(response.content), len(plain.content) / 2)
+
+        response = self.client.get('/restaurants/', headers={'Accept-Encoding': 'br;q=0.5, gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_cached_response_is_sent_precompressed(self):
+        first = self.client.get('/restaurants/', headers={'Accept-Encoding': 'br'})
+        live_cpu = self.sample('reservio_compression_cpu_seconds_total', 'br', 'live')
+        cached_bytes = self.sample('reservio_compression_output_bytes_total', 'br', 'cache')
+        with self.assertNumQueries(0):
+            second = self.client.get('/restaurants/', headers={'Accept-Encoding': 'br'})
+        self.assertEqual(second['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(second.content), brotli.decompress(first.content))
+        self.assertEqual(self.sample('reservio_compression_cpu_seconds_total', 'br', 'live'), live_cpu)
+        self.assertEqual(self.sample('reservio_compression_output_bytes_total', 'br', 'cache'),
+                         cached_bytes + len(second.content))
+
+    def test_changes_invalidate_the_cache(self):
+        self.assertEqual(self.client.get('/restaurants/').json()['results'][0]['num_reviews'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(restaurant=self.restaurant, customer=self.customer, rating=5, comment='Great')
+            # Still the old generation until the transaction commits
+            self.assertEqual(self.client.get('/restaurants/').json()['results'][0]['num_reviews'], 0)
+        self.assertEqual(self.client.get('/restaurants/').json()['results'][0]['num_reviews'], 1)
+
+        self.assertEqual(len(self.client.get(f'/categories/{self.category.id}/menu-items/').json()['data']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            MenuItem.objects.create(menu=self.category, name='Lagman', unit_price=Decimal('8'))
+        self.assertEqual(len(self.client.get(f'/categories/{self.category.id}/menu-items/').json()['data']), 2)
+
+    def test_authenticated_requests_are_not_cached(self):
+        headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(self.customer.user)}'}
+        self.client.get('/restaurants/', headers=headers)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/restaurants/', headers=headers)
+        self.assertTrue(queries)
+
+    def test_authenticated_responses_are_not_compressed(self):
+        headers = {'Authorization': f'Bearer {ClaimsAccessToken.for_user(self.customer.user)}', 'Accept-Encoding': 'br'}
+        response = self.client.get('/restaurants/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(f'/categories/{self.category.id}/menu-items/', headers={'Accept-Encoding': 'br'})
+        self.assertFalse(response.has_header('Content-Encoding'))
@@ -1,6 +1,6 @@
 from rest_framework_nested import routers
 from django.urls import path
-from . import views
+from . import async_views, views
 
 router = routers.DefaultRouter()
 router.register('restaurants', views.RestaurantViewSet, basename='restaurants')
@@ -22,6 +22,9 @@ urlpatterns = [
     path('my-reservations/', views.ManageReservation.as_view(), name='my-reservations'),
     path('my-reservations/<int:pk>/', views.ManageReservation.as_view(), name='my-reservations'),
     path('restaurants/<int:restaurant_id>/reservations/', views.RestaurantReservation.as_view(), name='restaurant-reservations'),
+    path('restaurants/<int:restaurant_id>/reservations/export.csv', views.RestaurantReservationExport.as_view(), {'file_type': 'csv'}, name='restaurant-reservations-export'),
+    path('restaurants/<int:restaurant_id>/reservations/export.xlsx', views.RestaurantReservationExport.as_view(), {'file_type': 'xlsx'}, name='restaurant-reservations-export'),
+    path('restaurants/<int:restaurant_id>/stats/', views.RestaurantStatsView.as_view(), name='restaurant-stats'),
     path('restaurants/<int:restaurant_id>/menu-categories/', views.MenuCategoriesView.as_view(), name='menu-categories'),
     path('restaurants/<int:restaurant_id>/menu-categories/<int:category_id>/', views.MenuCategoriesView.as_view(), name='menu-category-detail'),
     path('categories/<int:category_id>/menu-items/', views.MenuItemsView.as_view(), name='menu-items'),
@@ -31,4 +34,14 @@ urlpatterns = [
     path('reviews/', views.ReviewViewSet.as_view({'get': 'list', 'post': 'create'}), name='reviews'),
 ]
 
+# Async read endpoints, for running under an ASGI server
+urlpatterns += [
+    path('async/restaurants/', async_views.restaurant_list, name='async-restaurants'),
+    path('async/restaurants/<int:pk>/', async_views.restaurant_detail, name='async-restaurant'),
+    path('async/restaurants/<int:restaurant_id>/reviews/', async_views.reviews, name='async-restaurant-reviews'),
+    path('async/restaurants/<int:restaurant_id>/menu-categories/', async_views.menu_categories, name='async-menu-categories'),
+    path('async/restaurants/<int:restaurant_id>/availability/', async_views.availability, name='async-availability'),
+    path('async/categories/<int:category_id>/menu-items/', async_views.menu_items, name='async-menu-items'),
+]
+
 urlpatterns += router.urls
\ No newline at end of file
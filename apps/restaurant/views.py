@@ -1,10 +1,14 @@
 from pprint import pprint
 
-from django.db.models import Avg, Value
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Avg, F, Prefetch, Sum, Value
 from django.db.models.aggregates import Count
 from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
 from apps.core.models import User
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status
@@ -15,16 +19,22 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet, GenericViewSet
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.exceptions import NotFound
-
-from reservio.permissions import CanViewRestaurant, CanPostReview, IsRestaurantAdminOrReadOnly, CanManageReservations, CanViewContent, RestaurantPermissions
-from .filters import RestaurantFilter
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+
+from reservio.compression import cache_response
+from reservio.export import csv_chunks, xlsx_chunks
+from reservio.permissions import CanViewRestaurant, CanPostReview, IsRestaurantAdminOrReadOnly, CanManageReservations, CanViewContent, RestaurantPermissions, \
+    IsRestaurantOwner
+from .fastserializers import MenuItemRowSerializer, ReservationRowSerializer, RestaurantRowSerializer, \
+    ReviewRowSerializer
+from .filters import ReservationFilter, RestaurantFilter
 from .models import Restaurant, Cuisine, Review, ReviewReply, Table, Reservation, Customer, PaymentStatus, \
-    MenuCategory, MenuItem
-from .pagination import DefaultPagination
+    MenuCategory, MenuItem, RestaurantDailyStats, RestaurantHourlyStats
+from .pagination import DefaultPagination, KeysetPagination
 from .serializers import RestaurantSerializer, CuisineSerializer, ReviewSerializer, ReviewReplySerializer, \
     TableSerializer, ReservationSerializer, CustomerSerializer, PaymentStatusSerializer, MenuCategorySerializer, \
     MenuItemsSerializer
+from .tasks import notify_reservation_status
 
 
 class RestaurantViewSet(ModelViewSet):
@@ -46,6 +56,14 @@ class RestaurantViewSet(ModelViewSet):
     def get_serializer_context(self):
         return {'request': self.request}
 
+    @cache_response('restaurants')
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        serializer = RestaurantRowSerializer(request)
+        page = self.paginate_queryset(serializer.values(self.filter_queryset(Restaurant.objects.all())))
+        return self.get_paginated_response(serializer.serialize(page))
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -59,7 +77,9 @@ class RestaurantViewSet(ModelViewSet):
         serializer.save()
 
     def get_queryset(self):
-        return super().get_queryset()
+        # In the order RestaurantRowSerializer gives, not whatever Cuisine.Meta says
+        return super().get_queryset().prefetch_related(
+            'reviews', Prefetch('cuisines', queryset=Cuisine.objects.order_by('name')))
 
 
 class CuisineViewList(ModelViewSet):
@@ -83,8 +103,17 @@ class ReviewViewSet(ModelViewSet):
 
     def get_queryset(self):
         if 'restaurant_id' in self.kwargs:
-            return Review.objects.filter(restaurant_id=self.kwargs['restaurant_id'])
-        return Review.objects.all()
+            queryset = Review.objects.filter(restaurant_id=self.kwargs['restaurant_id'])
+        else:
+            queryset = Review.objects.all()
+        return queryset.select_related('customer__user').prefetch_related(
+            Prefetch('review_replies', queryset=ReviewReply.objects.order_by('id')))
+
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        serializer = ReviewRowSerializer(request)
+        return Response(serializer.serialize(serializer.values(self.filter_queryset(self.get_queryset()))))
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -167,9 +196,15 @@ class TableViewSet(ModelViewSet):
 
 class ReservationViewSet(ModelViewSet):
     serializer_class = ReservationSerializer
-    queryset = Reservation.objects.all()
+    queryset = Reservation.objects.select_related('restaurant').order_by('id')
     permission_classes = [CanManageReservations]
 
+    def list(self, request, *args, **kwargs):
+        if not settings.FAST_SERIALIZERS:
+            return super().list(request, *args, **kwargs)
+        serializer = ReservationRowSerializer(request)
+        return Response(serializer.serialize(serializer.values(self.filter_queryset(self.get_queryset()))))
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -199,15 +234,163 @@ class ReservationViewSet(ModelViewSet):
 
 
 class RestaurantReservation(APIView):
+    """
+    A restaurant's reservations by date, start time and id, a page at a time.
+    Filters: ``start`` and ``end`` (dates), ``status`` and ``table`` (id).
+    ``next`` is the link to the following page, None on the last one.
+    """
+    permission_classes = [IsRestaurantOwner]
 
     def get(self, request, restaurant_id):
-        restaurant = Restaurant.objects.get(id=restaurant_id)
-        reservations = Reservation.objects.filter(restaurant=restaurant)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response({"status": "ok", "data": serializer.data})
+        if not Restaurant.objects.filter(id=restaurant_id).exists():
+            raise NotFound('Restaurant not found')
+        filterset = ReservationFilter(
+            request.query_params, queryset=Reservation.objects.filter(restaurant_id=restaurant_id))
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        paginator = KeysetPagination(ordering=('date', 'start_time', 'id'))
+        if settings.FAST_SERIALIZERS:
+            serializer = ReservationRowSerializer(request)
+            data = serializer.serialize(paginator.paginate_queryset(serializer.values(filterset.qs), request, self))
+        else:
+            reservations = paginator.paginate_queryset(filterset.qs.select_related('restaurant'), request, self)
+            data = ReservationSerializer(reservations, many=True).data
+        return Response({"status": "ok", "data": data, "next": paginator.get_next_link()})
+
+
+def date_range(request):
+    """The ``start`` and ``end`` dates of the query string, None when not given."""
+    try:
+        return [date.fromisoformat(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ('start', 'end')]
+    except ValueError:
+        raise ValidationError('start and end must be dates as YYYY-MM-DD.')
+
+
+class RestaurantReservationExport(APIView):
+    """
+    A restaurant's reservations as a CSV or XLSX download, optionally from
+    ``start`` and/or until ``end`` (dates). The file is streamed while the
+    rows are read, a chunk at a time, so any number of rows fits in memory.
+    """
+    permission_classes = [IsRestaurantOwner]
+    columns = [
+        ('Reservation', 'id'),
+        ('Date', 'date'),
+        ('Start', 'start_time'),
+        ('End', 'end_time'),
+        ('Table', 'table__number'),
+        ('First name', 'customer__user__first_name'),
+        ('Last name', 'customer__user__last_name'),
+        ('Phone', 'customer__phone'),
+        ('Email', 'customer__user__email'),
+        ('Guests', 'num_guests'),
+        ('Status', 'status'),
+        ('Special requests', 'special_requests'),
+        ('Paid', 'payment__amount'),
+    ]
+    content_types = {
+        'csv': 'text/csv; charset=utf-8',
+        'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    }
+    chunk_size = 2000
+
+    def get(self, request, restaurant_id, file_type):
+        if not Restaurant.objects.filter(id=restaurant_id).exists():
+            raise NotFound('Restaurant not found')
+        start, end = date_range(request)
+        reservations = Reservation.objects.filter(restaurant_id=restaurant_id)
+        if start:
+            reservations = reservations.filter(date__gte=start)
+        if end:
+            reservations = reservations.filter(date__lte=end)
+        rows = reservations.order_by('date', 'start_time', 'id') \
+            .values_list(*[field for _, field in self.columns]).iterator(chunk_size=self.chunk_size)
+        header = [title for title, _ in self.columns]
+
+        if file_type == 'xlsx':
+            content = xlsx_chunks(header, rows, sheet='Reservations', batch_size=self.chunk_size)
+        else:
+            content = csv_chunks(header, rows, batch_size=self.chunk_size)
+        response = StreamingHttpResponse(content, content_type=self.content_types[file_type])
+        name = '-'.join(['reservations', str(restaurant_id), *(str(day) for day in (start, end) if day)])
+        response['Content-Disposition'] = f'attachment; filename="{name}.{file_type}"'
+        return response
+
+
+class RestaurantStatsView(APIView):
+    """
+    Dashboard figures of a restaurant between ``start`` and ``end`` (dates,
+    the last 30 days by default), as totals and a series per ``grain``
+    (day or hour). Reads only the rollups of apps.restaurant.stats, so the
+    cost depends on the number of days, not of reservations. Days and hours
+    without any reservation or payment are left out of the series.
+    """
+    permission_classes = [IsRestaurantOwner]
+    # Longest range per grain, in days
+    max_days = {'day': 3660, 'hour': 31}
+    fields = ['reservations', 'accepted', 'rejected', 'covers', 'booked_minutes', 'payments', 'revenue']
+
+    def get(self, request, restaurant_id):
+        restaurant = Restaurant.objects.filter(id=restaurant_id).annotate(tables=Count('table')) \
+            .values('opening_time', 'closing_time', 'tables').first()
+        if restaurant is None:
+            raise NotFound('Restaurant not found')
+        start, end, grain = self.get_range(request)
+
+        daily = RestaurantDailyStats.objects.filter(restaurant_id=restaurant_id, date__range=(start, end))
+        totals = daily.aggregate(**{field: Sum(field) for field in self.fields})
+        if grain == 'hour':
+            series = RestaurantHourlyStats.objects.filter(restaurant_id=restaurant_id, date__range=(start, end)) \
+                .values('date', 'hour', *self.fields).order_by('date', 'hour')
+            capacity = restaurant['tables'] * 60
+        else:
+            series = daily.values('date', *self.fields).order_by('date')
+            capacity = restaurant['tables'] * self.open_minutes(restaurant)
+
+        return Response({
+            'restaurant': restaurant_id,
+            'start': start,
+            'end': end,
+            'grain': grain,
+            'totals': self.figures(totals, capacity * ((end - start).days + 1)),
+            'series': [row | self.figures(row, capacity) for row in series],
+        })
+
+    def get_range(self, request):
+        grain = request.query_params.get('grain', 'day')
+        if grain not in self.max_days:
+            raise ValidationError({'grain': 'Must be day or hour.'})
+        start, end = date_range(request)
+        end = end or timezone.localdate()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise ValidationError('start must not be after end.')
+        if (end - start).days >= self.max_days[grain]:
+            raise ValidationError(f'At most {self.max_days[grain]} days at a time by {grain}.')
+        return start, end, grain
+
+    @staticmethod
+    def open_minutes(restaurant):
+        opening, closing = restaurant['opening_time'], restaurant['closing_time']
+        if opening is None or closing is None:
+            return 24 * 60
+        minutes = (closing.hour - opening.hour) * 60 + closing.minute - opening.minute
+        # Closing after midnight
+        return minutes if minutes > 0 else minutes + 24 * 60
+
+    def figures(self, row, capacity):
+        figures = {field: row[field] or 0 for field in self.fields}
+        decided = figures['accepted'] + figures['rejected']
+        figures['revenue'] = str(row['revenue'] or '0.00')
+        figures['acceptance_rate'] = round(figures['accepted'] / decided, 4) if decided else None
+        figures['utilization'] = round(figures['booked_minutes'] / capacity, 4) if capacity else None
+        return figures
 
 
 class ManageReservation(APIView):
+    list_fields = ['id', 'restaurant_id', 'customer_id', 'table_id', 'date', 'start_time', 'end_time', 'num_guests',
+                   'special_requests', 'status']
 
     def get(self, request, pk=None):  # Make 'pk' optional by setting default value to None
         if pk is not None:
@@ -219,11 +402,42 @@ class ManageReservation(APIView):
             except Reservation.DoesNotExist:
                 return Response({"status": "error", "message": "Reservation not found."}, status=status.HTTP_404_NOT_FOUND)
         else:
-            # List reservations for the current user
-            user = request.user  # Assuming user authentication is set up correctly
-            reservations = Reservation.objects.filter(customer=user.customer)
-            serializer = ReservationSerializer(reservations, many=True)
-            return Response({"status": "ok", "data": serializer.data})
+            return self.list(request)
+
+    def list(self, request):
+        """
+        The customer's ``upcoming`` (from today on, soonest first) or ``past``
+        (latest first) reservations, as ``?when=``, a page at a time. One
+        query fetches each page with its restaurant's name and photo.
+        """
+        customer_id = getattr(request.user, 'customer_id', None)
+        if customer_id is None:
+            # Users not authenticated from a token claim
+            customer_id = Customer.objects.filter(user_id=request.user.pk).values_list('id', flat=True).first()
+        if customer_id is None:
+            raise PermissionDenied('Only customers have reservations.')
+        when = request.query_params.get('when', 'upcoming')
+        reservations = Reservation.objects.filter(customer_id=customer_id)
+        today = timezone.localdate()
+        if when == 'upcoming':
+            reservations = reservations.filter(date__gte=today)
+            ordering = ('date', 'start_time', 'id')
+        elif when == 'past':
+            reservations = reservations.filter(date__lt=today)
+            ordering = ('-date', '-start_time', '-id')
+        else:
+            raise ValidationError({'when': 'Must be upcoming or past.'})
+        reservations = reservations.values(
+            *self.list_fields, restaurant_name=F('restaurant__name'), restaurant_photo=F('restaurant__photos'))
+
+        paginator = KeysetPagination(ordering=ordering)
+        rows = paginator.paginate_queryset(reservations, request, self)
+        storage = Restaurant._meta.get_field('photos').storage
+        for row in rows:
+            row['restaurant'] = row.pop('restaurant_name')
+            photo = row.pop('restaurant_photo')
+            row['restaurant_photo'] = request.build_absolute_uri(storage.url(photo)) if photo else None
+        return Response({"status": "ok", "data": rows, "next": paginator.get_next_link()})
 
     def post(self, request, pk=None):  # Same here, 'pk' is optional
         if pk is not None:
@@ -231,8 +445,12 @@ class ManageReservation(APIView):
             try:
                 reservation = Reservation.objects.get(id=pk)
                 status_value = request.data.get('status', Reservation.WAITING)
+                changed = reservation.status != status_value
                 reservation.status = status_value
                 reservation.save()
+                if changed:
+                    # Sent by `manage.py run_tasks`, not while the restaurant waits
+                    notify_reservation_status.enqueue(reservation_id=reservation.id)
                 serializer = ReservationSerializer(reservation)
                 return Response({"status": "ok", "data": serializer.data})
             except Reservation.DoesNotExist:
@@ -256,6 +474,7 @@ class MenuCategoryViewSet(ModelViewSet):
 class MenuCategoriesView(APIView):
     permission_classes = [IsRestaurantAdminOrReadOnly]
 
+    @cache_response('menus')
     def get(self, request, restaurant_id):
         restaurant = Restaurant.objects.get(id=restaurant_id)
         categories = MenuCategory.objects.filter(restaurant=restaurant)
@@ -282,14 +501,19 @@ class MenuCategoriesView(APIView):
 
 # View for list and create operations
 class MenuItemsView(APIView):
+    @cache_response('menus')
     def get(self, request, category_id):
         category = get_object_or_404(MenuCategory, id=category_id)
         items = MenuItem.objects.filter(menu=category)
-        data = MenuItemsSerializer(items, many=True).data
+        if settings.FAST_SERIALIZERS:
+            serializer = MenuItemRowSerializer()
+            data = serializer.serialize(serializer.values(items))
+        else:
+            data = MenuItemsSerializer(items, many=True).data
         return Response({"status": "ok", "data": data})
 
     def post(self, request, category_id):
-        serializer = MenuItemsSerializer(data=request.data)
+        serializer = MenuItemsSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             category = get_object_or_404(MenuCategory, id=category_id)
             serializer.validated_data['menu'] = category
@@ -306,7 +530,7 @@ class MenuItemDetailView(APIView):
         except MenuItem.DoesNotExist:
             raise NotFound(detail="Menu item not found")
 
-        serializer = MenuItemsSerializer(item, data=request.data, partial=True)
+        serializer = MenuItemsSerializer(item, data=request.data, partial=True, context={'request': request})
         if serializer.is_valid():
             serializer.save()
             return Response({"status": "ok", "data": serializer.data}, status=status.HTTP_200_OK)
@@ -0,0 +1,47 @@
+import gc
+import os
+import shutil
+import tempfile
+
+# Workers write their metrics here and /metrics adds them up (see reservio.metrics).
+# Set before the workers start, so prometheus_client picks multiprocess mode.
+created_metrics_dir = 'PROMETHEUS_MULTIPROC_DIR' not in os.environ
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f'reservio-metrics-{os.getpid()}'))
+# Created now: with preload_app the master imports the metrics before on_starting.
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Load (and warm up, see reservio.warmup) the application once in the master
+# and fork the workers from it: they start serving at once and share the
+# imported code. Code changes then need a restart, not a HUP.
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def on_starting(server):
+    # Start from empty counters, not from what a previous run left behind.
+    # Only prometheus_client's files: the directory may have been given to us.
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db') and not name.endswith(f'_{os.getpid()}.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def on_exit(server):
+    # A directory from the environment is someone else's to remove
+    if created_metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def pre_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    # A connection the application opened while loading must not be shared by the workers.
+    connections.close_all()
+    # Move what the master loaded out of the collector's reach, so collections
+    # in the workers don't write to (and so copy) the pages they share.
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
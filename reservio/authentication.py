@@ -0,0 +1,193 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from apps.core.models import User
+from apps.restaurant.models import Customer, Restaurant
+from reservio.revocation import is_revoked, revoke_user
+
+ROLE_CLAIM = 'role'
+CUSTOMER_CLAIM = 'customer_id'
+RESTAURANT_CLAIM = 'restaurant_id'
+ACTIVE_CLAIM = 'is_active'
+
+# User methods that write the row. ClaimsUser calls them, and forwards
+# attribute assignments, on a User freshly read from the database, so a stale
+# cached copy is never saved over newer values.
+USER_WRITE_METHODS = {'save', 'delete', 'set_password', 'set_unusable_password', 'refresh_from_db'}
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def cached_user_fields():
+    # Never the password hash; it is read from the database when needed.
+    return [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+
+
+def get_cached_user(user_id):
+    key = user_cache_key(user_id)
+    values = cache.get(key)
+    if values is None:
+        values = User.objects.filter(pk=user_id).values(*cached_user_fields()).first()
+        if values is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        cache.set(key, values, settings.AUTH_USER_CACHE_TTL)
+    return User.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+
+
+def revoke_user_tokens(user_id):
+    """
+    Reject every token issued to the user so far, e.g. after a role change.
+    The user logs in again to get a token with up to date claims.
+    """
+    revoke_user(user_id, max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME))
+    cache.delete(user_cache_key(user_id))
+
+
+def add_user_claims(token, user):
+    token[ROLE_CLAIM] = user.role
+    token[ACTIVE_CLAIM] = user.is_active
+    token[CUSTOMER_CLAIM] = None
+    token[RESTAURANT_CLAIM] = None
+    if user.role == User.ROLE.CUSTOMER:
+        token[CUSTOMER_CLAIM] = Customer.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    elif user.role == User.ROLE.RESTAURANT:
+        token[RESTAURANT_CLAIM] = Restaurant.objects.filter(user_id=user.id).values_list('id', flat=True).first()
+    return token
+
+
+class ClaimsAccessToken(AccessToken):
+    """
+    Access token that carries the user's role and customer/restaurant id, so
+    authenticated requests don't have to load them from the database.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """Refresh token whose access tokens carry the same claims as ClaimsAccessToken."""
+
+    @classmethod
+    def for_user(cls, user):
+        return add_user_claims(super().for_user(user), user)
+
+
+def check_not_revoked(token):
+    if is_revoked(token):
+        raise InvalidToken('Token has been revoked')
+
+
+class ClaimsUser:
+    """
+    The authenticated user as described by the token claims.
+
+    ``id``, ``role``, ``is_active``, ``customer_id`` and ``restaurant_id``
+    come from the token. Any other attribute is read from the User row, which
+    is kept in the cache (without the password hash) for AUTH_USER_CACHE_TTL
+    seconds. Assigning attributes or calling one of USER_WRITE_METHODS first
+    swaps it for the row as it is in the database.
+    """
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.__dict__['token'] = token
+        self.__dict__['id'] = self.__dict__['pk'] = int(token[api_settings.USER_ID_CLAIM])
+
+    def __str__(self):
+        return str(self.user)
+
+    def __eq__(self, other):
+        return getattr(other, 'pk', None) == self.pk and isinstance(other, (ClaimsUser, User))
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name in USER_WRITE_METHODS:
+            return getattr(self.writable_user, name)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.writable_user, name, value)
+
+    @cached_property
+    def user(self):
+        return get_cached_user(self.id)
+
+    @cached_property
+    def writable_user(self):
+        try:
+            user = User.objects.get(pk=self.id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        self.__dict__['user'] = user
+        return user
+
+    @cached_property
+    def is_active(self):
+        if ACTIVE_CLAIM in self.token:
+            return self.token[ACTIVE_CLAIM]
+        return self.user.is_active
+
+    @cached_property
+    def role(self):
+        if ROLE_CLAIM in self.token:
+            return self.token[ROLE_CLAIM]
+        return self.user.role
+
+    @cached_property
+    def customer_id(self):
+        if CUSTOMER_CLAIM in self.token:
+            return self.token[CUSTOMER_CLAIM]
+        return Customer.objects.filter(user_id=self.id).values_list('id', flat=True).first()
+
+    @cached_property
+    def restaurant_id(self):
+        if RESTAURANT_CLAIM in self.token:
+            return self.token[RESTAURANT_CLAIM]
+        return Restaurant.objects.filter(user_id=self.id).values_list('id', flat=True).first()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the per-request User query.
+
+    Tokens are rejected when they were logged out (see reservio.revocation)
+    or issued before the user's last revocation (see ``revoke_user_tokens``).
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if api_settings.USER_ID_CLAIM not in token:
+            raise InvalidToken('Token contained no recognizable user identification')
+        check_not_revoked(token)
+        return token
+
+    def get_user(self, validated_token):
+        user = ClaimsUser(validated_token)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+
+class ClaimsRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens that were logged out or revoked."""
+
+    def validate(self, attrs):
+        check_not_revoked(self.token_class(attrs['refresh']))
+        return super().validate(attrs)
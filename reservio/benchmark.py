@@ -0,0 +1,145 @@
+"""
+Helpers shared by the ``bench_*`` management commands: starting a server
+in a subprocess and putting HTTP load on it.
+"""
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'server did not start listening on port {port}')
+
+
+@contextmanager
+def run_server(args, port, env=None, quiet=True):
+    """
+    Run ``python -m <args>`` (e.g. gunicorn or uvicorn) until the block exits.
+    ``env`` is added to this process' environment, e.g. to change settings.
+    """
+    process = subprocess.Popen(
+        [sys.executable, '-m', *args], env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL if quiet else None, stderr=subprocess.DEVNULL if quiet else None)
+    try:
+        wait_for_port(port, process)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def gunicorn_args(port, workers, app='reservio.wsgi', threads=1):
+    return ['gunicorn', app, '--workers', str(workers), '--threads', str(threads), '--bind', f'127.0.0.1:{port}']
+
+
+def uvicorn_args(port, workers, app='reservio.asgi:application'):
+    return ['uvicorn', app, '--workers', str(workers), '--port', str(port), '--no-access-log', '--log-level', 'warning']
+
+
+def run_load(port, paths, requests, concurrency, headers=None, method='GET', body=None, collect=None,
+             max_seconds=None):
+    """
+    Send ``requests`` requests, cycling through ``paths``, from ``concurrency``
+    threads with one keep-alive connection each, stopping early after
+    ``max_seconds``. ``collect(response)`` is called with every successful
+    response. Returns the response times of the successful requests, the
+    number of failed ones and the wall time.
+    """
+    headers = {'Host': f'127.0.0.1:{port}', **(headers or {})}
+    if body is not None:
+        headers.setdefault('Content-Type', 'application/json')
+    counter = iter(range(requests))
+    lock = threading.Lock()
+    times = []
+    errors = [0]
+    deadline = time.perf_counter() + max_seconds if max_seconds else None
+
+    def worker():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None or (deadline and time.perf_counter() > deadline):
+                break
+            started = time.perf_counter()
+            try:
+                connection.request(method, paths[i % len(paths)], body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                if ok:
+                    times.append(elapsed)
+                    if collect:
+                        collect(response)
+                else:
+                    errors[0] += 1
+        connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return times, errors[0], time.perf_counter() - started
+
+
+def get_json(port, path, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        connection.request('GET', path, headers={'Host': f'127.0.0.1:{port}', **(headers or {})})
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f'GET {path} returned {response.status}')
+        return json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def summarize(times, errors, elapsed):
+    if not times:
+        return {'rps': 0, 'p50': None, 'p95': None, 'p99': None, 'errors': errors}
+    return {
+        'rps': len(times) / elapsed,
+        'p50': statistics.median(times) * 1000,
+        'p95': percentile(times, 95) * 1000,
+        'p99': percentile(times, 99) * 1000,
+        'errors': errors,
+    }
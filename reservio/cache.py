@@ -0,0 +1,25 @@
+"""
+Cache backends that count hits and misses of ``get()`` in
+reservio.metrics, labelled by key prefix.
+"""
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+
+from reservio.metrics import record_cache
+
+MISSING = object()
+
+
+class CacheMetricsMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, MISSING, version)
+        record_cache(key, value is not MISSING)
+        return default if value is MISSING else value
+
+
+class LocMemCache(CacheMetricsMixin, BaseLocMemCache):
+    pass
+
+
+class RedisCache(CacheMetricsMixin, BaseRedisCache):
+    pass
@@ -0,0 +1,196 @@
+"""
+Response compression, and a response cache that keeps compressed copies.
+
+``CompressionMiddleware`` sends a response Brotli or gzip compressed when the
+client accepts it (Brotli first), it is at least COMPRESSION_MIN_SIZE bytes
+and of a type worth compressing. Live compression uses fast settings.
+Responses to requests with credentials (an Authorization header or a logged
+in session) are sent as they are: their size would let BREACH recover the
+secrets in them.
+
+``cache_response`` caches what a list view returns to anonymous users and
+compresses it, with stronger settings, once when it is stored: a response
+served from the cache carries its compressed copies in ``precompressed`` and
+the middleware sends one of those instead of compressing again. Saving or
+deleting the models behind a namespace (see apps.restaurant.signals) calls
+``invalidate``, which moves the namespace to keys no entry is stored under
+once the transaction commits. The cache is only on by default with a shared
+CACHE_URL, so that reaches every worker.
+
+CPU time spent compressing and bytes before and after, live and from the
+cache, are counted in reservio.metrics.
+"""
+import gzip
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from reservio.metrics import record_compression
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = re.compile(r'^(text/|application/(json|msgpack|javascript|xml)|.*\+(json|xml))')
+
+
+def brotli_compress(content, quality):
+    return brotli.compress(content, quality=quality)
+
+
+def gzip_compress(content, level):
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def encoders(cached=False):
+    """Encoding -> function compressing bytes, in order of preference."""
+    found = {}
+    if brotli is not None:
+        quality = settings.COMPRESSION_CACHED_BROTLI_QUALITY if cached else settings.COMPRESSION_BROTLI_QUALITY
+        found['br'] = lambda content: brotli_compress(content, quality)
+    level = settings.COMPRESSION_CACHED_GZIP_LEVEL if cached else settings.COMPRESSION_GZIP_LEVEL
+    found['gzip'] = lambda content: gzip_compress(content, level)
+    return found
+
+
+def accepted_encoding(request, available):
+    """The encoding of ``available`` with the highest q in Accept-Encoding, earlier ones on a tie."""
+    weights = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compressible(response):
+    return (not response.streaming and response.status_code == 200 and not response.has_header('Content-Encoding')
+            and len(response.content) >= settings.COMPRESSION_MIN_SIZE
+            and COMPRESSIBLE_TYPES.match(response.get('Content-Type', '')) is not None)
+
+
+def has_credentials(request):
+    user = getattr(request, 'user', None)
+    return 'Authorization' in request.headers or (user is not None and user.is_authenticated)
+
+
+def compress(content, encoding, encoder, source):
+    started = time.thread_time()
+    compressed = encoder(content)
+    record_compression(encoding, source, len(content), len(compressed), time.thread_time() - started)
+    return compressed
+
+
+class CompressionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not settings.COMPRESSION_ENABLED or not compressible(response) or has_credentials(request):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        live = encoders()
+        encoding = accepted_encoding(request, live)
+        if encoding is None:
+            return response
+        content = response.content
+        precompressed = getattr(response, 'precompressed', {})
+        if encoding in precompressed:
+            compressed = precompressed[encoding]
+            record_compression(encoding, 'cache', len(content), len(compressed), 0.0)
+        else:
+            compressed = compress(content, encoding, live[encoding], 'live')
+        if len(compressed) >= len(content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed bytes differ, as Django's GZipMiddleware does
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+        return response
+
+
+def generation_key(namespace):
+    return f'response-generation:{namespace}'
+
+
+def invalidate(*namespaces):
+    def new_generation():
+        for namespace in namespaces:
+            cache.set(generation_key(namespace), time.time_ns(), None)
+
+    # Not before: a request in between would store the old rows under the new generation
+    transaction.on_commit(new_generation)
+
+
+def entry_key(namespace, request):
+    key = generation_key(namespace)
+    # Without one (never invalidated, or evicted) start a new generation, so
+    # nothing stored under an older one can come back
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    digest = hashlib.md5(
+        f'{generation}|{request.build_absolute_uri()}|{request.accepted_media_type}'.encode()).hexdigest()
+    return f'response:{namespace}:{digest}'
+
+
+def precompress(response):
+    if not compressible(response):
+        return {}
+    return {encoding: compress(response.content, encoding, encoder, 'cache-fill')
+            for encoding, encoder in encoders(cached=True).items()}
+
+
+def cache_response(namespace):
+    """
+    Caches the responses of a DRF view method for anonymous GET requests, per
+    URL and negotiated media type, for RESPONSE_CACHE_TIMEOUT seconds or until
+    ``invalidate(namespace)``.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if not settings.RESPONSE_CACHE_TIMEOUT or request.method != 'GET' or request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+            key = entry_key(namespace, request)
+            entry = cache.get(key)
+            if entry is not None:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response.precompressed = entry['precompressed']
+                return response
+            response = method(self, request, *args, **kwargs)
+
+            def store(response):
+                if response.status_code != 200:
+                    return
+                response.precompressed = precompress(response)
+                cache.set(key, {
+                    'content': response.content, 'content_type': response['Content-Type'],
+                    'precompressed': response.precompressed,
+                }, settings.RESPONSE_CACHE_TIMEOUT)
+            response.add_post_render_callback(store)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,100 @@
+"""
+Database backends that count how connections are opened, reused and closed.
+
+``reservio.db.postgresql`` and ``reservio.db.sqlite3`` are Django's own
+backends plus ``ConnectionMetricsMixin``. settings.py switches to them
+automatically, ``connection_stats()`` returns the numbers for this process.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections
+
+from reservio.slowqueries import log_slow_query
+
+
+class ConnectionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.reused = 0
+            self.connects = 0
+            self.closes = 0
+            self.connect_seconds = 0.0
+            self.connect_seconds_max = 0.0
+
+    def connected(self, seconds):
+        with self.lock:
+            self.connects += 1
+            self.connect_seconds += seconds
+            self.connect_seconds_max = max(self.connect_seconds_max, seconds)
+
+    def closed(self):
+        with self.lock:
+            self.closes += 1
+
+    def request(self, reused):
+        with self.lock:
+            self.requests += 1
+            self.reused += reused
+
+
+stats = ConnectionStats()
+
+
+class ConnectionMetricsMixin:
+    """
+    Times every connect. Without a pool that is the TCP/TLS/auth handshake,
+    with the native pool it is the wait for a free connection. Also sends
+    every query through the slow-query log when SLOW_QUERY_MS is set.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if settings.SLOW_QUERY_MS:
+            self.execute_wrappers.append(log_slow_query)
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        stats.connected(time.perf_counter() - started)
+
+    def _close(self):
+        if self.connection is not None:
+            stats.closed()
+        return super()._close()
+
+
+def count_request(**kwargs):
+    # Connected after Django's close_old_connections, so a connection that is
+    # still open here is reused by this request.
+    connection = connections['default']
+    stats.request(connection.connection is not None)
+
+
+request_started.connect(count_request)
+
+
+def connection_stats():
+    """Counters of this process, plus psycopg_pool's own for a native pool."""
+    with stats.lock:
+        data = {
+            'pid': os.getpid(),
+            'requests': stats.requests,
+            'requests_reusing_connection': stats.reused,
+            'connects': stats.connects,
+            'closes': stats.closes,
+            'connect_ms_total': round(stats.connect_seconds * 1000, 3),
+            'connect_ms_max': round(stats.connect_seconds_max * 1000, 3),
+        }
+    pool = getattr(connections['default'], 'pool', None)
+    if pool is not None:
+        data['pool'] = pool.get_stats()
+    return data
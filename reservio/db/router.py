@@ -0,0 +1,155 @@
+"""
+Read replicas.
+
+settings.DATABASE_REPLICAS names the aliases of read-only copies of
+'default'. ``ReplicaRouter`` sends writes to 'default' and the reads of
+safe (GET, HEAD, OPTIONS) requests to a healthy replica. Reads go to
+'default' as well
+
+- outside requests (management commands, shells),
+- in requests with an unsafe method, and in any request once it has written,
+- inside a transaction on 'default',
+- for DATABASE_REPLICA_PIN_SECONDS after the client wrote, so it reads its
+  own writes: ``ReplicaRoutingMiddleware`` pins it with a cookie and, for
+  token clients without cookies, by its Authorization header in the cache
+  (shared by the workers only with CACHE_URL),
+- when no replica is healthy. Each replica is checked at most every
+  DATABASE_REPLICA_CHECK_INTERVAL seconds and skipped while it can't be
+  reached or is more than DATABASE_REPLICA_MAX_LAG seconds behind.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+
+from reservio.querycount import current_request
+
+logger = logging.getLogger('reservio.db')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'db_pin'
+
+# Seconds since the last replayed transaction, or 0 when the replica has
+# replayed everything it received (an idle primary is not lag).
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def replica_lag(connection):
+    if connection.vendor != 'postgresql':
+        # SQLite has no replication: a local "replica" is the same file.
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(POSTGRES_LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+class ReplicaHealth:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {}
+
+    def check(self, alias):
+        try:
+            lag = replica_lag(connections[alias])
+            error = None
+        except DatabaseError as e:
+            lag, error = None, str(e)
+        healthy = error is None and lag <= settings.DATABASE_REPLICA_MAX_LAG
+        if not healthy:
+            logger.warning('Replica %s skipped: %s', alias, error or f'{lag:.1f}s behind')
+        status = {'healthy': healthy, 'lag': lag, 'error': error, 'checked': time.monotonic()}
+        with self.lock:
+            self.status[alias] = status
+        return status
+
+    def is_healthy(self, alias):
+        with self.lock:
+            status = self.status.get(alias)
+        if status is None or time.monotonic() - status['checked'] > settings.DATABASE_REPLICA_CHECK_INTERVAL:
+            status = self.check(alias)
+        return status['healthy']
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                alias: {'healthy': status['healthy'], 'lag': status['lag'], 'error': status['error']}
+                for alias, status in self.status.items()
+            }
+
+
+replica_health = ReplicaHealth()
+
+
+def pin_key(request):
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return None
+    return 'db:pin:' + hashlib.sha256(authorization.encode()).hexdigest()[:32]
+
+
+def is_pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+def pin(request, response):
+    seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    key = pin_key(request)
+    if key is not None:
+        cache.set(key, 1, seconds)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        request = current_request.get()
+        if (not settings.DATABASE_REPLICAS or request is None or getattr(request, 'db_use_primary', True)
+                or connections['default'].in_atomic_block):
+            return 'default'
+        replicas = [alias for alias in settings.DATABASE_REPLICAS if replica_health.is_healthy(alias)]
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        request = current_request.get()
+        if request is not None:
+            # Its later reads must see this write.
+            request.db_use_primary = True
+            request.db_wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as 'default'
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """Goes after QueryCountMiddleware, which makes the request visible to the router."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.db_use_primary = request.method not in SAFE_METHODS or is_pinned(request)
+        request.db_wrote = False
+        response = self.get_response(request)
+        if request.db_wrote:
+            pin(request, response)
+        return response
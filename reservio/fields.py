@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from rest_framework import serializers
+
+from apps.core.models import ChunkedUpload
+
+
+class StreamedImageField(serializers.FileField):
+    """
+    Image field that only reads the image header.
+
+    DRF's ImageField runs Pillow's ``verify()``, which reads the whole file a
+    second time after it was uploaded. Here only the format and dimensions
+    are checked, which Pillow gets from the first few bytes.
+
+    Besides a multipart file, the id of a complete ChunkedUpload (see
+    api/uploads/) of the request's user is accepted, so large photos can be
+    uploaded resumably. Validation only checks it; the serializer needs
+    ChunkedUploadsMixin, which uses the upload up on save.
+    """
+    default_error_messages = {
+        'invalid_image': 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.',
+        'unsupported_format': 'Unsupported image format {format}.',
+        'too_many_pixels': 'Image is too large ({width}x{height}).',
+        'invalid_upload': 'Upload {upload} does not exist or is not complete.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            return self.validate_chunked_upload(data)
+        file = super().to_internal_value(data)
+        self.validate_header(file)
+        return file
+
+    def validate_chunked_upload(self, upload_id):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            self.fail('invalid_upload', upload=upload_id)
+        try:
+            upload = ChunkedUpload.objects.get(id=upload_id, user_id=user.pk)
+            file = open(upload.path, 'rb')
+        except (ChunkedUpload.DoesNotExist, DjangoValidationError, FileNotFoundError):
+            self.fail('invalid_upload', upload=upload_id)
+        with file:
+            if not upload.complete:
+                self.fail('invalid_upload', upload=upload_id)
+            self.validate_header(super().to_internal_value(File(file, name=upload.filename)))
+        return upload
+
+    def validate_header(self, file):
+        # Pillow is only needed on upload, workers boot without it.
+        from PIL import Image, UnidentifiedImageError
+
+        try:
+            file.seek(0)
+            # Image.open is lazy: it parses the header but decodes no pixels.
+            with Image.open(file) as image:
+                image_format, (width, height) = image.format, image.size
+        except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            file.seek(0)
+        if image_format not in settings.IMAGE_UPLOAD_FORMATS:
+            self.fail('unsupported_format', format=image_format)
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail('too_many_pixels', width=width, height=height)
+
+
+class ChunkedUploadsMixin:
+    """
+    Serializer mixin that swaps the ChunkedUploads its StreamedImageFields
+    validated for their files on save, using the uploads up. Until then a
+    failed validation leaves them in place for the client to retry.
+    """
+
+    def save(self, **kwargs):
+        for name, value in list(self.validated_data.items()):
+            if isinstance(value, ChunkedUpload):
+                try:
+                    self.validated_data[name] = value.take()
+                except ChunkedUpload.DoesNotExist:
+                    message = self.fields[name].error_messages['invalid_upload'].format(upload=value.pk)
+                    raise serializers.ValidationError({name: [message]})
+        return super().save(**kwargs)
@@ -0,0 +1,61 @@
+"""
+Email goes out in the background.
+
+With EMAIL_QUEUE on, ``QueuedEmailBackend`` is the EMAIL_BACKEND: every
+message sent with Django's mail functions, djoser's and templated-mail's
+included, is stored as an ``apps.core.tasks.send_email`` task instead of
+being sent during the request. ``manage.py run_tasks`` sends them in batches
+through EMAIL_DELIVERY_BACKEND. Error mails to ADMINS bypass the queue (see
+LOGGING in settings).
+"""
+import base64
+from email.mime.base import MIMEBase
+
+from django.core.mail import EmailMessage, EmailMultiAlternatives
+from django.core.mail.backends.base import BaseEmailBackend
+
+
+def message_to_dict(message):
+    data = {
+        # Lazy translations are not JSON serializable
+        'subject': str(message.subject),
+        'body': str(message.body),
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'content_subtype': message.content_subtype,
+        'alternatives': [[str(content), mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+        'attachments': [],
+    }
+    for attachment in message.attachments:
+        if isinstance(attachment, MIMEBase):
+            raise ValueError('Attachments given as MIME parts cannot be queued')
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        data['attachments'].append([filename, base64.b64encode(content).decode(), mimetype])
+    return data
+
+
+def message_from_dict(data):
+    message = EmailMultiAlternatives(
+        subject=data['subject'], body=data['body'], from_email=data['from_email'], to=data['to'], cc=data['cc'],
+        bcc=data['bcc'], reply_to=data['reply_to'], headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']])
+    message.content_subtype = data['content_subtype']
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        from apps.core.tasks import send_email
+
+        messages = [message for message in email_messages if isinstance(message, EmailMessage)
+                    and message.recipients()]
+        send_email.enqueue_many({'message': message_to_dict(message)} for message in messages)
+        return len(messages)
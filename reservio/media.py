@@ -0,0 +1,186 @@
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+# photo.<short hash>.png from earlier releases or
+# cas/ab/cd/<sha256>.png from ContentAddressedStorage
+HASH_LENGTH = 12
+HASHED_NAME_RE = re.compile(r'(?:^|[./])([0-9a-f]{%d}|[0-9a-f]{64})\.[^./]+$' % HASH_LENGTH)
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+class RangeFile:
+    """
+    File wrapper that stops reading after ``length`` bytes.
+
+    ``fileno`` is kept so gunicorn can still use ``sendfile`` from the
+    current offset, bounded by the response Content-Length.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def get_etag(path, statobj):
+    match = HASHED_NAME_RE.search(path)
+    if match:
+        return f'"{match.group(1)}"'
+    return f'"{statobj.st_mtime_ns:x}-{statobj.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Return ``(start, end)`` (inclusive) for a single ``bytes=`` range,
+    ``None`` when the header should be ignored, or raise ValueError when the
+    range can't be satisfied. Multi-range requests are ignored and the whole
+    file is served, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError
+    return start, min(end, size - 1)
+
+
+def set_cache_headers(response, path, etag, statobj):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(statobj.st_mtime)
+    response.headers['Accept-Ranges'] = 'bytes'
+    if HASHED_NAME_RE.search(path):
+        response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response.headers['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def not_modified(request, etag, statobj):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(statobj.st_mtime) <= if_modified_since
+
+
+def offload_response(path, content_type):
+    """
+    Let the front web server send the bytes. Range and conditional requests
+    are handled by nginx/Apache themselves, so only the headers are set here.
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE_BACKEND == 'x-accel-redirect':
+        response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+    else:
+        response.headers['X-Sendfile'] = safe_join(settings.MEDIA_ROOT, path)
+    return response
+
+
+def check_media_backend(app_configs, **kwargs):
+    if settings.DEBUG or settings.MEDIA_SENDFILE_BACKEND:
+        return []
+    return [checks.Warning(
+        'MEDIA_SENDFILE_BACKEND is not set, so media is not served while DEBUG is off.',
+        hint="Set it to 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd).",
+        id='reservio.W001')]
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with caching, conditional and range support.
+
+    Outside DEBUG only through MEDIA_SENDFILE_BACKEND: workers must not
+    stream the bytes themselves in production.
+    """
+    if not settings.DEBUG and not settings.MEDIA_SENDFILE_BACKEND:
+        raise Http404('File not found.')
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('File not found.')
+    try:
+        statobj = fullpath.stat()
+    except OSError:
+        raise Http404('File not found.')
+    if not fullpath.is_file():
+        raise Http404('File not found.')
+
+    etag = get_etag(path, statobj)
+    content_type = mimetypes.guess_type(str(fullpath))[0] or 'application/octet-stream'
+
+    if not_modified(request, etag, statobj):
+        response = HttpResponseNotModified()
+        set_cache_headers(response, path, etag, statobj)
+        return response
+
+    if settings.MEDIA_SENDFILE_BACKEND:
+        response = offload_response(path, content_type)
+        set_cache_headers(response, path, etag, statobj)
+        return response
+
+    size = statobj.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+            set_cache_headers(response, path, etag, statobj)
+            return response
+
+    file = fullpath.open('rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    set_cache_headers(response, path, etag, statobj)
+    return response
+
+
+def media_urlpatterns():
+    prefix = re.escape(settings.MEDIA_URL.lstrip('/'))
+    return [re_path(r'^%s(?P<path>.*)$' % prefix, serve_media, name='media')]
@@ -0,0 +1,115 @@
+"""
+Prometheus metrics, served at /metrics.
+
+Under gunicorn every worker writes its samples to files in
+PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py) and /metrics adds
+them up, so any worker answers for all of them. Without that variable
+(runserver, tests) the numbers are those of the current process.
+"""
+import os
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, \
+    generate_latest, multiprocess
+
+DB_QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100, 250, 1000, float('inf'))
+
+request_duration = Histogram(
+    'reservio_http_request_duration_seconds', 'Time to respond to a request.', ['view', 'action', 'method'])
+responses = Counter(
+    'reservio_http_responses_total', 'Responses by status code.', ['view', 'action', 'method', 'status'])
+in_progress = Gauge(
+    'reservio_http_requests_in_progress', 'Requests being handled right now.', multiprocess_mode='livesum')
+db_queries = Histogram(
+    'reservio_db_queries_per_request', 'Database queries run by a request.', ['view', 'action'],
+    buckets=DB_QUERY_BUCKETS)
+db_time = Histogram(
+    'reservio_db_time_per_request_seconds', 'Time a request spent in database queries.', ['view', 'action'])
+cache_requests = Counter(
+    'reservio_cache_requests_total', 'Cache reads by key prefix, hit or miss.', ['prefix', 'result'])
+# Source is 'live', 'cache-fill' (compressed for the response cache) or 'cache' (sent from it)
+compression_input = Counter(
+    'reservio_compression_input_bytes_total', 'Response bytes before compression.', ['encoding', 'source'])
+compression_output = Counter(
+    'reservio_compression_output_bytes_total', 'Response bytes after compression.', ['encoding', 'source'])
+compression_cpu = Counter(
+    'reservio_compression_cpu_seconds_total', 'CPU time spent compressing responses.', ['encoding', 'source'])
+
+
+def view_labels(request):
+    """The DRF view class (or view function) and action that handled the request."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', ''
+    func = match.func
+    view = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    name = view.__name__ if view else func.__name__
+    actions = getattr(func, 'actions', None)
+    action = actions.get(request.method.lower(), '') if actions else request.method.lower()
+    return name, action
+
+
+def record_cache(key, hit):
+    # Keys look like 'auth:user:42'; label by everything but the last part.
+    prefix = key.rsplit(':', 1)[0] if ':' in key else 'other'
+    cache_requests.labels(prefix, 'hit' if hit else 'miss').inc()
+
+
+def record_compression(encoding, source, size, compressed_size, cpu):
+    compression_input.labels(encoding, source).inc(size)
+    compression_output.labels(encoding, source).inc(compressed_size)
+    compression_cpu.labels(encoding, source).inc(cpu)
+
+
+class MetricsMiddleware:
+    """Goes before QueryCountMiddleware, which leaves its QueryRecorder on the request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        in_progress.inc()
+        try:
+            response = self.get_response(request)
+        finally:
+            in_progress.dec()
+        self.record(request, response, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, duration):
+        view, action = view_labels(request)
+        request_duration.labels(view, action, request.method).observe(duration)
+        responses.labels(view, action, request.method, response.status_code).inc()
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            db_queries.labels(view, action).observe(recorder.count)
+            db_time.labels(view, action).observe(recorder.duration)
+
+
+def check_metrics_token(app_configs, **kwargs):
+    if settings.DEBUG or settings.METRICS_TOKEN:
+        return []
+    return [checks.Warning(
+        'METRICS_TOKEN is not set, so /metrics is refused while DEBUG is off.',
+        hint="Set it and scrape with 'Authorization: Bearer <METRICS_TOKEN>'.",
+        id='reservio.W002')]
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # Open without a token only in DEBUG: paths, timings and counts are not public
+    if not token and not settings.DEBUG:
+        return HttpResponseForbidden()
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
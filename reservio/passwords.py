@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, login, user_logged_in, user_login_failed
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.core.cache import cache
+from rest_framework.exceptions import Throttled
+
+from reservio.authentication import user_cache_key
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = None
+
+
+def get_executor():
+    """
+    Password hashing runs on a small shared pool, so a burst of logins can't
+    take every CPU (or every gthread worker thread) away from other requests.
+    """
+    global _executor, _pending
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _pending = threading.BoundedSemaphore(settings.PASSWORD_HASHING_QUEUE_SIZE)
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS, thread_name_prefix='password-hashing')
+    return _executor
+
+
+def run_hashing(func, *args):
+    executor = get_executor()
+    if not _pending.acquire(blocking=False):
+        raise Throttled(detail='Too many logins in progress, try again shortly.')
+    try:
+        future = executor.submit(func, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    # The slot is held until the hashing is done, not just until this request
+    # stops waiting for it, so timed out logins still count against the queue.
+    future.add_done_callback(lambda future: _pending.release())
+    try:
+        return future.result(timeout=settings.PASSWORD_HASHING_TIMEOUT)
+    except TimeoutError:
+        future.cancel()
+        raise Throttled(detail='Too many logins in progress, try again shortly.')
+
+
+def needs_upgrade(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != get_hasher('default').algorithm or hasher.must_update(encoded)
+
+
+def authenticate_user(request, username, password):
+    """
+    Equivalent of ``authenticate()`` with ModelBackend, with the hashing
+    done on the bounded pool. Database access stays on the request thread.
+
+    Hashes made with an outdated algorithm or iteration count are upgraded
+    with a plain UPDATE, so it doesn't count as a password change (which
+    would revoke the user's tokens).
+    """
+    user_model = get_user_model()
+    try:
+        user = user_model._default_manager.get_by_natural_key(username)
+    except user_model.DoesNotExist:
+        # Hash anyway so response time doesn't reveal which usernames exist.
+        run_hashing(make_password, password)
+        user = None
+
+    if user is None or not run_hashing(check_password, password, user.password) or not user.is_active:
+        user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+        return None
+
+    if needs_upgrade(user.password):
+        user.password = run_hashing(make_password, password)
+        user_model._default_manager.filter(pk=user.pk).update(password=user.password)
+        cache.delete(user_cache_key(user.pk))
+    return user
+
+
+def log_in(request, user):
+    """
+    Finish a login. Without LOGIN_CREATE_SESSION no session row is written,
+    the client only uses the JWT it gets back.
+    """
+    if settings.LOGIN_CREATE_SESSION:
+        user.backend = 'django.contrib.auth.backends.ModelBackend'
+        login(request, user)
+    else:
+        user_logged_in.send(sender=user.__class__, request=request, user=user)
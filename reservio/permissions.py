@@ -1,6 +1,7 @@
 from rest_framework.permissions import BasePermission
 
 from apps.core.models import User
+from apps.restaurant.models import Restaurant
 
 
 class CanViewRestaurant(BasePermission):
@@ -51,6 +52,23 @@ class RestaurantPermissions(permissions.BasePermission):
 
 
 
+class IsRestaurantOwner(permissions.BasePermission):
+    """
+    Allows admins, and the restaurant user owning the restaurant in the URL.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user.is_authenticated or user.role not in [User.ROLE.ADMIN, User.ROLE.RESTAURANT]:
+            return False
+        if user.role == User.ROLE.ADMIN:
+            return True
+        if hasattr(user, 'restaurant_id'):
+            # Token users carry it as a claim
+            return user.restaurant_id == view.kwargs['restaurant_id']
+        return Restaurant.objects.filter(id=view.kwargs['restaurant_id'], user_id=user.id).exists()
+
+
 class CanManageReservations(permissions.BasePermission):
     """
     Custom permission to allow only customers to create, update, and delete reservations.
@@ -0,0 +1,167 @@
+"""
+On-demand profiling of single requests.
+
+Off by default: ProfilingMiddleware removes itself unless
+PROFILE_SAMPLE_RATE > 0 or PROFILE_HEADER_ENABLED. Then it profiles that
+fraction of requests, and any request with an ``X-Profile`` header holding
+a token from ``manage.py profile_token``.
+
+PROFILE_MODE 'sample' takes a stack sample of the request thread every
+PROFILE_INTERVAL seconds and saves the stacks in folded format (one
+``frame;frame;frame count`` line per stack) that flamegraph.pl, speedscope
+and similar tools read. 'cprofile' saves cProfile stats instead; it profiles
+one request at a time per process and marks others X-Profile-Skipped. Admins
+download the files from api/profiles/.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+TOKEN_SALT = 'reservio.profiling'
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.(folded|pstats)$')
+
+# Python 3.12+ allows one active cProfile per process
+cprofile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign('profile')
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples the stack of one thread from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    def __init__(self):
+        import cProfile
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        if not cprofile_lock.acquire(blocking=False):
+            raise ProfilerBusy
+        try:
+            self.profile.enable()
+        except BaseException:
+            cprofile_lock.release()
+            raise
+
+    def stop(self):
+        self.profile.disable()
+        cprofile_lock.release()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+
+def list_profiles():
+    try:
+        names = [name for name in os.listdir(settings.PROFILE_DIR) if PROFILE_NAME_RE.match(name)]
+    except FileNotFoundError:
+        return []
+    return sorted(names, reverse=True)
+
+
+def prune_profiles():
+    for name in list_profiles()[settings.PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not settings.PROFILE_SAMPLE_RATE and not settings.PROFILE_HEADER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+
+    def should_profile(self, request):
+        if settings.PROFILE_HEADER_ENABLED and 'X-Profile' in request.headers:
+            return valid_token(request.headers['X-Profile'])
+        return random.random() < settings.PROFILE_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        if settings.PROFILE_MODE == 'cprofile':
+            profiler, extension = CProfiler(), 'pstats'
+        else:
+            profiler, extension = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL), 'folded'
+        try:
+            profiler.start()
+        except ProfilerBusy:
+            response = self.get_response(request)
+            response['X-Profile-Skipped'] = 'Another request in this worker is being profiled'
+            return response
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        duration = int((time.perf_counter() - started) * 1000)
+
+        match = getattr(request, 'resolver_match', None)
+        view = re.sub(r'[^\w-]', '_', match.view_name if match and match.view_name else 'unresolved')
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{view}-{duration}ms-{uuid.uuid4().hex[:8]}.{extension}"
+        profiler.save(os.path.join(settings.PROFILE_DIR, name))
+        prune_profiles()
+        response['X-Profile-Id'] = name
+        return response
@@ -0,0 +1,144 @@
+"""
+Query count and DB time per view.
+
+``QueryCountMiddleware`` records every query a request runs, keeps totals
+per URL name and logs requests that go over their budget in
+settings.QUERY_BUDGETS, or that repeat the same query (the usual sign of an
+N+1). Queries run from other threads, like those of the async views, are
+not seen.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('reservio.queries')
+
+# The request being handled, for code that only sees the query (reservio.slowqueries)
+current_request = contextvars.ContextVar('current_request', default=None)
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """The query without its values, so the same query with other ids matches."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = NUMBER_RE.sub('N', sql)
+    return WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that records each query and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context['connection'].alias, sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def duplicates(self):
+        """Fingerprints run more than once, with how often, most repeated first."""
+        counts = Counter(fingerprint(sql) for _, sql, _ in self.queries)
+        return [(sql, count) for sql, count in counts.most_common() if count > 1]
+
+
+@contextmanager
+def record_queries():
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+def get_budget(name):
+    return settings.QUERY_BUDGETS.get(name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def add(self, name, recorder, over_budget, duplicates):
+        with self.lock:
+            endpoint = self.endpoints.setdefault(name, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_ms': 0.0, 'over_budget': 0, 'with_duplicates': 0})
+            endpoint['requests'] += 1
+            endpoint['queries'] += recorder.count
+            endpoint['max_queries'] = max(endpoint['max_queries'], recorder.count)
+            endpoint['db_ms'] += recorder.duration * 1000
+            endpoint['over_budget'] += over_budget
+            endpoint['with_duplicates'] += bool(duplicates)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {**endpoint, 'db_ms': round(endpoint['db_ms'], 3), 'budget': get_budget(name)}
+                for name, endpoint in self.endpoints.items()
+            }
+
+
+endpoint_stats = EndpointStats()
+
+
+class QueryCountMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_request.set(request)
+        try:
+            with record_queries() as recorder:
+                request.query_recorder = recorder
+                response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+
+        name = view_name(request)
+        if name is None:
+            return response
+        budget = get_budget(name)
+        over_budget = budget is not None and recorder.count > budget
+        duplicates = recorder.duplicates()
+        endpoint_stats.add(name, recorder, over_budget, duplicates)
+
+        if over_budget:
+            logger.warning('%s %s ran %d queries (budget %d) in %.1fms',
+                           request.method, name, recorder.count, budget, recorder.duration * 1000,
+                           extra={'duplicates': duplicates})
+        if duplicates:
+            logger.info('%s %s repeated %d queries, e.g. %dx %s', request.method, name,
+                        len(duplicates), duplicates[0][1], duplicates[0][0])
+
+        if settings.QUERY_COUNT_HEADERS:
+            response['X-DB-Queries'] = str(recorder.count)
+            response['X-DB-Time'] = f'{recorder.duration * 1000:.1f}ms'
+        return response
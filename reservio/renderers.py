@@ -0,0 +1,77 @@
+"""
+Renderers and parsers for the API (see REST_FRAMEWORK in settings).
+
+``ORJSONRenderer`` writes the same JSON as DRF's JSONRenderer with the
+default UNICODE_JSON and COMPACT_JSON, using orjson: dicts, lists, strings,
+numbers, dates, times, datetimes and UUIDs are encoded natively, and the rest
+(Decimal, lazy strings, querysets...) goes through DRF's encoder. Only floats
+of 1e16 and up (``1e16`` instead of ``1e+16``) come out differently. When
+orjson cannot encode the data, e.g. integers over 64 bits, or an indent is
+asked for (the browsable API), DRF's renderer does it instead.
+
+``MessagePackRenderer`` and ``MessagePackParser`` serve clients that send
+``Accept: application/msgpack`` (or ``?format=msgpack``) and post
+``Content-Type: application/msgpack``. The values are those of the JSON
+output: dates and times are ISO strings and decimals floats.
+"""
+import datetime
+import decimal
+
+import msgpack
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+encoder = JSONEncoder()
+
+
+def default(obj):
+    # The common cases first; DRF's encoder tries a dozen isinstance checks
+    kind = type(obj)
+    if kind is decimal.Decimal:
+        return float(obj)
+    if kind is datetime.date or kind is datetime.time and obj.utcoffset() is None:
+        return obj.isoformat()
+    return encoder.default(obj)
+
+
+class ORJSONRenderer(JSONRenderer):
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Like DRF, so the output is a strict javascript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=default)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
@@ -0,0 +1,142 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from apps.core.models import RevokedToken
+
+# Rows committed slightly out of order are still picked up by re-reading
+# this much overlap on every refresh.
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+# token_type of the rows revoking every token issued to a user before the
+# row's created_at, see ``revoke_user``.
+USER_TOKEN_TYPE = 'user'
+
+
+def user_jti(user_id):
+    return f'user:{user_id}'
+
+
+class RevocationList:
+    """
+    In-process copy of the RevokedToken table: logged out jtis, and users
+    whose tokens issued before a given time are revoked.
+
+    Checking a token is a dict lookup. The table is only queried every
+    TOKEN_REVOCATION_REFRESH_INTERVAL seconds, and then only for rows added
+    since the last refresh, so a request with a valid token costs no query.
+    Tokens revoked by another worker are rejected here at most one interval
+    later; tokens revoked by this worker immediately.
+    """
+
+    def __init__(self):
+        self.expires = {}
+        self.users = {}
+        # Reentrant: refresh() adds rows while holding it
+        self.lock = threading.RLock()
+        self.loaded_until = None
+        self.next_refresh = 0
+
+    def refresh(self):
+        now = time.monotonic()
+        if now < self.next_refresh:
+            return
+        with self.lock:
+            if now < self.next_refresh:
+                return
+            started = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=started)
+            if self.loaded_until is not None:
+                rows = rows.filter(created_at__gte=self.loaded_until - REFRESH_OVERLAP)
+            for jti, token_type, created_at, expires_at in rows.values_list(
+                    'jti', 'token_type', 'created_at', 'expires_at').iterator():
+                if token_type == USER_TOKEN_TYPE:
+                    self.add_user(jti, created_at, expires_at)
+                else:
+                    self.expires[jti] = expires_at.timestamp()
+            self.prune()
+            self.loaded_until = started
+            self.next_refresh = now + settings.TOKEN_REVOCATION_REFRESH_INTERVAL
+
+    def prune(self):
+        now = time.time()
+        for jti in [jti for jti, expires in list(self.expires.items()) if expires <= now]:
+            del self.expires[jti]
+        for jti in [jti for jti, (_, expires) in list(self.users.items()) if expires <= now]:
+            del self.users[jti]
+
+    def add(self, jti, expires_at):
+        with self.lock:
+            self.expires[jti] = expires_at.timestamp()
+
+    def add_user(self, jti, revoked_at, expires_at):
+        with self.lock:
+            revoked_at = revoked_at.timestamp()
+            if jti in self.users:
+                revoked_at = max(revoked_at, self.users[jti][0])
+            self.users[jti] = (revoked_at, expires_at.timestamp())
+
+    def user_revoked_at(self, user_id):
+        """Timestamp before which the user's tokens are revoked, or None."""
+        self.refresh()
+        revoked_at, expires = self.users.get(user_jti(user_id), (None, 0))
+        return revoked_at if expires > time.time() else None
+
+    def __contains__(self, jti):
+        self.refresh()
+        expires = self.expires.get(jti)
+        return expires is not None and expires > time.time()
+
+    def clear(self):
+        with self.lock:
+            self.expires = {}
+            self.users = {}
+            self.loaded_until = None
+            self.next_refresh = 0
+
+
+revoked_tokens = RevocationList()
+
+
+def is_revoked(token):
+    if token.get(api_settings.JTI_CLAIM) in revoked_tokens:
+        return True
+    revoked_at = revoked_tokens.user_revoked_at(token[api_settings.USER_ID_CLAIM])
+    # iat has whole seconds, so a token issued in the same second as the
+    # revocation is kept: logging in again right after it must work.
+    return revoked_at is not None and token.get('iat', 0) < int(revoked_at)
+
+
+def revoke_token(token):
+    """
+    Store ``token``'s jti until the token expires. Expired rows are removed
+    at the same time, so the table only holds tokens that are still valid.
+    """
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+    RevokedToken.objects.get_or_create(
+        jti=token[api_settings.JTI_CLAIM],
+        defaults={
+            'token_type': token.get(api_settings.TOKEN_TYPE_CLAIM, ''),
+            'user_id': token.get(api_settings.USER_ID_CLAIM),
+            'expires_at': expires_at,
+        },
+    )
+    revoked_tokens.add(token[api_settings.JTI_CLAIM], expires_at)
+
+
+def revoke_user(user_id, lifetime):
+    """
+    Revoke every token issued to the user until now. The row is kept for
+    ``lifetime``, the longest a token issued before it stays valid.
+    """
+    now = timezone.now()
+    jti = user_jti(user_id)
+    RevokedToken.objects.update_or_create(
+        jti=jti, defaults={'token_type': USER_TOKEN_TYPE, 'created_at': now, 'expires_at': now + lifetime},
+    )
+    revoked_tokens.add_user(jti, now, now + lifetime)
@@ -9,15 +9,15 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+import importlib.util
 import os
-import sys
+import tempfile
 import environ
 import dj_database_url
 from datetime import timedelta
 from pathlib import Path
 
-import corsheaders.middleware
-from dotenv import load_dotenv
+from django.core.exceptions import ImproperlyConfigured
 
 env = environ.Env(
     DEBUG=(bool, False)
@@ -26,13 +26,13 @@ env = environ.Env(
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Once, here: it also fills os.environ for code that reads it directly
 environ.Env.read_env(os.path.join(BASE_DIR, '.env'))
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-load_dotenv()
 SECRET_KEY = os.environ['SECRET_KEY']
 
 # SECURITY WARNING: don't run with debug turned on in production!
@@ -40,12 +40,9 @@ DEBUG = env('DEBUG')
 
 ALLOWED_HOSTS = ['127.0.0.1', 'bisp-reservation.onrender.com']
 
-sys.path.insert(0, os.path.join(BASE_DIR, 'apps'))
-
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -56,18 +53,19 @@ INSTALLED_APPS = [
     'djoser',
     'corsheaders',
     'rest_framework',
-    'debug_toolbar',
     'whitenoise',
 
     'apps.restaurant',
     'apps.tags',
     'apps.core',
-
-    'dynamic_raw_id',
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'reservio.profiling.ProfilingMiddleware',
+    'reservio.metrics.MetricsMiddleware',
+    'reservio.querycount.QueryCountMiddleware',
+    'reservio.db.router.ReplicaRoutingMiddleware',
+    'reservio.compression.CompressionMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -79,12 +77,99 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Most queries a request to each view (by URL name) should run; requests over
+# budget are logged by QueryCountMiddleware and fail QueryBudgetMixin tests.
+QUERY_BUDGETS = {
+    'restaurants-list': 6,
+    'restaurants-detail': 6,
+    'cuisine-list': 4,
+    'restaurant-reviews': 6,
+    'menu-categories': 4,
+    'menu-items': 4,
+    'restaurant-tables': 4,
+    'restaurant-stats': 4,
+    'restaurant-reservations': 2,
+    'my-reservations': 2,
+    # Not counting the export query itself, which runs while the file streams
+    'restaurant-reservations-export': 2,
+}
+QUERY_BUDGET_DEFAULT = None
+
+# Add X-DB-Queries and X-DB-Time headers to every response
+QUERY_COUNT_HEADERS = env.bool('QUERY_COUNT_HEADERS', default=DEBUG)
+
+# Serve the hot list endpoints with the row serializers of
+# apps.restaurant.fastserializers instead of the DRF ones (same output)
+FAST_SERIALIZERS = env.bool('FAST_SERIALIZERS', default=True)
+
+# Queries slower than this (ms) go to the slow-query log, 0 turns it off
+SLOW_QUERY_MS = env.int('SLOW_QUERY_MS', default=500)
+SLOW_QUERY_LOG = env('SLOW_QUERY_LOG', default=os.path.join(tempfile.gettempdir(), 'reservio-slow-queries.log'))
+# Log the plan of slow reads, each fingerprint at most once per interval (s)
+SLOW_QUERY_EXPLAIN = env.bool('SLOW_QUERY_EXPLAIN', default=True)
+SLOW_QUERY_EXPLAIN_ANALYZE = env.bool('SLOW_QUERY_EXPLAIN_ANALYZE', default=False)
+SLOW_QUERY_EXPLAIN_INTERVAL = env.int('SLOW_QUERY_EXPLAIN_INTERVAL', default=60)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'formatter': 'message',
+        },
+    },
+    'loggers': {
+        'reservio.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# When set, /metrics requires 'Authorization: Bearer <METRICS_TOKEN>'. Without
+# it /metrics is only served in DEBUG.
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
 INTERNAL_IPS = [
     # ...
     "127.0.0.1",
     # ...
 ]
 
+# Only in development: the toolbar instruments every request
+DEBUG_TOOLBAR = env.bool('DEBUG_TOOLBAR', default=DEBUG)
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(0, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Workers that only serve the API can leave the admin out: its apps, the
+# ModelAdmin modules and their imports are then never loaded.
+ADMIN_ENABLED = env.bool('ADMIN_ENABLED', default=True)
+if ADMIN_ENABLED:
+    INSTALLED_APPS.insert(0, 'django.contrib.admin')
+    INSTALLED_APPS.append('dynamic_raw_id')
+
+# Request profiling (reservio.profiling), off by default. Profiles this
+# fraction of requests, and with PROFILE_HEADER_ENABLED any request whose
+# X-Profile header holds a token from `manage.py profile_token`.
+PROFILE_SAMPLE_RATE = env.float('PROFILE_SAMPLE_RATE', default=0.0)
+PROFILE_HEADER_ENABLED = env.bool('PROFILE_HEADER_ENABLED', default=False)
+PROFILE_TOKEN_MAX_AGE = env.int('PROFILE_TOKEN_MAX_AGE', default=3600)
+# 'sample' (stack samples every PROFILE_INTERVAL seconds) or 'cprofile'
+PROFILE_MODE = env('PROFILE_MODE', default='sample')
+PROFILE_INTERVAL = env.float('PROFILE_INTERVAL', default=0.005)
+PROFILE_DIR = env('PROFILE_DIR', default=os.path.join(tempfile.gettempdir(), 'reservio-profiles'))
+# Older profiles are deleted
+PROFILE_MAX_FILES = env.int('PROFILE_MAX_FILES', default=200)
+
 ROOT_URLCONF = 'reservio.urls'
 
 TEMPLATES = [
@@ -105,6 +190,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'reservio.wsgi.application'
 
+# Build URL resolvers and caches when the application loads (reservio.warmup),
+# not on the first requests
+WARMUP = env.bool('WARMUP', default=True)
+
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
@@ -120,6 +209,87 @@ DATABASES = {
     # }
 }
 
+# Count connects and reuse (see reservio.db), on top of Django's own backends
+if DATABASES['default']['ENGINE'] in ('django.db.backends.postgresql', 'django.db.backends.sqlite3'):
+    DATABASES['default']['ENGINE'] = DATABASES['default']['ENGINE'].replace('django.db.backends.', 'reservio.db.')
+
+# How connections are kept between requests:
+#  'off'        - a new connection for every request
+#  'persistent' - keep each thread's connection for DATABASE_CONN_MAX_AGE seconds,
+#                 checking it is still alive before reusing it
+#  'native'     - Django's Postgres connection pool (needs psycopg[pool])
+DATABASE_POOL = env('DATABASE_POOL', default='persistent')
+if DATABASE_POOL == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DATABASE_CONN_MAX_AGE', default=600)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DATABASE_POOL == 'native':
+    # Django only pools with psycopg 3; with just psycopg2 installed the pool
+    # option would be ignored, or fail on the first connection
+    if (DATABASES['default']['ENGINE'] != 'reservio.db.postgresql'
+            or importlib.util.find_spec('psycopg_pool') is None):
+        raise ImproperlyConfigured("DATABASE_POOL='native' needs a Postgres DATABASE and psycopg[pool] installed")
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    # The pool belongs to one worker process: size it to the worker's threads,
+    # the server then holds at most workers * max_size connections.
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DATABASE_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DATABASE_POOL_MAX_SIZE', default=4),
+        # seconds to wait for a free connection before failing the request
+        'timeout': env.int('DATABASE_POOL_TIMEOUT', default=10),
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Read-only copies of the database as URLs, e.g. postgres://...?connect_timeout=2.
+# They become aliases replica1, replica2... and reservio.db.router sends
+# reads to them. To try it locally, point one at the same SQLite file.
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    replica = dj_database_url.parse(url)
+    replica['ENGINE'] = replica['ENGINE'].replace('django.db.backends.', 'reservio.db.')
+    for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS'):
+        if key in DATABASES['default']:
+            replica[key] = DATABASES['default'][key]
+    if 'pool' in DATABASES['default'].get('OPTIONS', {}):
+        replica.setdefault('OPTIONS', {})['pool'] = dict(DATABASES['default']['OPTIONS']['pool'])
+    # Tests read the test database through the replica aliases
+    replica['TEST'] = {'MIRROR': 'default'}
+    DATABASES[f'replica{number}'] = replica
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['reservio.db.router.ReplicaRouter']
+# After writing, a client reads from 'default' for this many seconds
+DATABASE_REPLICA_PIN_SECONDS = env.int('DATABASE_REPLICA_PIN_SECONDS', default=15)
+# Replicas further behind (s) are skipped; each is checked at most this often (s)
+DATABASE_REPLICA_MAX_LAG = env.float('DATABASE_REPLICA_MAX_LAG', default=5.0)
+DATABASE_REPLICA_CHECK_INTERVAL = env.float('DATABASE_REPLICA_CHECK_INTERVAL', default=5.0)
+
+# Local memory by default; set CACHE_URL=redis://... to share the cache
+# between workers. Both count hits and misses for /metrics.
+CACHE_URL = env('CACHE_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'reservio.cache.RedisCache', 'LOCATION': CACHE_URL,
+    } if CACHE_URL else {
+        'BACKEND': 'reservio.cache.LocMemCache',
+    },
+}
+
+# Brotli or gzip responses of at least COMPRESSION_MIN_SIZE bytes
+# (reservio.compression). Live compression is kept cheap; the copies kept
+# with cached responses are compressed harder, once per cache fill.
+COMPRESSION_ENABLED = env.bool('COMPRESSION_ENABLED', default=True)
+COMPRESSION_MIN_SIZE = env.int('COMPRESSION_MIN_SIZE', default=1024)
+COMPRESSION_BROTLI_QUALITY = env.int('COMPRESSION_BROTLI_QUALITY', default=4)
+COMPRESSION_GZIP_LEVEL = env.int('COMPRESSION_GZIP_LEVEL', default=6)
+COMPRESSION_CACHED_BROTLI_QUALITY = env.int('COMPRESSION_CACHED_BROTLI_QUALITY', default=9)
+COMPRESSION_CACHED_GZIP_LEVEL = env.int('COMPRESSION_CACHED_GZIP_LEVEL', default=9)
+# Anonymous restaurant and menu lists are cached this long (s); 0 turns it off.
+# Off by default without CACHE_URL: a write only invalidates its own worker's
+# local memory cache.
+RESPONSE_CACHE_TIMEOUT = env.int('RESPONSE_CACHE_TIMEOUT', default=300 if CACHE_URL else 0)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -157,9 +327,18 @@ STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'reservio.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 if not DEBUG:
     STATIC_ROOT = os.path.join(BASE_DIR, 'static')
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+    STORAGES['staticfiles']['BACKEND'] = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -169,19 +348,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media is served by reservio.media.serve_media. In production set this to
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache/lighttpd) so the front
+# server streams the bytes and workers only produce headers; without it media
+# is only served when DEBUG is on.
+MEDIA_SENDFILE_BACKEND = env('MEDIA_SENDFILE_BACKEND', default=None)
+# nginx `internal` location aliased to MEDIA_ROOT
+MEDIA_ACCEL_REDIRECT_PREFIX = env('MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+# Cache lifetime for media without a content hash in its name (older uploads)
+MEDIA_CACHE_MAX_AGE = env.int('MEDIA_CACHE_MAX_AGE', default=60 * 60)
+
 REST_FRAMEWORK = {
+    # JSON unless the client asks for MessagePack; the browsable API only in development
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',
-    ],
+        'reservio.renderers.ORJSONRenderer',
+        'reservio.renderers.MessagePackRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
+        'reservio.renderers.MessagePackParser',
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'reservio.authentication.ClaimsJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated'
@@ -192,19 +383,114 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'TOKEN_TYPE_CLAIM': 'access',
+    'TOKEN_REFRESH_SERIALIZER': 'reservio.authentication.ClaimsRefreshSerializer',
     # 'AUTH_HEADER_TYPES': ('JWT',),
     # "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
 }
 
 AUTH_USER_MODEL = 'core.User'
 
+# How long reservio.authentication keeps a User row cached for attributes
+# that are not in the token claims (username, email, ...)
+AUTH_USER_CACHE_TTL = 60
+
+# LoginView hands out JWTs; only write a session row when this is on (e.g.
+# for clients that also use the browsable API)
+LOGIN_CREATE_SESSION = env.bool('LOGIN_CREATE_SESSION', default=False)
+
+# Workers pick up tokens logged out or revoked (role, password or is_active
+# changes) on other workers within this many seconds
+TOKEN_REVOCATION_REFRESH_INTERVAL = 5
+
+# Logins hash passwords on a shared pool of this many threads per worker.
+# When more than PASSWORD_HASHING_QUEUE_SIZE logins are waiting, or one waits
+# longer than PASSWORD_HASHING_TIMEOUT seconds, the login gets a 429.
+PASSWORD_HASHING_WORKERS = env.int('PASSWORD_HASHING_WORKERS', default=2)
+PASSWORD_HASHING_QUEUE_SIZE = env.int('PASSWORD_HASHING_QUEUE_SIZE', default=32)
+PASSWORD_HASHING_TIMEOUT = 10
+
 DJOSER = {
     'SERIALIZERS': {
-        'user_create': 'core.serializers.UserCreateSerializer',
-        'current_user': 'core.serializers.UserSerializer'
+        'user_create': 'apps.core.serializers.UserCreateSerializer',
+        'current_user': 'apps.core.serializers.UserSerializer'
     }
 }
 
-DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10MB, adjust as needed
+# Mail goes out through EMAIL_DELIVERY_BACKEND. With EMAIL_QUEUE it is
+# stored as a task (reservio.mail) instead and sent in batches by
+# `manage.py run_tasks`, so no request waits for SMTP; nothing is delivered
+# while no worker runs. `manage.py smtp_stub` is a local server to send it to.
+EMAIL_QUEUE = env.bool('EMAIL_QUEUE', default=False)
+EMAIL_DELIVERY_BACKEND = env('EMAIL_DELIVERY_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_BACKEND = 'reservio.mail.QueuedEmailBackend' if EMAIL_QUEUE else EMAIL_DELIVERY_BACKEND
+EMAIL_HOST = env('EMAIL_HOST', default='localhost')
+EMAIL_PORT = env.int('EMAIL_PORT', default=25)
+EMAIL_HOST_USER = env('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=False)
+EMAIL_TIMEOUT = 10
+DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default='Reservio <noreply@bisp-reservation.onrender.com>')
+
+# Error mails to ADMINS are sent directly, they matter most when the task
+# worker is down. Otherwise the same as Django's default 'django' logger.
+LOGGING['filters'] = {
+    'require_debug_false': {'()': 'django.utils.log.RequireDebugFalse'},
+    'require_debug_true': {'()': 'django.utils.log.RequireDebugTrue'},
+}
+LOGGING['handlers'].update({
+    'console': {
+        'level': 'INFO',
+        'filters': ['require_debug_true'],
+        'class': 'logging.StreamHandler',
+    },
+    'mail_admins': {
+        'level': 'ERROR',
+        'filters': ['require_debug_false'],
+        'class': 'django.utils.log.AdminEmailHandler',
+        'email_backend': EMAIL_DELIVERY_BACKEND,
+    },
+})
+LOGGING['loggers']['django'] = {
+    'handlers': ['console', 'mail_admins'],
+    'level': 'INFO',
+}
+
+# Background tasks (reservio.tasks). Failed tasks are retried after
+# TASK_RETRY_DELAY, doubling with every attempt up to TASK_RETRY_MAX_DELAY (s).
+TASK_RETRY_DELAY = env.int('TASK_RETRY_DELAY', default=10)
+TASK_RETRY_MAX_DELAY = env.int('TASK_RETRY_MAX_DELAY', default=3600)
+# Tasks still running this long (s) after they were claimed are taken to be
+# lost with their worker and run again
+TASK_LOCK_TIMEOUT = env.int('TASK_LOCK_TIMEOUT', default=600)
+TASK_CLAIM_SIZE = env.int('TASK_CLAIM_SIZE', default=100)
+TASK_POLL_INTERVAL = env.float('TASK_POLL_INTERVAL', default=1.0)
+
+# Reservation reminders (apps.restaurant.reminders): reminders claimed per
+# round, threads sending them, and how long a claim lasts (s) before another
+# sender may take over
+REMINDER_BATCH_SIZE = env.int('REMINDER_BATCH_SIZE', default=500)
+REMINDER_CONCURRENCY = env.int('REMINDER_CONCURRENCY', default=8)
+REMINDER_LOCK_TIMEOUT = env.int('REMINDER_LOCK_TIMEOUT', default=300)
+REMINDER_MAX_ATTEMPTS = env.int('REMINDER_MAX_ATTEMPTS', default=5)
+# Delay (s) before the first retry, doubling with every attempt
+REMINDER_RETRY_DELAY = env.int('REMINDER_RETRY_DELAY', default=60)
+
+# Non-file form data only. Files never count towards this limit.
+DATA_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB
+
+# Spool every uploaded file to disk in 64KB chunks so the memory used by an
+# upload doesn't grow with the file size.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Resumable uploads (POST/PUT api/uploads/), see apps.core.views.ChunkedUploadView
+CHUNKED_UPLOAD_DIR = env('CHUNKED_UPLOAD_DIR', default=os.path.join(tempfile.gettempdir(), 'reservio-uploads'))
+CHUNKED_UPLOAD_MAX_SIZE = 50 * 1024 * 1024
+# Uploads a user may have open (not yet attached) at once
+CHUNKED_UPLOAD_MAX_PENDING = env.int('CHUNKED_UPLOAD_MAX_PENDING', default=10)
+
+IMAGE_UPLOAD_FORMATS = ['JPEG', 'PNG', 'WEBP', 'GIF']
+IMAGE_UPLOAD_MAX_PIXELS = 40_000_000
 
 CORS_ALLOW_ALL_ORIGINS = True
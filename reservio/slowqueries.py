@@ -0,0 +1,131 @@
+"""
+Slow-query log.
+
+Every connection made through the reservio.db backends runs its queries
+through ``log_slow_query``. Queries slower than SLOW_QUERY_MS are written
+as JSON lines to the 'reservio.slow_queries' logger (a rotating file, see
+LOGGING) with their fingerprint, the view and the line of project code
+that ran them, and the database's plan for the query. ``manage.py
+slow_queries`` summarizes the log.
+"""
+import json
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from reservio.querycount import current_request, fingerprint
+
+logger = logging.getLogger('reservio.slow_queries')
+
+# Frames from these files are skipped when looking for the code that ran a query
+INTERNAL_FILES = ('reservio/slowqueries.py', 'reservio/querycount.py', 'reservio/db/')
+
+# Row locks taken by a SELECT, which EXPLAIN ANALYZE would take again
+LOCKING_CLAUSE = re.compile(r'\bFOR\s+(UPDATE|SHARE|NO\s+KEY\s+UPDATE|KEY\s+SHARE)\b', re.IGNORECASE)
+
+# Fingerprints explained recently (see should_explain), the oldest dropped first
+MAX_EXPLAINED_FINGERPRINTS = 1000
+
+local = threading.local()
+last_explained = OrderedDict()
+last_explained_lock = threading.Lock()
+
+
+def call_site():
+    """The innermost frame of project code (not Django, not this module)."""
+    base_dir = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        filename = frame.filename
+        if filename.startswith(base_dir) and 'site-packages' not in filename \
+                and not any(part in filename for part in INTERNAL_FILES):
+            return f'{filename[len(base_dir) + 1:]}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def should_explain(sql, key):
+    if not settings.SLOW_QUERY_EXPLAIN:
+        return False
+    # Only reads; a plain EXPLAIN doesn't run them, see analyzable() for ANALYZE.
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return False
+    # Once per fingerprint per interval, so a flood of slow queries isn't doubled.
+    now = time.monotonic()
+    with last_explained_lock:
+        if now - last_explained.get(key, -settings.SLOW_QUERY_EXPLAIN_INTERVAL) < settings.SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        last_explained[key] = now
+        last_explained.move_to_end(key)
+        while len(last_explained) > MAX_EXPLAINED_FINGERPRINTS:
+            last_explained.popitem(last=False)
+    return True
+
+
+def analyzable(sql):
+    """A SELECT that neither writes (WITH ... INSERT) nor locks rows, so running it again is harmless."""
+    return sql.lstrip().upper().startswith('SELECT') and LOCKING_CLAUSE.search(sql) is None
+
+
+def explain(connection, sql, params):
+    options = {'analyze': True} if settings.SLOW_QUERY_EXPLAIN_ANALYZE and analyzable(sql) else {}
+    try:
+        prefix = connection.ops.explain_query_prefix(**options)
+    except ValueError:
+        # The backend has no ANALYZE
+        prefix = connection.ops.explain_query_prefix()
+    local.explaining = True
+    try:
+        # In a savepoint that is always rolled back: a failing EXPLAIN must not
+        # abort the request's transaction, and nothing ANALYZE ran is kept.
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'{prefix} {sql}', params)
+                plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+            transaction.set_rollback(True, using=connection.alias)
+        return plan
+    except Exception as e:
+        return f'EXPLAIN failed: {e}'
+    finally:
+        local.explaining = False
+
+
+def log_slow_query(execute, sql, params, many, context):
+    if getattr(local, 'explaining', False):
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    if duration * 1000 < settings.SLOW_QUERY_MS:
+        return result
+
+    connection = context['connection']
+    key = fingerprint(sql)
+    entry = {
+        'time': timezone.now().isoformat(),
+        'duration_ms': round(duration * 1000, 3),
+        'alias': connection.alias,
+        'fingerprint': key,
+        'sql': sql,
+        'many': many,
+        'view': None,
+        'path': None,
+        'site': call_site(),
+        'plan': None,
+    }
+    request = current_request.get()
+    if request is not None:
+        match = getattr(request, 'resolver_match', None)
+        entry['view'] = match.view_name or match._func_path if match else None
+        entry['path'] = request.path
+    # The query's own rows are still unread, so the plan comes from a second cursor.
+    if not many and should_explain(sql, key):
+        entry['plan'] = explain(connection, sql, params)
+    logger.warning(json.dumps(entry, default=str))
+    return result
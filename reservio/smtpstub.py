@@ -0,0 +1,101 @@
+"""
+A local SMTP server that accepts every message and keeps it in memory.
+
+Tests point EMAIL_HOST/EMAIL_PORT at it to check what the task worker
+really sends; ``manage.py smtp_stub`` runs one for development.
+"""
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.sessions += 1
+        self.reply('220 localhost SMTP stub')
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b'HELO', b'EHLO'):
+                self.reply('250 localhost')
+            elif command == b'MAIL':
+                sender, recipients = line[10:].strip().decode(), []
+                self.reply('250 OK')
+            elif command == b'RCPT':
+                recipients.append(line[8:].strip().decode())
+                self.reply('250 OK')
+            elif command == b'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                stub.received(sender, recipients, self.read_data())
+                self.reply('250 OK')
+            elif command in (b'RSET', b'NOOP'):
+                self.reply('250 OK')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+    def read_data(self):
+        lines = []
+        for line in self.rfile:
+            if line in (b'.\r\n', b'.\n'):
+                break
+            # Undo dot-stuffing
+            lines.append(line[1:] if line.startswith(b'..') else line)
+        return b''.join(lines)
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStub:
+    def __init__(self, host='127.0.0.1', port=0, on_message=None, delay=0):
+        self.server = SMTPServer((host, port), SMTPHandler)
+        self.server.stub = self
+        self.on_message = on_message
+        # Seconds to take over each message, like a real server would
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.messages = []
+        self.sessions = 0
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def received(self, sender, recipients, data):
+        if self.delay:
+            time.sleep(self.delay)
+        message = message_from_bytes(data, policy=policy.default)
+        with self.lock:
+            self.messages.append((sender, recipients, message))
+        if self.on_message:
+            self.on_message(sender, recipients, message)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='smtp-stub', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
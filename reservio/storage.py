@@ -0,0 +1,82 @@
+import hashlib
+import os
+import uuid
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload once, under ``cas/ab/cd/<sha256><ext>``.
+
+    The upload is hashed while it is copied to a temporary file, so the bytes
+    are read a single time and never held in memory as a whole. Identical
+    files uploaded for different restaurants or directories share one blob.
+    Each blob has a ``core.StoredFile`` row whose ``ref_count`` is kept up to
+    date by ``apps.core.signals``; ``manage.py gc_media`` removes blobs
+    nobody references any more, so ``delete()`` leaves the blob in place.
+    """
+    prefix = 'cas'
+
+    def blob_name(self, digest, ext):
+        return f'{self.prefix}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+    def save(self, name, content, max_length=None):
+        from apps.core.models import StoredFile
+
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        tmp_dir = self.path(f'{self.prefix}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = os.path.join(tmp_dir, uuid.uuid4().hex)
+        try:
+            with open(tmp_path, 'xb') as tmp:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+
+            name = self.blob_name(digest.hexdigest(), os.path.splitext(name)[1])
+            if max_length is not None and len(name) > max_length:
+                raise SuspiciousFileOperation(
+                    f'Storage name "{name}" is longer than {max_length} characters. Please make sure that '
+                    f'the corresponding file field allows sufficient "max_length".')
+            full_path = self.path(name)
+            # gc_media deletes blobs under the same row lock and skips those
+            # seen within its grace period, so the file found or written here
+            # stays until the model referencing it is saved
+            with transaction.atomic():
+                StoredFile.objects.touch(name, digest.hexdigest(), size)
+                if os.path.exists(full_path):
+                    os.unlink(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                    os.replace(tmp_path, full_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return name
+
+    def delete(self, name):
+        # Other rows may share the blob. The ref count drops when the row
+        # referencing it is saved without it (FieldFile.delete() saves by
+        # default), and gc_media purges the blob once nothing references it.
+        pass
+
+    def purge(self, name):
+        """Removes the blob's file. Only gc_media calls this, under the StoredFile row lock."""
+        super().delete(name)
@@ -0,0 +1,141 @@
+"""
+Background tasks, kept in the database (apps.core.models.Task).
+
+    @task()
+    def notify_reservation_status(reservation_id): ...
+
+    notify_reservation_status.enqueue(reservation_id=reservation.id)
+
+Tasks live in the ``tasks`` module of an app. ``manage.py run_tasks`` claims
+due tasks, runs them and deletes the ones that finished. A task that raises
+is retried after TASK_RETRY_DELAY * 2 ** (attempts - 1) seconds (at most
+TASK_RETRY_MAX_DELAY, with jitter) and marked failed after its last attempt.
+
+A task registered with ``batch_size`` is called with a list of the kwargs of
+up to that many claimed calls at once, e.g. to send many emails over one
+SMTP connection. It may return a list with an exception (or None) per call,
+so that only the calls that failed are retried.
+"""
+import logging
+import random
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from apps.core.models import Task
+
+logger = logging.getLogger('reservio.tasks')
+
+registry = {}
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_attempts, batch_size):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, delay=0, **kwargs):
+        """Stores the call to run in the background; kwargs must be JSON serializable."""
+        return Task.objects.create(name=self.name, kwargs=kwargs, max_attempts=self.max_attempts,
+                                   run_at=timezone.now() + timedelta(seconds=delay))
+
+    def enqueue_many(self, calls):
+        return Task.objects.bulk_create(
+            Task(name=self.name, kwargs=kwargs, max_attempts=self.max_attempts) for kwargs in calls)
+
+
+def task(name=None, max_attempts=5, batch_size=None):
+    def decorator(func):
+        function = TaskFunction(func, name or f'{func.__module__}.{func.__name__}', max_attempts, batch_size)
+        registry[function.name] = function
+        return function
+    return decorator
+
+
+def retry_delay(attempts):
+    delay = min(settings.TASK_RETRY_DELAY * 2 ** (attempts - 1), settings.TASK_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def release_stale():
+    """Tasks of workers that died while running them become due again."""
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_LOCK_TIMEOUT)
+    return Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff).update(status=Task.PENDING, locked_by='')
+
+
+def claim(worker, limit):
+    """Marks up to ``limit`` due tasks as running by ``worker`` and returns them."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at')
+        if connections['default'].features.has_select_for_update_skip_locked:
+            # Workers on Postgres pass over each other's rows instead of waiting
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:limit])
+        # The status filter keeps two workers from claiming the same task where
+        # there is no SKIP LOCKED (SQLite)
+        Task.objects.filter(id__in=ids, status=Task.PENDING).update(
+            status=Task.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1)
+    return list(Task.objects.filter(id__in=ids, status=Task.RUNNING, locked_by=worker).order_by('run_at', 'id'))
+
+
+def finish(tasks, errors):
+    done = [t.id for t, error in zip(tasks, errors) if error is None]
+    Task.objects.filter(id__in=done).delete()
+    retried = []
+    now = timezone.now()
+    for t, error in zip(tasks, errors):
+        if error is None:
+            continue
+        t.last_error = f'{type(error).__name__}: {error}'
+        t.locked_by = ''
+        if t.attempts >= t.max_attempts:
+            t.status = Task.FAILED
+            logger.error('Task %s %s failed after %d attempts: %s', t.id, t.name, t.attempts, t.last_error)
+        else:
+            t.status = Task.PENDING
+            t.run_at = now + retry_delay(t.attempts)
+            logger.warning('Task %s %s failed (attempt %d), retrying at %s: %s',
+                           t.id, t.name, t.attempts, t.run_at, t.last_error)
+        retried.append(t)
+    Task.objects.bulk_update(retried, ['status', 'run_at', 'last_error', 'locked_by'])
+    return len(done), len(retried)
+
+
+def call(function, tasks):
+    """Runs the calls in ``tasks``; returns an exception or None for each."""
+    if function is None:
+        return [LookupError('No such task')] * len(tasks)
+    try:
+        if function.batch_size:
+            errors = function.func([t.kwargs for t in tasks])
+            return list(errors) if errors is not None else [None] * len(tasks)
+        function.func(**tasks[0].kwargs)
+        return [None]
+    except Exception as e:
+        logger.exception('Task %s raised', function.name)
+        return [e] * len(tasks)
+
+
+def run(tasks):
+    """Runs claimed tasks, batching those that allow it; returns (done, failed)."""
+    done = failed = 0
+    for name, group in groupby(sorted(tasks, key=lambda t: t.name), key=lambda t: t.name):
+        group = list(group)
+        function = registry.get(name)
+        size = function.batch_size if function and function.batch_size else 1
+        for start in range(0, len(group), size):
+            chunk = group[start:start + size]
+            counts = finish(chunk, call(function, chunk))
+            done += counts[0]
+            failed += counts[1]
+    return done, failed
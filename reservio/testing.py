@@ -0,0 +1,28 @@
+from django.conf import settings
+
+from reservio.querycount import record_queries, view_name
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin for checking views against settings.QUERY_BUDGETS.
+
+    Seed enough rows that an N+1 would show, then call
+    ``assertWithinQueryBudget(path)`` for each endpoint.
+    """
+
+    def assertWithinQueryBudget(self, path, method='get', budget=None, **kwargs):
+        with record_queries() as recorder:
+            response = getattr(self.client, method)(path, **kwargs)
+        self.assertLess(response.status_code, 400, f'{method.upper()} {path} returned {response.status_code}')
+
+        name = view_name(response)
+        if budget is None:
+            budget = settings.QUERY_BUDGETS.get(name, settings.QUERY_BUDGET_DEFAULT)
+        if budget is None:
+            self.fail(f'No query budget for {name!r}, add it to QUERY_BUDGETS')
+        if recorder.count > budget:
+            repeated = '\n'.join(f'  {count}x {sql}' for sql, count in recorder.duplicates())
+            self.fail(f'{method.upper()} {path} ({name}) ran {recorder.count} queries, budget is {budget}'
+                      + (f'\nRepeated queries:\n{repeated}' if repeated else ''))
+        return response
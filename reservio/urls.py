@@ -14,21 +14,34 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
-from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
-import debug_toolbar
+from django.urls import path, include
 from djoser.views import TokenCreateView
 
-admin.site.site_header = 'Reservio admin panel'
+from apps.core.views import ChunkedUploadView, DatabaseStatsView, ProfileDownloadView, ProfileListView
+
+from reservio.media import media_urlpatterns
+from reservio.metrics import metrics_view
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('apps.restaurant.urls')),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')),
     path('api/token/', TokenCreateView.as_view(), name='token_create'),
-    path('__debug__/', include(debug_toolbar.urls)),
-    path('api/auth/', include('apps.core.urls'))
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('api/auth/', include('apps.core.urls')),
+    path('api/uploads/', ChunkedUploadView.as_view(), name='uploads'),
+    path('api/uploads/<uuid:pk>/', ChunkedUploadView.as_view(), name='upload'),
+    path('api/metrics/db/', DatabaseStatsView.as_view(), name='db-stats'),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/profiles/', ProfileListView.as_view(), name='profiles'),
+    path('api/profiles/<str:name>', ProfileDownloadView.as_view(), name='profile'),
+] + media_urlpatterns()
+
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+    admin.site.site_header = 'Reservio admin panel'
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
+
+if settings.DEBUG_TOOLBAR:
+    import debug_toolbar
+    urlpatterns.append(path('__debug__/', include(debug_toolbar.urls)))
@@ -0,0 +1,68 @@
+"""
+Work a worker would otherwise do on its first requests.
+
+``warm_up()`` runs from wsgi.py/asgi.py once the application is loaded. With
+gunicorn's preload_app (see gunicorn.conf.py) that is in the master, before
+forking, so every worker starts with the URL resolver built, the view and
+renderer modules imported and the model metadata cached, and shares those
+pages with the master instead of building its own copy.
+
+Nothing here opens a database connection, a socket or a thread: those must
+not cross a fork.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger('reservio.warmup')
+
+
+def url_views(resolver):
+    """The view callbacks of every pattern in the URLconf."""
+    for pattern in resolver.url_patterns:
+        if hasattr(pattern, 'url_patterns'):
+            yield from url_views(pattern)
+        else:
+            yield pattern.callback
+
+
+def warm_urls():
+    """Imports every view module and builds the reverse lookup tables."""
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return sum(1 for _ in url_views(resolver))
+
+
+def warm_drf():
+    # api_settings imports the classes it names on first access
+    for setting in ('DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES',
+                    'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS', 'DEFAULT_PAGINATION_CLASS',
+                    'DEFAULT_FILTER_BACKENDS', 'DEFAULT_METADATA_CLASS'):
+        getattr(api_settings, setting)
+
+
+def warm_models():
+    for model in apps.get_models():
+        # Caches the field list and relation tree of every model
+        model._meta.get_fields()
+        model._meta.concrete_fields
+        model._meta.related_objects
+
+
+def warm_up():
+    started = time.perf_counter()
+    views = warm_urls()
+    warm_drf()
+    warm_models()
+    get_hasher()
+    # Loads the message catalogs, which every request activates
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+    logger.info('Warmed up %d views and %d models in %.0fms',
+                views, len(apps.get_models()), (time.perf_counter() - started) * 1000)